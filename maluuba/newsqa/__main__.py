@@ -0,0 +1,243 @@
+"""
+The command line interface for building and using the dataset:
+
+    python -m maluuba.newsqa --help
+    python -m maluuba.newsqa build
+    python -m maluuba.newsqa tokenize --workers 4
+    python -m maluuba.newsqa split
+    python -m maluuba.newsqa simplify
+    python -m maluuba.newsqa stats --combined_data_path combined-newsqa-data-v1.csv
+    python -m maluuba.newsqa validate --combined_data_path combined-newsqa-data-v1.csv
+    python -m maluuba.newsqa export --output_path combined-newsqa-data-v1.jsonl.gz
+    python -m maluuba.newsqa serve --combined_data_path combined-newsqa-data-v1.csv --port 8765
+
+Modules are only imported by the commands that need them so that `--help` starts right away.
+"""
+from __future__ import print_function
+
+import argparse
+import logging
+import os
+import sys
+
+_dir_name = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_COMBINED_DATA_PATH = 'combined-newsqa-data-v1.csv'
+DEFAULT_TOKENIZED_DATA_PATH = os.path.join(_dir_name, 'newsqa-data-tokenized-v1.csv')
+
+
+def _load_combined(args):
+    from maluuba.newsqa.data_processing import NewsQaDataset
+    return NewsQaDataset(combined_data_path=args.combined_data_path,
+                         story_corpus_path=args.story_corpus_path)
+
+
+def _build(args):
+    from maluuba.newsqa.data_processing import NewsQaDataset
+    newsqa_dataset = NewsQaDataset(args.cnn_stories_path, args.dataset_path, lazy=args.lazy)
+    for path in args.output_paths:
+        newsqa_dataset.dump(path, args.split_dir_path, workers=args.workers,
+                            chunk_size=args.chunk_size)
+
+
+def _tokenize(args):
+    from maluuba.newsqa.tokenize_dataset import DEFAULT_UNPACK_CHUNK_SIZE, tokenize
+    tokenize(args.cnn_stories_path, args.dataset_path, args.combined_data_path,
+             args.output_path, cache_path=args.cache_path, workers=args.workers,
+             chunk_size=args.chunk_size or DEFAULT_UNPACK_CHUNK_SIZE,
+             shard_size=args.shard_size, work_dir_path=args.work_dir)
+
+
+def _split(args):
+    from maluuba.newsqa.split_dataset import split_data
+    split_data(args.dataset_path, args.output_dir_path, args.split_dir_path)
+
+
+def _simplify(args):
+    from maluuba.newsqa.simplify import simplify
+    simplify(args.output_dir_path)
+
+
+def _stats(args):
+    newsqa_dataset = _load_combined(args)
+    print("Questions: %d" % len(newsqa_dataset.dataset))
+    print("Stories: %d" % len(newsqa_dataset.story_index))
+    print("Questions without answers: %d" % len(newsqa_dataset.get_questions_without_answers()))
+    print("Average question length (words): %.2f"
+          % newsqa_dataset.get_question_lengths_words().mean())
+    print("Question types:")
+    print(newsqa_dataset.get_question_types(args.num_question_types).to_string(index=False))
+
+
+def _validate(args):
+    from maluuba.newsqa.validation import DEFAULT_SHARD_SIZE
+    report = _load_combined(args).validate(workers=args.workers,
+                                           shard_size=args.chunk_size or DEFAULT_SHARD_SIZE)
+    print(report.summary())
+    return 0 if report.is_valid else 1
+
+
+def _export(args):
+    path = args.output_path
+    uncompressed_path = path[:-len('.gz')] if path.endswith('.gz') else path
+    if args.shareable and uncompressed_path.endswith('.json'):
+        print("--shareable only supports .csv and .jsonl outputs.", file=sys.stderr)
+        return 2
+    newsqa_dataset = _load_combined(args)
+    # Check for the shareable data first so that the stories are never written.
+    if args.shareable:
+        newsqa_dataset.export_shareable(path, workers=args.workers, chunk_size=args.chunk_size)
+    elif uncompressed_path.endswith('.jsonl'):
+        newsqa_dataset.save_dataset_as_json_lines(path, chunk_size=args.chunk_size,
+                                                  workers=args.workers)
+    else:
+        newsqa_dataset.dump(path, args.split_dir_path, workers=args.workers,
+                            chunk_size=args.chunk_size)
+
+
+def _serve(args):
+    from maluuba.newsqa.server import DatasetServer
+    address = args.socket_path or (args.host, args.port)
+    server = DatasetServer(_load_combined(args), address, cache_size=args.cache_size,
+                           max_rows=args.max_rows)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+def _get_parser():
+    # Only for the commands that process rows in parallel.
+    parallel = argparse.ArgumentParser(add_help=False)
+    parallel.add_argument('--workers', type=int,
+                          help="(Optional) The number of processes or threads to use. "
+                               "Default: the number of CPUs.")
+    parallel.add_argument('--chunk_size', '--chunk-size', type=int,
+                          help="(Optional) The number of rows to process at a time.")
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--metrics_path',
+                        help="(Optional) The path to write the metrics for each stage to as JSON.")
+    common.add_argument('--profile_stages', nargs='*', default=[],
+                        help="(Optional) The names of the stages to profile with cProfile.")
+
+    combined = argparse.ArgumentParser(add_help=False)
+    combined.add_argument('--combined_data_path', default=DEFAULT_COMBINED_DATA_PATH,
+                          help="The path of the combined dataset. Default: %(default)s")
+    combined.add_argument('--story_corpus_path',
+                          help="(Optional) The path of a story corpus to get story texts from.")
+
+    stories = argparse.ArgumentParser(add_help=False)
+    stories.add_argument('--cnn_stories_path', default=os.path.join(_dir_name, 'cnn_stories.tgz'),
+                         help="The path to the CNN stories (cnn_stories.tgz).")
+    stories.add_argument('--dataset_path', default=os.path.join(_dir_name, 'newsqa-data-v1.csv'),
+                         help="The path to the dataset with questions and answers.")
+
+    split_dir = argparse.ArgumentParser(add_help=False)
+    split_dir.add_argument('--split_dir_path',
+                           help="(Optional) The folder with the story ID split files. "
+                                "Default: the split from the paper.")
+
+    parser = argparse.ArgumentParser(prog='python -m maluuba.newsqa',
+                                     description="Build and use the NewsQA dataset.")
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    p = subparsers.add_parser('build', parents=[common, parallel, stories, split_dir],
+                              help="Combine the questions with the stories.")
+    p.add_argument('--output_paths', nargs='+',
+                   default=['combined-newsqa-data-v1.json', DEFAULT_COMBINED_DATA_PATH],
+                   help="The paths to write the combined dataset to (.csv or .json, "
+                        "optionally .gz). Default: %(default)s")
+    p.add_argument('--lazy', action='store_true',
+                   help="Read each story only when it's written.")
+    p.set_defaults(run=_build)
+
+    p = subparsers.add_parser('tokenize', parents=[common, parallel, stories],
+                              help="Tokenize the combined dataset.")
+    p.add_argument('--combined_data_path', default=DEFAULT_COMBINED_DATA_PATH,
+                   help="The path of the combined dataset. Default: %(default)s")
+    p.add_argument('--output_path', default=DEFAULT_TOKENIZED_DATA_PATH,
+                   help="The path to write the tokenized dataset to. Default: %(default)s")
+    p.add_argument('--cache_path',
+                   help="(Optional) The path of a cache of tokenized lines to reuse across runs.")
+    p.add_argument('--shard_size', type=int, default=10000,
+                   help="The number of rows to tokenize at a time. A rerun resumes after the "
+                        "last shard that was done. Default: %(default)s")
+    p.add_argument('--work_dir',
+                   help="(Optional) The folder to write the packed files and the finished shards "
+                        "to. Defaults to the folder of the output.")
+    p.set_defaults(run=_tokenize)
+
+    p = subparsers.add_parser('split', parents=[common, split_dir],
+                              help="Split a dataset into train, dev and test.")
+    p.add_argument('--dataset_path', default=DEFAULT_TOKENIZED_DATA_PATH,
+                   help="The path of the dataset to split. Default: %(default)s")
+    p.add_argument('--output_dir_path', default='split_data',
+                   help="The folder to write the split data to. Default: %(default)s")
+    p.set_defaults(run=_split)
+
+    p = subparsers.add_parser('simplify', parents=[common],
+                              help="Only keep the story, question and answer in the split data.")
+    p.add_argument('--output_dir_path', default='split_data',
+                   help="The folder with the split data. Default: %(default)s")
+    p.set_defaults(run=_simplify)
+
+    p = subparsers.add_parser('stats', parents=[common, combined],
+                              help="Print statistics about the combined dataset.")
+    p.add_argument('--num_question_types', type=int, default=6,
+                   help="The number of most common question types to show.")
+    p.set_defaults(run=_stats)
+
+    p = subparsers.add_parser('validate', parents=[common, parallel, combined],
+                              help="Check the integrity of the combined dataset.")
+    p.set_defaults(run=_validate)
+
+    p = subparsers.add_parser('export', parents=[common, parallel, combined, split_dir],
+                              help="Write the combined dataset in another format.")
+    p.add_argument('--output_path', required=True,
+                   help="The path to write to: .csv, .json or .jsonl, optionally .gz.")
+    p.add_argument('--shareable', action='store_true',
+                   help="Leave out the story texts so that the data can be shared. "
+                        "Only for .csv and .jsonl outputs.")
+    p.set_defaults(run=_export)
+
+    p = subparsers.add_parser('serve', parents=[common, combined],
+                              help="Serve the combined dataset to other jobs on this host.")
+    p.add_argument('--host', default='127.0.0.1',
+                   help="The host to serve HTTP on. Default: %(default)s")
+    p.add_argument('--port', type=int, default=8765,
+                   help="The port to serve HTTP on. Default: %(default)s")
+    p.add_argument('--socket_path',
+                   help="(Optional) The path of a Unix socket to serve on instead of HTTP.")
+    p.add_argument('--cache_size', type=int, default=4096,
+                   help="The number of responses to keep. Default: %(default)s")
+    p.add_argument('--max_rows', type=int, default=1000,
+                   help="The maximum number of rows to send for one request. "
+                        "Default: %(default)s")
+    p.set_defaults(run=_serve)
+    return parser
+
+
+def main(argv=None):
+    """
+    :param argv: (Optional) The arguments. Defaults to the arguments of the program.
+    :return: The exit status.
+    :rtype: int
+    """
+    args = _get_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    from maluuba.newsqa.metrics import get_metrics
+    metrics = get_metrics()
+    metrics.profile_stages.update(args.profile_stages)
+    status = args.run(args)
+    if args.metrics_path:
+        metrics.dump(args.metrics_path)
+    return status or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
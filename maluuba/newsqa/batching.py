@@ -0,0 +1,197 @@
+"""
+Padded minibatches for training from the arrays written by `token_arrays.export_token_arrays`.
+
+Questions are grouped by the length of their story so that batches need little padding.
+Batches are filled by a pool of threads ahead of when they're needed
+(NumPy releases the GIL while copying).
+
+    from maluuba.newsqa.batching import BatchIterator
+
+    batches = BatchIterator('token_arrays/train', batch_size=32, seed=1)
+    for epoch in range(10):
+        for batch in batches.iterate(epoch):
+            train(batch.story_tokens, batch.question_tokens,
+                  batch.answer_starts, batch.answer_ends)
+"""
+import collections
+import multiprocessing
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import six
+
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    from maluuba.newsqa.token_arrays import PAD_ID, TokenArrays
+except:
+    # In case you're running this file from this folder.
+    from token_arrays import PAD_ID, TokenArrays
+
+Batch = namedtuple('Batch', ['question_indices',
+                             'story_tokens', 'story_lengths',
+                             'question_tokens', 'question_lengths',
+                             'answer_starts', 'answer_ends'])
+Batch.__doc__ = """
+A padded minibatch.
+
+`story_tokens` and `question_tokens` are 2D arrays of token IDs padded with `PAD_ID`.
+`answer_starts` and `answer_ends` are the first answer range of each question,
+they are -1 when there is no answer.
+"""
+
+
+class BatchIterator(object):
+    """
+    Iterates over padded minibatches of questions bucketed by story length.
+
+    Shuffling is deterministic for a seed and an epoch.
+    """
+
+    def __init__(self, token_arrays, batch_size=32, shuffle=True, seed=0, bucket_size=100,
+                 drop_last=False, max_story_length=None, workers=None, prefetch=None):
+        """
+        :param token_arrays: The `TokenArrays` or the folder with them.
+        :param batch_size: The number of questions in each batch.
+        :param shuffle: `False` to always give the batches in the same order.
+        :param seed: The seed for shuffling.
+        :param bucket_size: The number of batches of questions to sort by story length at once
+            when shuffling. Larger buckets need less padding but are less random.
+        :param drop_last: `True` to skip the last batch if it has fewer than `batch_size`
+            questions.
+        :param max_story_length: (Optional) The number of tokens to truncate stories to.
+        :param workers: (Optional) The number of threads filling batches.
+            Defaults to the number of CPUs up to 4.
+        :param prefetch: (Optional) The number of batches to fill ahead.
+            Defaults to `2 * workers`.
+        """
+        if isinstance(token_arrays, six.string_types):
+            token_arrays = TokenArrays(token_arrays)
+        self.token_arrays = token_arrays
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.bucket_size = bucket_size
+        self.drop_last = drop_last
+        self.max_story_length = max_story_length
+        self.workers = workers or min(4, multiprocessing.cpu_count())
+        self.prefetch = prefetch or 2 * self.workers
+        self._epoch = 0
+
+        story_offsets = np.asarray(token_arrays.story_offsets)
+        story_numbers = np.asarray(token_arrays.question_stories)
+        self._story_lengths = (story_offsets[1:] - story_offsets[:-1])[story_numbers]
+        if max_story_length is not None:
+            self._story_lengths = np.minimum(self._story_lengths, max_story_length)
+
+    def __len__(self):
+        num_questions = len(self._story_lengths)
+        if self.drop_last:
+            return num_questions // self.batch_size
+        return (num_questions + self.batch_size - 1) // self.batch_size
+
+    def get_batch_indices(self, epoch=0):
+        """
+        :param epoch: The epoch to shuffle for.
+        :return: The question indices of each batch.
+        :rtype: list
+        """
+        num_questions = len(self._story_lengths)
+        if self.shuffle:
+            rng = np.random.RandomState(self.seed + epoch)
+            order = rng.permutation(num_questions)
+            bucket_length = self.batch_size * self.bucket_size
+            buckets = []
+            for start in six.moves.range(0, num_questions, bucket_length):
+                bucket = order[start:start + bucket_length]
+                buckets.append(bucket[np.argsort(self._story_lengths[bucket], kind='mergesort')])
+            order = np.concatenate(buckets) if buckets else order
+        else:
+            order = np.argsort(self._story_lengths, kind='mergesort')
+
+        result = [order[start:start + self.batch_size]
+                  for start in six.moves.range(0, num_questions, self.batch_size)]
+        if self.drop_last and result and len(result[-1]) < self.batch_size:
+            result.pop()
+        if self.shuffle:
+            # Don't always start with the shortest stories.
+            rng.shuffle(result)
+        return result
+
+    def make_batch(self, question_indices):
+        """
+        :param question_indices: The questions in the batch.
+        :rtype: Batch
+        """
+        arrays = self.token_arrays
+        size = len(question_indices)
+        story_numbers = np.asarray(arrays.question_stories[question_indices])
+        story_lengths = self._story_lengths[question_indices]
+        question_offsets = arrays.question_offsets
+        question_starts = np.asarray(question_offsets[question_indices])
+        question_lengths = np.asarray(question_offsets[question_indices + 1]) - question_starts
+
+        story_tokens = np.full((size, story_lengths.max() if size else 0), PAD_ID,
+                               dtype=np.int32)
+        question_tokens = np.full((size, question_lengths.max() if size else 0), PAD_ID,
+                                  dtype=np.int32)
+        answer_starts = np.full(size, -1, dtype=np.int32)
+        answer_ends = np.full(size, -1, dtype=np.int32)
+        story_offsets = arrays.story_offsets
+        answer_offsets = arrays.answer_offsets
+        for row, (question_index, story_number) in enumerate(zip(question_indices,
+                                                                 story_numbers)):
+            story_start = story_offsets[story_number]
+            story_tokens[row, :story_lengths[row]] = \
+                arrays.story_tokens[story_start:story_start + story_lengths[row]]
+            question_tokens[row, :question_lengths[row]] = \
+                arrays.question_tokens[question_starts[row]:
+                                       question_starts[row] + question_lengths[row]]
+            answer_start = answer_offsets[question_index]
+            if answer_start < answer_offsets[question_index + 1]:
+                start, end = arrays.answers[answer_start]
+                # The answer might have been cut off by `max_story_length`.
+                if start < story_lengths[row]:
+                    answer_starts[row] = start
+                    answer_ends[row] = min(end, story_lengths[row])
+        return Batch(question_indices=question_indices,
+                     story_tokens=story_tokens, story_lengths=story_lengths,
+                     question_tokens=question_tokens, question_lengths=question_lengths,
+                     answer_starts=answer_starts, answer_ends=answer_ends)
+
+    def iterate(self, epoch=None):
+        """
+        :param epoch: (Optional) The epoch to shuffle for.
+            Defaults to one more than the last epoch iterated.
+        :return: The batches of an epoch.
+        """
+        if epoch is None:
+            epoch = self._epoch
+        self._epoch = epoch + 1
+        batch_indices = self.get_batch_indices(epoch)
+        if self.workers <= 1:
+            for question_indices in batch_indices:
+                yield self.make_batch(question_indices)
+            return
+
+        pool = ThreadPool(self.workers)
+        pending = collections.deque()
+        try:
+            batch_indices = iter(batch_indices)
+            for question_indices in batch_indices:
+                pending.append(pool.apply_async(self.make_batch, (question_indices,)))
+                if len(pending) >= self.prefetch:
+                    break
+            while pending:
+                result = pending.popleft().get()
+                for question_indices in batch_indices:
+                    pending.append(pool.apply_async(self.make_batch, (question_indices,)))
+                    break
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def __iter__(self):
+        return self.iterate()
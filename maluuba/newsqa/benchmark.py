@@ -0,0 +1,465 @@
+"""
+Benchmarks for the stages of building and using the dataset.
+
+The benchmarks run on synthetic data (see `synthetic_data`) so they don't need the real dataset.
+The time and peak memory of each benchmark are written to a JSON file so that results can be
+compared across commits:
+
+    python -m maluuba.newsqa.benchmark --scale 1 --output_path before.json
+    # Make changes.
+    python -m maluuba.newsqa.benchmark --scale 1 --output_path after.json --compare before.json
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import timeit
+from collections import OrderedDict
+
+import six
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2.
+    tracemalloc = None
+
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    from maluuba.newsqa import span_utils, synthetic_data
+    from maluuba.newsqa.batching import BatchIterator
+    from maluuba.newsqa.consensus import compute_consensus
+    from maluuba.newsqa.data_processing import NewsQaDataset, _get_logger
+    from maluuba.newsqa.metrics import get_max_rss
+    from maluuba.newsqa.search_index import get_terms
+    from maluuba.newsqa.split_dataset import split_data
+    from maluuba.newsqa.token_arrays import TokenArrays, export_token_arrays
+    from maluuba.newsqa.tokenize_dataset import format, pack, unpack
+except:
+    # In case you're running this file from this folder.
+    import span_utils
+    import synthetic_data
+    from batching import BatchIterator
+    from consensus import compute_consensus
+    from data_processing import NewsQaDataset, _get_logger
+    from metrics import get_max_rss
+    from search_index import get_terms
+    from split_dataset import split_data
+    from token_arrays import TokenArrays, export_token_arrays
+    from tokenize_dataset import format, pack, unpack
+
+logger = logging.getLogger('newsqa')
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name, setup=None):
+    """
+    Register a benchmark.
+
+    :param name: The name of the benchmark.
+    :param setup: (Optional) A function given the `BenchmarkContext` that is run before timing.
+        What it returns is passed to the benchmark.
+    """
+
+    def _register(f):
+        BENCHMARKS[name] = (setup, f)
+        return f
+
+    return _register
+
+
+class BenchmarkContext(object):
+    """
+    The data for the benchmarks. Derived data is made on first use, outside of the timings.
+    """
+
+    def __init__(self, data_dir_path, work_dir_path):
+        self.data_dir_path = data_dir_path
+        self.work_dir_path = work_dir_path
+        self.cnn_stories_path = os.path.join(data_dir_path, 'cnn_stories.tgz')
+        self.dataset_path = os.path.join(data_dir_path, 'newsqa-data-v1.csv')
+        self.split_dir_path = data_dir_path
+        self._newsqa_dataset = None
+        self._combined_data_path = None
+        self._tokenized_packed_path = None
+        self._tokenized_data_path = None
+
+    def get_path(self, name):
+        return os.path.join(self.work_dir_path, name)
+
+    @property
+    def newsqa_dataset(self):
+        if self._newsqa_dataset is None:
+            self._newsqa_dataset = NewsQaDataset(self.cnn_stories_path, self.dataset_path)
+        return self._newsqa_dataset
+
+    @property
+    def combined_data_path(self):
+        if self._combined_data_path is None:
+            self._combined_data_path = self.get_path('combined-newsqa-data-v1.csv')
+            self.newsqa_dataset.dump(self._combined_data_path)
+        return self._combined_data_path
+
+    @property
+    def tokenized_packed_path(self):
+        if self._tokenized_packed_path is None:
+            packed_path = self.get_path('newsqa-data-v1.csv.pck')
+            with io.open(packed_path, 'w', encoding='utf-8') as writer:
+                pack(self.newsqa_dataset.dataset, writer)
+            self._tokenized_packed_path = self.get_path('newsqa-data-v1.csv.tpck')
+            synthetic_data.tokenize_packed_file(packed_path, self._tokenized_packed_path)
+            os.remove(packed_path)
+        return self._tokenized_packed_path
+
+    @property
+    def tokenized_data_path(self):
+        if self._tokenized_data_path is None:
+            self._tokenized_data_path = self.get_path('newsqa-data-tokenized-v1.csv')
+            with io.open(self.tokenized_packed_path, 'r', encoding='utf-8') as packed:
+                unpack(self.newsqa_dataset.dataset, packed, self._tokenized_data_path)
+        return self._tokenized_data_path
+
+
+@benchmark('loader')
+def _bench_loader(context, _):
+    NewsQaDataset(context.cnn_stories_path, context.dataset_path)
+
+
+@benchmark('loader.lazy')
+def _bench_loader_lazy(context, _):
+    NewsQaDataset(context.cnn_stories_path, context.dataset_path, lazy=True).get_question_types()
+
+
+@benchmark('load_combined', setup=lambda context: context.combined_data_path)
+def _bench_load_combined(context, combined_data_path):
+    NewsQaDataset.load_combined(combined_data_path)
+
+
+@benchmark('to_dict', setup=lambda context: context.newsqa_dataset)
+def _bench_to_dict(context, newsqa_dataset):
+    newsqa_dataset.to_dict(context.split_dir_path)
+
+
+@benchmark('to_dict.serial', setup=lambda context: context.newsqa_dataset)
+def _bench_to_dict_serial(context, newsqa_dataset):
+    newsqa_dataset.to_dict(context.split_dir_path, workers=1)
+
+
+@benchmark('compute_consensus', setup=lambda context: context.newsqa_dataset)
+def _bench_compute_consensus(context, newsqa_dataset):
+    compute_consensus(newsqa_dataset.dataset)
+
+
+def _get_consensus_predictions(context):
+    newsqa_dataset = context.newsqa_dataset
+    return newsqa_dataset, newsqa_dataset.compute_consensus()
+
+
+@benchmark('evaluate', setup=_get_consensus_predictions)
+def _bench_evaluate(context, dataset_predictions):
+    newsqa_dataset, predictions = dataset_predictions
+    newsqa_dataset.evaluate(predictions)
+
+
+@benchmark('validate', setup=lambda context: context.newsqa_dataset)
+def _bench_validate(context, newsqa_dataset):
+    newsqa_dataset.validate()
+
+
+@benchmark('dump_json', setup=lambda context: context.newsqa_dataset)
+def _bench_dump_json(context, newsqa_dataset):
+    newsqa_dataset.dump(context.get_path('dump-v1.json'), context.split_dir_path)
+
+
+@benchmark('dump_csv', setup=lambda context: context.newsqa_dataset)
+def _bench_dump_csv(context, newsqa_dataset):
+    newsqa_dataset.dump(context.get_path('dump-v1.csv'))
+
+
+@benchmark('pack', setup=lambda context: context.newsqa_dataset)
+def _bench_pack(context, newsqa_dataset):
+    with io.open(context.get_path('bench.pck'), 'w', encoding='utf-8') as writer:
+        pack(newsqa_dataset.dataset, writer)
+
+
+@benchmark('unpack', setup=lambda context: context.tokenized_packed_path)
+def _bench_unpack(context, tokenized_packed_path):
+    with io.open(tokenized_packed_path, 'r', encoding='utf-8') as packed:
+        unpack(context.newsqa_dataset.dataset, packed, context.get_path('bench-tokenized.csv'))
+
+
+@benchmark('unpack.serial', setup=lambda context: context.tokenized_packed_path)
+def _bench_unpack_serial(context, tokenized_packed_path):
+    with io.open(tokenized_packed_path, 'r', encoding='utf-8') as packed:
+        unpack(context.newsqa_dataset.dataset, packed, context.get_path('bench-tokenized.csv'),
+               workers=1)
+
+
+@benchmark('span_utils.refine', setup=lambda context: context.newsqa_dataset)
+def _bench_span_utils_refine(context, newsqa_dataset):
+    for row in newsqa_dataset.dataset.itertuples():
+        refined_valid_spans = span_utils.valid_span_rack_from_string(
+            row.validated_answers, row.story_text)
+        refined_spans = span_utils.refine_answers(
+            span_utils.span_rack_from_string(row.answer_char_ranges), row.story_text)
+        format(span_utils.tag_text_from_span_rack(refined_valid_spans, row.story_text)[0])
+        format(span_utils.tag_text_from_span_rack(refined_spans, row.story_text)[0])
+
+
+def _read_tagged_texts(context):
+    result = []
+    with io.open(context.tokenized_packed_path, 'r', encoding='utf-8') as packed:
+        for line in packed:
+            sentences = [next(packed).strip() for _ in six.moves.range(int(line))]
+            if '%s ' % span_utils.TAG_B in ' '.join(sentences):
+                result.append(sentences)
+    return result
+
+
+@benchmark('span_utils.untag', setup=_read_tagged_texts)
+def _bench_span_utils_untag(context, tagged_texts):
+    for sentences in tagged_texts:
+        tagged_text = ' '.join(sentences)
+        for sentence in sentences:
+            span_utils.remove_tags(sentence)
+        text = span_utils.remove_tags(tagged_text)
+        span_rack = span_utils.span_rack_from_tag_text([tagged_text], text)
+        span_rack = span_utils.nearby_range_merge(span_rack, threshold=3)
+        span_utils.span_rack_to_string(span_rack)
+
+
+@benchmark('split_data', setup=lambda context: context.tokenized_data_path)
+def _bench_split_data(context, tokenized_data_path):
+    split_data(tokenized_data_path, context.get_path('split_data'), context.split_dir_path)
+
+
+@benchmark('token_arrays.export', setup=lambda context: context.tokenized_data_path)
+def _bench_token_arrays_export(context, tokenized_data_path):
+    export_token_arrays(tokenized_data_path, context.get_path('token_arrays'))
+
+
+def _export_token_arrays(context):
+    result = context.get_path('token_arrays')
+    if not os.path.exists(result):
+        export_token_arrays(context.tokenized_data_path, result)
+    return result
+
+
+@benchmark('token_arrays.load', setup=_export_token_arrays)
+def _bench_token_arrays_load(context, token_arrays_path):
+    arrays = TokenArrays(token_arrays_path)
+    for i in six.moves.range(len(arrays)):
+        arrays.get_story_tokens(arrays.question_stories[i])
+        arrays.get_question_tokens(i)
+        arrays.get_answers(i)
+
+
+@benchmark('batching', setup=_export_token_arrays)
+def _bench_batching(context, token_arrays_path):
+    for _ in BatchIterator(token_arrays_path, batch_size=32):
+        pass
+
+
+@benchmark('search_index.build', setup=lambda context: context.newsqa_dataset)
+def _bench_search_index_build(context, newsqa_dataset):
+    newsqa_dataset.build_search_index(context.get_path('search_index'))
+
+
+def _build_search_index(context):
+    newsqa_dataset = context.newsqa_dataset
+    newsqa_dataset.build_search_index(context.get_path('search_index'))
+    terms = get_terms(newsqa_dataset.dataset['story_text'].iat[0])
+    queries = [(term, 'story') for term in terms[:100]]
+    queries.extend(('"%s"' % ' '.join(terms[i:i + 3]), 'story') for i in range(100))
+    queries.extend((question, 'question') for question in newsqa_dataset.dataset['question'][:100])
+    return newsqa_dataset, queries
+
+
+@benchmark('search_index.query', setup=_build_search_index)
+def _bench_search_index_query(context, dataset_and_queries):
+    newsqa_dataset, queries = dataset_and_queries
+    for query, field in queries:
+        newsqa_dataset.search(query, field)
+
+
+def _register_stats_benchmarks():
+    for method_name in ['get_vocab_len',
+                        'get_answers',
+                        'get_questions_and_answers',
+                        'get_average_answer_length_over_questions',
+                        'get_question_types',
+                        'get_story_lengths_words',
+                        'get_question_lengths_words',
+                        'get_questions_without_answers']:
+        def _bench_stats(context, newsqa_dataset, method_name=method_name):
+            getattr(newsqa_dataset, method_name)()
+
+        benchmark('stats.%s' % method_name,
+                  setup=lambda context: context.newsqa_dataset)(_bench_stats)
+
+
+_register_stats_benchmarks()
+
+
+def measure(f, repeat=1, trace_memory=True):
+    """
+    :param f: The function to measure.
+    :param repeat: The number of times to time `f`.
+    :param trace_memory: `True` to run `f` once more while tracing memory allocations.
+    :return: The measurements.
+    :rtype: dict
+    """
+    max_rss_start = get_max_rss()
+    times = []
+    for _ in six.moves.range(repeat):
+        gc.collect()
+        start = timeit.default_timer()
+        f()
+        times.append(timeit.default_timer() - start)
+    result = OrderedDict([
+        ('seconds', min(times)),
+        ('mean_seconds', sum(times) / len(times)),
+        ('repeat', repeat),
+    ])
+    if trace_memory and tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            f()
+            _, result['peak_traced_bytes'] = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    # The peak of the whole process, earlier benchmarks can make it higher.
+    result['process_max_rss_bytes'] = get_max_rss()
+    if max_rss_start is not None:
+        result['max_rss_increase_bytes'] = result['process_max_rss_bytes'] - max_rss_start
+    return result
+
+
+def _get_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode('utf-8').strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(data_dir_path, names=None, repeat=1, trace_memory=True, metadata=None):
+    """
+    :param data_dir_path: The folder with the synthetic data.
+    :param names: (Optional) The names of the benchmarks to run. By default, all are run.
+    :param repeat: The number of times to time each benchmark.
+    :param trace_memory: `True` to measure the peak memory allocated by each benchmark.
+    :param metadata: (Optional) Extra information to include in the results.
+    :return: The results.
+    :rtype: dict
+    """
+    if names is None:
+        names = list(BENCHMARKS.keys())
+    unknown = set(names) - set(BENCHMARKS.keys())
+    if unknown:
+        raise ValueError("Unknown benchmarks: %s" % ', '.join(sorted(unknown)))
+    work_dir_path = tempfile.mkdtemp(prefix='newsqa-benchmark-')
+    try:
+        context = BenchmarkContext(data_dir_path, work_dir_path)
+        results = OrderedDict()
+        for name in names:
+            setup, f = BENCHMARKS[name]
+            args = setup(context) if setup else None
+            logger.info("Running `%s`.", name)
+            results[name] = measure(lambda: f(context, args), repeat, trace_memory)
+            logger.info("`%s` took %.3fs.", name, results[name]['seconds'])
+
+        result_metadata = OrderedDict([
+            ('commit', _get_commit()),
+            ('python', platform.python_version()),
+            ('platform', platform.platform()),
+            ('time', time.strftime('%Y-%m-%dT%H:%M:%S')),
+            ('num_questions', len(context.newsqa_dataset.dataset)),
+            ('num_stories', len(context.newsqa_dataset.story_index)),
+        ])
+        result_metadata.update(metadata or {})
+        return OrderedDict([('metadata', result_metadata), ('results', results)])
+    finally:
+        shutil.rmtree(work_dir_path, ignore_errors=True)
+
+
+def compare(old, new):
+    """
+    :param old: Results from `run_benchmarks`.
+    :param new: Results from `run_benchmarks`.
+    :return: A table comparing the timings and peak memory.
+    """
+    lines = ["%-50s %10s %10s %7s %12s" % ("benchmark", "old (s)", "new (s)", "ratio",
+                                            "memory ratio")]
+    for name, new_result in new['results'].items():
+        old_result = old['results'].get(name)
+        if old_result is None:
+            lines.append("%-50s %10s %10.3f" % (name, '-', new_result['seconds']))
+            continue
+        ratio = new_result['seconds'] / old_result['seconds'] if old_result['seconds'] else 0
+        memory_ratio = '-'
+        if old_result.get('peak_traced_bytes') and new_result.get('peak_traced_bytes'):
+            memory_ratio = '%.2f' % (new_result['peak_traced_bytes'] * 1.0
+                                     / old_result['peak_traced_bytes'])
+        lines.append("%-50s %10.3f %10.3f %7.2f %12s" % (
+            name, old_result['seconds'], new_result['seconds'], ratio, memory_ratio))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark NewsQA processing on synthetic data.")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="The size of the synthetic data relative to the real dataset.")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data_dir_path',
+                        help="The folder for the synthetic data. It is generated if missing."
+                             " Default: a folder in the temporary directory per scale and seed.")
+    parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS.keys()),
+                        help="The benchmarks to run. Default: all.")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="The number of times to time each benchmark. The best is kept.")
+    parser.add_argument('--no_trace_memory', action='store_true',
+                        help="Don't measure the peak memory allocated by each benchmark.")
+    parser.add_argument('--output_path', help="The path to write the results to as JSON.")
+    parser.add_argument('--compare', help="The path of previous results to compare to.")
+    args = parser.parse_args()
+
+    _get_logger(logging.INFO)
+
+    data_dir_path = args.data_dir_path or os.path.join(
+        tempfile.gettempdir(), 'newsqa-benchmark-data',
+        'scale-%g-seed-%d' % (args.scale, args.seed))
+    if not os.path.exists(os.path.join(data_dir_path, synthetic_data.METADATA_FILENAME)):
+        synthetic_data.generate(data_dir_path, args.scale, args.seed)
+
+    with io.open(os.path.join(data_dir_path, synthetic_data.METADATA_FILENAME),
+                 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+    results = run_benchmarks(data_dir_path, args.benchmarks, args.repeat,
+                             not args.no_trace_memory, metadata)
+    if args.output_path:
+        with io.open(args.output_path, 'w', encoding='utf-8') as f:
+            f.write(six.text_type(json.dumps(results, indent=2)))
+        logger.info("Wrote results to `%s`.", args.output_path)
+    if args.compare:
+        with io.open(args.compare, 'r', encoding='utf-8') as f:
+            print(compare(json.load(f), results))
+    else:
+        print(json.dumps(results['results'], indent=2))
+
+
+if __name__ == '__main__':
+    main()
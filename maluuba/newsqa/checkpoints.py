@@ -0,0 +1,124 @@
+"""
+Checkpoints so that long stages can resume after they're interrupted.
+
+Outputs are written to a temporary file next to them and renamed when they're complete, so an
+output either doesn't exist or is complete:
+
+    with atomic_output('combined-newsqa-data-v1.csv') as path:
+        dataset.to_csv(path)
+
+A stage that's split into shards keeps the output of each shard that's done in a folder.
+Each output is named by its shard number and a hash of its input so that when the stage runs
+again, only the shards that weren't done or whose input changed are run.
+"""
+import contextlib
+import hashlib
+import logging
+import os
+import shutil
+
+import pandas as pd
+
+logger = logging.getLogger('newsqa')
+
+
+def replace_file(source_path, destination_path):
+    """
+    Rename a file, replacing the destination if it exists.
+    """
+    if hasattr(os, 'replace'):
+        os.replace(source_path, destination_path)
+    else:
+        # Python 2, this only replaces the destination on POSIX.
+        os.rename(source_path, destination_path)
+
+
+def get_temp_path(path):
+    """
+    :return: A path in the same folder as `path` (so that it can be renamed to `path`) with the
+        same extension.
+    :rtype: str
+    """
+    dir_name, name = os.path.split(path)
+    return os.path.join(dir_name, '.tmp-%d-%s' % (os.getpid(), name))
+
+
+@contextlib.contextmanager
+def atomic_output(path):
+    """
+    Write a file to a temporary path and rename it to `path` when it's done.
+    The temporary file is removed if there's an error.
+
+    :param path: The path to write to.
+    :return: A context manager giving the path to write to.
+    """
+    temp_path = get_temp_path(path)
+    try:
+        yield temp_path
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    replace_file(temp_path, path)
+
+
+def get_frame_key(frame, version=''):
+    """
+    :param frame: Rows of a dataset.
+    :param version: (Optional) The version of the code processing the rows.
+    :return: A hash of the values of the rows and `version`.
+    :rtype: str
+    """
+    result = hashlib.sha1(version.encode('utf-8'))
+    result.update(('%d\n%s\n' % (len(frame), '\t'.join(map(str, frame.columns))))
+                  .encode('utf-8'))
+    if len(frame) > 0:
+        result.update(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+    return result.hexdigest()[:16]
+
+
+class ShardCheckpoints(object):
+    """
+    The outputs of the shards of a stage that are done.
+    """
+
+    def __init__(self, dir_path, extension='.csv'):
+        """
+        :param dir_path: The folder to keep the outputs in. It's created if it doesn't exist.
+        :param extension: The extension of the outputs.
+        """
+        self.dir_path = dir_path
+        self.extension = extension
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
+
+    def get_path(self, shard_number, key):
+        """
+        :param shard_number: The number of the shard.
+        :param key: The hash of the input of the shard, see `get_frame_key`.
+        :return: The path of the output of the shard.
+        :rtype: str
+        """
+        return os.path.join(self.dir_path, '%05d-%s%s' % (shard_number, key, self.extension))
+
+    def is_done(self, shard_number, key):
+        return os.path.exists(self.get_path(shard_number, key))
+
+    def remove_stale(self, paths):
+        """
+        Remove the outputs and temporary files that aren't in `paths`,
+        e.g. for shards whose input changed.
+
+        :param paths: The paths of the outputs of the current shards.
+        """
+        names = set(os.path.basename(path) for path in paths)
+        for name in os.listdir(self.dir_path):
+            if name not in names:
+                logger.info("Removing stale checkpoint `%s`.", name)
+                os.remove(os.path.join(self.dir_path, name))
+
+    def remove(self):
+        """
+        Remove every output, e.g. once the stage is done.
+        """
+        shutil.rmtree(self.dir_path, ignore_errors=True)
@@ -0,0 +1,85 @@
+"""
+Compact column types for the dataset.
+
+By default, every column is read as strings except `is_answer_absent` so the story ID and the
+story text are stored again for each question.
+`compact_dataset` stores them once per story and uses smaller numeric types:
+
+* `story_id`, `story_text` and `sentence_starts` (tokenized data) are categorical.
+* `is_answer_absent` and `is_question_bad` are float32, '?' and empty values become NaN.
+* Integer columns use the smallest type that fits.
+
+The ratios lose precision past about 7 digits.
+The other columns, e.g. `answer_char_ranges`, are kept as they are since they get updated
+when answer ranges are clamped to fit in the stories.
+
+    newsqa_dataset = NewsQaDataset(combined_data_path='combined-newsqa-data-v1.csv', compact=True)
+    print(newsqa_dataset.memory_report())
+"""
+import numpy as np
+import pandas as pd
+
+CATEGORICAL_COLUMNS = ['story_id', 'story_text', 'sentence_starts']
+
+RATIO_COLUMNS = ['is_answer_absent', 'is_question_bad']
+
+
+def compact_dataset(dataset):
+    """
+    :param dataset: The dataset, e.g. `NewsQaDataset.dataset`.
+    :return: A copy of the dataset with compact column types.
+    :rtype: pandas.DataFrame
+    """
+    result = dataset.copy()
+    for column in result.columns:
+        values = result[column]
+        if column in CATEGORICAL_COLUMNS:
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                result[column] = values.astype('category')
+        elif column in RATIO_COLUMNS:
+            result[column] = get_ratios(values)
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            result[column] = pd.to_numeric(values, downcast='integer')
+    return result
+
+
+def get_ratios(values):
+    """
+    :param values: The values of a ratio column, either numbers or strings.
+    :return: The ratios with NaN for missing values such as '?'.
+    :rtype: pandas.Series
+    """
+    return pd.to_numeric(values, errors='coerce').astype(np.float32)
+
+
+def get_memory_usage(dataset):
+    """
+    :param dataset: The dataset.
+    :return: The number of bytes used by each column, including the objects that it refers to.
+    :rtype: pandas.Series
+    """
+    return dataset.memory_usage(index=False, deep=True)
+
+
+def memory_report(before, after):
+    """
+    :param before: The memory used by each column before compacting
+        (see `get_memory_usage`) or the dataset itself.
+    :param after: The memory used by each column after compacting or the dataset itself.
+    :return: The bytes used by each column before and after with the types after,
+        the last row is the total.
+    :rtype: pandas.DataFrame
+    """
+    dtypes = None
+    if isinstance(before, pd.DataFrame):
+        before = get_memory_usage(before)
+    if isinstance(after, pd.DataFrame):
+        dtypes = after.dtypes.astype(str)
+        after = get_memory_usage(after)
+    result = pd.DataFrame(dict(before=before, after=after), columns=['before', 'after'])
+    result.loc['total'] = result.sum()
+    result['ratio'] = result['after'] / result['before']
+    if dtypes is not None:
+        result['dtype'] = dtypes
+        result.loc['total', 'dtype'] = ''
+    return result
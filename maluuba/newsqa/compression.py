@@ -0,0 +1,146 @@
+"""
+Block-parallel gzip compression.
+
+The data is cut into blocks which are compressed as separate gzip members by a pool of threads
+(zlib releases the GIL while compressing).
+The members are written in order so the output is a standard multi-member gzip file that
+`gzip`, `zcat` and Python's `gzip` module read as one stream.
+"""
+import collections
+import io
+import multiprocessing
+import zlib
+from multiprocessing.pool import ThreadPool
+
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+DEFAULT_COMPRESS_LEVEL = 6
+
+# wbits for zlib to write a gzip header and trailer.
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def compress_member(data, compresslevel=DEFAULT_COMPRESS_LEVEL):
+    """
+    :param data: The bytes to compress.
+    :param compresslevel: The zlib compression level.
+    :return: `data` as a complete gzip member.
+    :rtype: bytes
+    """
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, _GZIP_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """
+    A binary file-like object that gzips what is written to it across several threads.
+
+    At most `2 * workers` blocks are buffered at once so memory stays constant regardless of
+    how much is written.
+    """
+
+    def __init__(self, fileobj, compresslevel=DEFAULT_COMPRESS_LEVEL,
+                 block_size=DEFAULT_BLOCK_SIZE, workers=None):
+        """
+        :param fileobj: The binary file-like object to write the compressed data to,
+            or the path of a file to create.
+        :param compresslevel: The zlib compression level.
+        :param block_size: The number of uncompressed bytes in each gzip member.
+        :param workers: (Optional) The number of compression threads.
+            Defaults to the number of CPUs.
+        """
+        super(ParallelGzipWriter, self).__init__()
+        if isinstance(fileobj, (str, type(u''))):
+            self._fileobj = io.open(fileobj, 'wb')
+            self._owns_fileobj = True
+        else:
+            self._fileobj = fileobj
+            self._owns_fileobj = False
+        self._compresslevel = compresslevel
+        self._block_size = block_size
+        self._workers = workers or multiprocessing.cpu_count()
+        self._pool = None
+        self._pending = collections.deque()
+        self._buffer = []
+        self._buffer_size = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        data = bytes(data)
+        self._buffer.append(data)
+        self._buffer_size += len(data)
+        self.bytes_in += len(data)
+        if self._buffer_size >= self._block_size:
+            self._submit_buffer()
+        return len(data)
+
+    def _submit_buffer(self):
+        block = b''.join(self._buffer)
+        self._buffer = []
+        self._buffer_size = 0
+        if self._workers <= 1:
+            self._write_member(compress_member(block, self._compresslevel))
+            return
+        if self._pool is None:
+            self._pool = ThreadPool(self._workers)
+        self._pending.append(
+            self._pool.apply_async(compress_member, (block, self._compresslevel)))
+        while len(self._pending) > 2 * self._workers:
+            self._write_member(self._pending.popleft().get())
+
+    def _write_member(self, member):
+        self._fileobj.write(member)
+        self.bytes_out += len(member)
+
+    def flush(self):
+        if self._buffer_size:
+            self._submit_buffer()
+        while self._pending:
+            self._write_member(self._pending.popleft().get())
+        self._fileobj.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush()
+            if self.bytes_in == 0:
+                # Still write a valid, empty gzip file.
+                self._write_member(compress_member(b'', self._compresslevel))
+        finally:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+            try:
+                super(ParallelGzipWriter, self).close()
+            finally:
+                if self._owns_fileobj:
+                    self._fileobj.close()
+
+
+def is_gzip_path(path):
+    return path.endswith('.gz') or path.endswith('.tgz')
+
+
+def open_output(path, compress=None, workers=None, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Open a binary file for writing, compressing it when needed.
+
+    :param path: The path to write to.
+    :param compress: (Optional) `True` to gzip the output.
+        By default, the output is gzipped when `path` ends with ".gz".
+    :param workers: (Optional) The number of compression threads.
+    :param block_size: The number of uncompressed bytes in each gzip member.
+    :return: A binary file-like object.
+    """
+    if compress is None:
+        compress = is_gzip_path(path)
+    if compress:
+        return ParallelGzipWriter(path, block_size=block_size, workers=workers)
+    return io.open(path, 'wb')
@@ -0,0 +1,163 @@
+"""
+The consensus answer of every question, computed for all rows at once.
+
+The semantics are the same as `NewsQaDataset.get_consensus_answer` for one row:
+
+* Validated questions: the validated answer with the most votes if it has at least half of them.
+* Other questions: the most common answer range of the crowdsourcers
+  (the first one given on a tie), "None" means that there is no answer.
+
+When there's no consensus answer, the question is bad if `is_question_bad` is at least 0.5,
+like the `consensus` in the JSON data.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import six
+
+# The status of the consensus of a question, named like in the JSON data.
+SPAN = 'span'
+NO_ANSWER = 'noAnswer'
+BAD_QUESTION = 'badQuestion'
+STATUSES = [SPAN, NO_ANSWER, BAD_QUESTION]
+
+_RANGE_PATTERN = re.compile(r'^(\d+):(\d+)$')
+# A row separator or a validated answer and its count.
+_VALIDATED_ANSWER_PATTERN = re.compile(r'(\n)|"((?:[^"\\\n]|\\.)*)"\s*:\s*(\d+)')
+# The separators between rows and between answers.
+_SEPARATOR_PATTERN = re.compile(r'[|,\n]')
+_SEPARATOR_CODE_POINTS = np.array([ord(c) for c in u'|,\n'], dtype=np.uint32)
+
+
+def _get_strings(dataset, column):
+    if column not in dataset.columns:
+        return [''] * len(dataset)
+    return dataset[column].fillna('').astype(six.text_type).tolist()
+
+
+def _set_ranges(starts, ends, positions, answer_numbers, unique_answers):
+    """
+    Set the ranges for the answers that are ranges like "4:8".
+
+    :param positions: The rows to set.
+    :param answer_numbers: The number of the answer for each row in `unique_answers`.
+    :param unique_answers: The distinct answers.
+    """
+    numbers, answer_numbers = np.unique(answer_numbers, return_inverse=True)
+    answer_starts = np.full(len(numbers), -1, dtype=np.int64)
+    answer_ends = np.full(len(numbers), -1, dtype=np.int64)
+    # Each distinct answer is only parsed once.
+    for i, number in enumerate(numbers):
+        m = _RANGE_PATTERN.match(unique_answers[number])
+        if m:
+            answer_starts[i] = int(m.group(1))
+            answer_ends[i] = int(m.group(2))
+    starts[positions] = answer_starts[answer_numbers]
+    ends[positions] = answer_ends[answer_numbers]
+
+
+def _get_group_firsts(rows, keys):
+    """
+    :param rows: The row of each item.
+    :param keys: The sort keys of the items, the first key is the most important.
+    :return: The index of the first item for each row after sorting by `keys`.
+    """
+    order = np.lexsort(tuple(reversed(keys)) + (rows,))
+    sorted_rows = rows[order]
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = sorted_rows[1:] != sorted_rows[:-1]
+    return order[is_first]
+
+
+def _join_rows(values, positions):
+    """
+    :return: The values at the positions, one per line.
+        Newlines can't be in answers or JSON strings so they are only between rows.
+    """
+    return '\n'.join(values[position] for position in positions)
+
+
+def _set_validated_consensus(starts, ends, validated_answers, positions):
+    matches = _VALIDATED_ANSWER_PATTERN.findall(_join_rows(validated_answers, positions))
+    if not matches:
+        return
+    is_answer = np.array([not newline for newline, _, _ in matches], dtype=bool)
+    rows = positions[np.cumsum(~is_answer)[is_answer]]
+    answer_numbers, unique_answers = pd.factorize(
+        np.array([answer for newline, answer, _ in matches if not newline], dtype=object))
+    counts = np.array([int(count) for newline, _, count in matches if not newline],
+                      dtype=np.int64)
+    if len(counts) == 0:
+        return
+
+    group_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+    totals = np.add.reduceat(counts, group_starts)
+    # The first answer with the most votes.
+    best = _get_group_firsts(rows, [-counts, np.arange(len(rows))])
+    best = best[counts[best] >= totals / 2.0]
+    _set_ranges(starts, ends, rows[best], answer_numbers[best], unique_answers)
+
+
+def _set_crowdsourced_consensus(starts, ends, answer_char_ranges, positions):
+    if len(positions) == 0:
+        return
+    text = _join_rows(answer_char_ranges, positions)
+    answers = _SEPARATOR_PATTERN.split(text)
+    code_points = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    separators = code_points[np.isin(code_points, _SEPARATOR_CODE_POINTS)]
+    is_newline = separators == ord('\n')
+    rows = positions[np.r_[0, np.cumsum(is_newline)]]
+
+    answer_numbers, unique_answers = pd.factorize(np.array(answers, dtype=object))
+    # Count each distinct answer in each row.
+    keys = rows * len(unique_answers) + answer_numbers
+    unique_keys, firsts, counts = np.unique(keys, return_index=True, return_counts=True)
+    key_rows = unique_keys // len(unique_answers)
+    # The most common answer, the first one given on a tie.
+    best = _get_group_firsts(key_rows, [-counts, firsts])
+    _set_ranges(starts, ends, key_rows[best], answer_numbers[firsts[best]], unique_answers)
+
+
+def _set_unique_consensus(starts, ends, values, positions, set_consensus):
+    """
+    Set the consensus for the rows at `positions` with `set_consensus`.
+    Many rows have the same answers so each distinct value is only parsed once.
+    """
+    numbers, unique_values = pd.factorize(
+        np.array([values[position] for position in positions], dtype=object))
+    unique_starts = np.full(len(unique_values), -1, dtype=np.int64)
+    unique_ends = np.full(len(unique_values), -1, dtype=np.int64)
+    set_consensus(unique_starts, unique_ends, list(unique_values),
+                  np.arange(len(unique_values)))
+    starts[positions] = unique_starts[numbers]
+    ends[positions] = unique_ends[numbers]
+
+
+def compute_consensus(dataset):
+    """
+    :param dataset: The dataset, e.g. `NewsQaDataset.dataset`.
+    :return: The consensus of each row with the same index as `dataset`:
+        `start` and `end`, -1 when there's no consensus answer,
+        and `status`, one of `STATUSES`.
+    :rtype: pandas.DataFrame
+    """
+    num_rows = len(dataset)
+    starts = np.full(num_rows, -1, dtype=np.int64)
+    ends = np.full(num_rows, -1, dtype=np.int64)
+    validated_answers = _get_strings(dataset, 'validated_answers')
+    is_validated = np.array([len(value) > 0 for value in validated_answers], dtype=bool)
+    _set_unique_consensus(starts, ends, validated_answers, np.flatnonzero(is_validated),
+                          _set_validated_consensus)
+    _set_unique_consensus(starts, ends, _get_strings(dataset, 'answer_char_ranges'),
+                          np.flatnonzero(~is_validated), _set_crowdsourced_consensus)
+
+    if 'is_question_bad' in dataset.columns:
+        is_question_bad = pd.to_numeric(dataset['is_question_bad'], errors='coerce').values
+        is_bad = np.nan_to_num(is_question_bad.astype(np.float64)) >= 0.5
+    else:
+        is_bad = np.zeros(num_rows, dtype=bool)
+    status = np.where(starts >= 0, SPAN, np.where(is_bad, BAD_QUESTION, NO_ANSWER))
+    return pd.DataFrame(dict(start=starts, end=ends,
+                             status=pd.Categorical(status, categories=STATUSES)),
+                        index=dataset.index, columns=['start', 'end', 'status'])
@@ -13,9 +13,11 @@ try:
     # Prefer a more specific path for when you run from the root of this repo
     # or if the root of the repo is in your Python path.
     from maluuba.newsqa.data_processing import NewsQaDataset
+    from maluuba.newsqa.metrics import get_metrics
 except:
     # In case you're running this file from this folder.
     from data_processing import NewsQaDataset
+    from metrics import get_metrics
 
 if __name__ == "__main__":
     dir_name = os.path.dirname(os.path.abspath(__file__))
@@ -25,8 +27,15 @@ if __name__ == "__main__":
                         help="The path to the CNN stories (cnn_stories.tgz).")
     parser.add_argument('--dataset_path', default=os.path.join(dir_name, 'newsqa-data-v1.csv'),
                         help="The path to the dataset with questions and answers.")
+    parser.add_argument('--metrics_path',
+                        help="(Optional) The path to write the metrics for each stage to as JSON.")
+    parser.add_argument('--profile_stages', nargs='*', default=[],
+                        help="(Optional) The names of the stages to profile with cProfile. "
+                             "E.g. build.read_stories unpack")
     args = parser.parse_args()
 
+    get_metrics().profile_stages.update(args.profile_stages)
+
     newsqa_data = NewsQaDataset(args.cnn_stories_path, args.dataset_path)
 
     logger = logging.getLogger('newsqa')
@@ -40,3 +49,6 @@ if __name__ == "__main__":
     tokenize(output_path=tokenized_data_path)
     split_data(dataset_path=tokenized_data_path)
     simplify(output_dir_path='split_data')
+
+    if args.metrics_path:
+        get_metrics().dump(args.metrics_path)
@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
 
-import codecs
 import io
+import itertools
 import json
 import logging
+import multiprocessing
 import os
 import re
 import tarfile
@@ -16,6 +17,34 @@ import pandas as pd
 import six
 import tqdm
 
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    import maluuba.newsqa.exporters as exporters
+    from maluuba.newsqa.checkpoints import atomic_output
+    from maluuba.newsqa.compact import compact_dataset, get_memory_usage, memory_report
+    from maluuba.newsqa.compression import ParallelGzipWriter, open_output
+    from maluuba.newsqa.consensus import BAD_QUESTION, SPAN, compute_consensus
+    from maluuba.newsqa.evaluation import CHAR, evaluate
+    from maluuba.newsqa.metrics import get_file_size, get_metrics
+    from maluuba.newsqa.near_duplicates import find_near_duplicate_questions
+    from maluuba.newsqa.search_index import SearchIndex, build_search_index
+    from maluuba.newsqa.story_corpus import StoryCorpus, write_story_corpus
+    from maluuba.newsqa.validation import DEFAULT_SHARD_SIZE, validate_dataset
+except:
+    # In case you're running this file from this folder.
+    import exporters
+    from checkpoints import atomic_output
+    from compact import compact_dataset, get_memory_usage, memory_report
+    from compression import ParallelGzipWriter, open_output
+    from consensus import BAD_QUESTION, SPAN, compute_consensus
+    from evaluation import CHAR, evaluate
+    from metrics import get_file_size, get_metrics
+    from near_duplicates import find_near_duplicate_questions
+    from search_index import SearchIndex, build_search_index
+    from story_corpus import StoryCorpus, write_story_corpus
+    from validation import DEFAULT_SHARD_SIZE, validate_dataset
+
 
 def strip_empty_strings(strings):
     while strings and strings[-1] == "":
@@ -23,6 +52,65 @@ def strip_empty_strings(strings):
     return strings
 
 
+DEFAULT_TO_DICT_CHUNK_SIZE = 5000
+
+# The columns that can't be shared because they have the text of the stories.
+UNSHAREABLE_COLUMNS = [
+    'story_title',
+    'story_text',
+    'popular_answer_char_ranges',
+    'popular_answers (for humans to read)',
+]
+
+# The story ID splits that were loaded, by folder.
+_story_id_splits_cache = dict()
+
+
+def _get_split_dir_path(split_dir_path=None):
+    if split_dir_path is None:
+        split_dir_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.abspath(split_dir_path)
+
+
+def _get_split_paths(split_dir_path):
+    return [os.path.join(split_dir_path, '%s_story_ids.csv' % data_type)
+            for data_type in ('train', 'dev', 'test')]
+
+
+def load_story_id_splits(split_dir_path=None):
+    """
+    The splits are only read again if the files changed.
+
+    :param split_dir_path: (Optional) The folder with `train_story_ids.csv`, `dev_story_ids.csv`
+        and `test_story_ids.csv`. Defaults to the split from the paper.
+    :return: The sets of story IDs for the train, dev and test data.
+    :rtype: tuple
+    """
+    split_dir_path = _get_split_dir_path(split_dir_path)
+    paths = _get_split_paths(split_dir_path)
+    mtimes = tuple(os.path.getmtime(path) for path in paths)
+    cached = _story_id_splits_cache.get(split_dir_path)
+    if cached is None or cached[0] != mtimes:
+        splits = tuple(frozenset(pd.read_csv(path)['story_id'].values) for path in paths)
+        story_id_to_split = dict()
+        for data_type, story_ids in reversed(list(zip(('train', 'dev', 'test'), splits))):
+            story_id_to_split.update((story_id, data_type) for story_id in story_ids)
+        cached = (mtimes, splits, story_id_to_split)
+        _story_id_splits_cache[split_dir_path] = cached
+    return cached[1]
+
+
+def get_story_id_to_split(split_dir_path=None):
+    """
+    :param split_dir_path: (Optional) The folder with the story ID split files.
+        Defaults to the split from the paper.
+    :return: The type of data ('train', 'dev' or 'test') for each story ID.
+    :rtype: dict
+    """
+    load_story_id_splits(split_dir_path)
+    return _story_id_splits_cache[_get_split_dir_path(split_dir_path)][2]
+
+
 def _get_logger(log_level=logging.INFO):
     result = logging.getLogger('newsqa')
     if not result.handlers:
@@ -37,19 +125,598 @@ def _get_logger(log_level=logging.INFO):
     return result
 
 
+_HIGHLIGHT_INDICATOR = u'@highlight'
+_COPYRIGHT_LINE_PATTERN = re.compile(
+    u"^(Copyright|Entire contents of this article copyright, )")
+
+# The characters that `bytes.strip()` removes.
+_ASCII_WHITESPACE = u' \t\n\r\x0b\x0c'
+
+_STORY_TEXT_TRANSLATION = {ord(u'\r'): u'\n'}
+_SPECIALLY_DECODED_STORY_TEXT_TRANSLATION = {ord(u'\r'): u'\n', ord(u'\xe9'): u'\xc3\xa9'}
+
+
+def decode_story_lines(data, decode_specially=False):
+    """
+    :param data: The bytes of a story file.
+    :param decode_specially: `True` to decode each byte as the character with the same code point
+        (i.e. Latin-1) instead of decoding UTF-8.
+    :return: The stripped lines of the story.
+    :rtype: list
+    """
+    # Decode the whole file at once.
+    # Splitting on '\n' afterwards gives the same lines as `readlines()` (except possibly an empty
+    # last line) since '\n' is never part of a multi-byte UTF-8 sequence.
+    text = data.decode('latin-1' if decode_specially else 'utf-8')
+    return [line.strip(_ASCII_WHITESPACE) for line in text.split(u'\n')]
+
+
+def get_num_extra_newlines(story_id, stories_requiring_extra_newline,
+                           stories_requiring_two_extra_newlines):
+    if story_id in stories_requiring_two_extra_newlines:
+        return 2
+    if story_id in stories_requiring_extra_newline:
+        return 1
+    return 0
+
+
+def read_story_text(data, decode_specially=False, num_extra_newlines=0):
+    """
+    Get the text of a story in the same form as when the indices were collected.
+
+    Problems are caused by using several programming languages and libraries.
+    When ingesting the stories, we started with Python 2.
+    After dealing with unicode issues, we tried switching to Python 3.
+    That caused inconsistency problems so we switched back to Python 2.
+    Furthermore, when crowdsourcing, JavaScript and HTML templating perturbed the stories.
+    So here we map the text to be compatible with the indices.
+
+    :param data: The bytes of a story file from the CNN stories.
+    :param decode_specially: `True` if the story is in `stories_to_decode_specially.csv`.
+    :param num_extra_newlines: The number of extra newlines between lines,
+        see `stories_requiring_extra_newline.csv` and `stories_requiring_two_extra_newlines.csv`.
+    :return: The text of the story.
+    """
+    lines = decode_story_lines(data, decode_specially)
+    highlights_start = lines.index(_HIGHLIGHT_INDICATOR)
+    story_lines = lines[:highlights_start]
+    story_lines = strip_empty_strings(story_lines)
+    while len(story_lines) > 1 and _COPYRIGHT_LINE_PATTERN.search(story_lines[-1]):
+        story_lines = strip_empty_strings(story_lines[:-2])
+    story_text = (u'\n' * (1 + num_extra_newlines)).join(story_lines)
+
+    story_text = story_text.replace(u'\xe2\x80\xa2', u'\xe2\u20ac\xa2')
+    story_text = story_text.replace(u'\xe2\x82\xac', u'\xe2\u201a\xac')
+    if decode_specially:
+        return story_text.translate(_SPECIALLY_DECODED_STORY_TEXT_TRANSLATION)
+    return story_text.translate(_STORY_TEXT_TRANSLATION)
+
+
+_special_story_ids = None
+
+
+def load_special_story_ids():
+    """
+    :return: The sets of story IDs requiring an extra newline, requiring two extra newlines and
+        to decode specially.
+    :rtype: tuple
+    """
+    global _special_story_ids
+    if _special_story_ids is None:
+        dirname = os.path.dirname(os.path.abspath(__file__))
+        result = []
+        for name in ('stories_requiring_extra_newline.csv',
+                     'stories_requiring_two_extra_newlines.csv',
+                     'stories_to_decode_specially.csv'):
+            with io.open(os.path.join(dirname, name), 'r', encoding='utf-8') as f:
+                result.append(set(f.read().split('\n')))
+        _special_story_ids = tuple(result)
+    return _special_story_ids
+
+
+def _read_member_story_text(t, member):
+    stories_requiring_extra_newline, stories_requiring_two_extra_newlines, \
+        stories_to_decode_specially = load_special_story_ids()
+    story_id = member.name
+    story_file = t.extractfile(member)
+    data = story_file.read()
+    story_file.close()
+    story_text = read_story_text(
+        data,
+        decode_specially=story_id in stories_to_decode_specially,
+        num_extra_newlines=get_num_extra_newlines(
+            story_id,
+            stories_requiring_extra_newline,
+            stories_requiring_two_extra_newlines))
+    return story_text, len(data)
+
+
+def load_story_texts(cnn_stories_path, story_ids):
+    """
+    Read the texts of some stories from the CNN stories.
+
+    :param cnn_stories_path: The path to the CNN stories (cnn_stories.tgz).
+    :param story_ids: The IDs of the stories to read.
+    :return: The text for each story ID.
+    :rtype: dict
+    """
+    remaining_story_ids = set(story_ids)
+    result = {}
+    if not remaining_story_ids:
+        return result
+    with get_metrics().stage('build.read_stories', stories=len(remaining_story_ids)) \
+            as record:
+        with tarfile.open(cnn_stories_path, mode='r:gz', encoding='utf-8') as t:
+            with tqdm.tqdm(total=len(remaining_story_ids),
+                           mininterval=2, unit_scale=True, unit=" stories",
+                           desc="Getting story texts") as pbar:
+                for member in t:
+                    story_id = member.name
+                    if story_id in remaining_story_ids:
+                        remaining_story_ids.remove(story_id)
+                        result[story_id], num_bytes = _read_member_story_text(t, member)
+                        record.add_bytes_read(num_bytes)
+
+                        pbar.update()
+
+                        if len(remaining_story_ids) == 0:
+                            break
+    return result
+
+
+class LazyStoryTexts(object):
+    """
+    The texts of stories from the CNN stories, read the first time each one is accessed
+    and then cached.
+
+    Stories are found by reading through the archive so getting them in the order that
+    they're in the archive is fastest.
+    The archive isn't opened until a story is needed.
+    """
+
+    def __init__(self, cnn_stories_path, story_ids):
+        """
+        :param cnn_stories_path: The path to the CNN stories (cnn_stories.tgz).
+        :param story_ids: The IDs of the stories that can be accessed.
+        """
+        self.cnn_stories_path = cnn_stories_path
+        self._story_ids = set(story_ids)
+        self._texts = {}
+        self._members = {}
+        self._tar = None
+        self._is_tar_exhausted = False
+
+    def __contains__(self, story_id):
+        return story_id in self._story_ids
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._story_ids)
+
+    def keys(self):
+        return sorted(self._story_ids)
+
+    def is_loaded(self, story_id):
+        return story_id in self._texts
+
+    def __getitem__(self, story_id):
+        result = self._texts.get(story_id)
+        if result is None:
+            if story_id not in self._story_ids:
+                raise KeyError(story_id)
+            member = self._find_member(story_id)
+            if member is None:
+                raise KeyError(story_id)
+            with get_metrics().stage('lazy.read_story', stories=1) as record:
+                result, num_bytes = _read_member_story_text(self._tar, member)
+                record.add_bytes_read(num_bytes)
+            self._texts[story_id] = result
+        return result
+
+    def get(self, story_id, default=None):
+        try:
+            return self[story_id]
+        except KeyError:
+            return default
+
+    def _find_member(self, story_id):
+        result = self._members.get(story_id)
+        if self._tar is None:
+            self._tar = tarfile.open(self.cnn_stories_path, mode='r:gz', encoding='utf-8')
+        while result is None and not self._is_tar_exhausted:
+            member = self._tar.next()
+            if member is None:
+                self._is_tar_exhausted = True
+            elif member.name in self._story_ids:
+                # Remember where the story is in case it's needed later.
+                self._members[member.name] = member
+                if member.name == story_id:
+                    result = member
+        return result
+
+    def prefetch(self, story_ids=None):
+        """
+        Load stories with one pass through the archive.
+
+        :param story_ids: (Optional) The IDs of the stories to load. Defaults to every story.
+        """
+        if story_ids is None:
+            story_ids = self._story_ids
+        missing_story_ids = set(story_ids) - set(self._texts)
+        if missing_story_ids:
+            self._texts.update(load_story_texts(self.cnn_stories_path, missing_story_ids))
+
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
+            self._members = {}
+            self._is_tar_exhausted = False
+
+    def __getstate__(self):
+        result = self.__dict__.copy()
+        result['_tar'] = None
+        result['_members'] = {}
+        result['_is_tar_exhausted'] = False
+        return result
+
+
+def clamp_answer_ranges(answer_char_ranges, validated_answers, story_length):
+    """
+    Fix character ranges that end after the story and drop ranges that end before they start.
+
+    :param answer_char_ranges: The `answer_char_ranges` of a row.
+    :param validated_answers: The `validated_answers` of a row.
+    :param story_length: The length of the text of the story.
+    :return: The updated `answer_char_ranges` and `validated_answers`,
+        each one is `None` if it doesn't need to change.
+    :rtype: tuple
+    """
+    result_answer_char_ranges = None
+    result_validated_answers = None
+
+    # Handle endings that are too large.
+    updated_answer_char_ranges = []
+    ranges_updated = False
+    for user_answer_char_ranges in answer_char_ranges.split('|'):
+        updated_user_answer_char_ranges = []
+        for char_range in user_answer_char_ranges.split(','):
+            if char_range != 'None':
+                start, end = map(int, char_range.split(':'))
+                if end > story_length:
+                    ranges_updated = True
+                    end = story_length
+                if start < end:
+                    updated_user_answer_char_ranges.append('%d:%d' % (start, end))
+                else:
+                    # It's unclear why but sometimes the end is after the start.
+                    # We'll filter these out.
+                    ranges_updated = True
+            else:
+                updated_user_answer_char_ranges.append(char_range)
+        if updated_user_answer_char_ranges:
+            updated_user_answer_char_ranges = ','.join(updated_user_answer_char_ranges)
+            updated_answer_char_ranges.append(updated_user_answer_char_ranges)
+    if ranges_updated:
+        result_answer_char_ranges = '|'.join(updated_answer_char_ranges)
+
+    if validated_answers and not pd.isnull(validated_answers):
+        updated_validated_answers = {}
+        for char_range, count in six.iteritems(json.loads(validated_answers)):
+            if ':' in char_range:
+                start, end = map(int, char_range.split(':'))
+                if end > story_length:
+                    ranges_updated = True
+                    end = story_length
+                if start < end:
+                    char_range = '{}:{}'.format(start, end)
+                    updated_validated_answers[char_range] = count
+                else:
+                    # It's unclear why but sometimes the end is after the start.
+                    # We'll filter these out.
+                    ranges_updated = True
+            else:
+                updated_validated_answers[char_range] = count
+        if ranges_updated:
+            result_validated_answers = json.dumps(updated_validated_answers,
+                                                  ensure_ascii=False, separators=(',', ':'))
+
+    return result_answer_char_ranges, result_validated_answers
+
+
+def set_story_texts(dataset, story_id_to_text, index=None, include_text=True):
+    """
+    Set the `story_text` of rows and clamp their answer ranges to fit in the story.
+
+    :param dataset: The dataset to update in place.
+    :param story_id_to_text: The text for the story of each row.
+    :param index: (Optional) The labels of the rows to set. Defaults to every row.
+    :param include_text: `False` to only clamp the answer ranges.
+    """
+    rows = dataset if index is None else dataset.loc[index]
+    with get_metrics().stage('build.set_story_texts', rows=len(rows)):
+        for row in tqdm.tqdm(rows.itertuples(),
+                             total=len(rows),
+                             mininterval=2, unit_scale=True, unit=" questions",
+                             desc="Setting story texts"):
+            # Set story_text since we cannot include it in the dataset.
+            story_text = story_id_to_text[row.story_id]
+            if include_text:
+                dataset.at[row.Index, 'story_text'] = story_text
+
+            answer_char_ranges, validated_answers = clamp_answer_ranges(
+                row.answer_char_ranges, row.validated_answers, len(story_text))
+            if answer_char_ranges is not None:
+                dataset.at[row.Index, 'answer_char_ranges'] = answer_char_ranges
+            if validated_answers is not None:
+                dataset.at[row.Index, 'validated_answers'] = validated_answers
+
+
+def map_answers(answer_char_ranges):
+    """
+    :param answer_char_ranges: The `answer_char_ranges` of a row.
+    :return: The answers of each crowdsourcer for JSON.
+    :rtype: list
+    """
+    result = []
+    for a in answer_char_ranges.split('|'):
+        user_answers = []
+        result.append(dict(sourcerAnswers=user_answers))
+        for r in a.split(','):
+            if r == 'None':
+                user_answers.append(dict(noAnswer=True))
+            else:
+                s, e = map(int, r.split(':'))
+                user_answers.append(dict(s=s, e=e))
+    return result
+
+
+def get_consensus_answer(answer_char_ranges, validated_answers):
+    """
+    Gets the consensus answer, see `NewsQaDataset.get_consensus_answer`.
+
+    :param answer_char_ranges: The `answer_char_ranges` of a row.
+    :param validated_answers: The `validated_answers` of a row.
+    :return: The answer with majority consensus.
+        Can be `(None, None)` if it was agreed that there was no answer or it was a bad question.
+    :rtype: tuple
+    """
+    answer_char_start, answer_char_end = None, None
+    if validated_answers:
+        validated_answers = json.loads(validated_answers)
+        answer, max_count = max(six.iteritems(validated_answers), key=itemgetter(1))
+        total_count = sum(six.itervalues(validated_answers))
+        if max_count >= total_count / 2.0:
+            if answer != 'none' and answer != 'bad_question':
+                answer_char_start, answer_char_end = map(int, answer.split(':'))
+            else:
+                # No valid answer.
+                pass
+    else:
+        # Check answer_char_ranges for most common answer.
+        # No validation was done so there must be an answer with consensus.
+        answers = Counter()
+        for user_answer in answer_char_ranges.split('|'):
+            for ans in user_answer.split(','):
+                answers[ans] += 1
+        top_answer = answers.most_common(1)
+        if top_answer:
+            top_answer, count = top_answer[0]
+            if ':' in top_answer:
+                answer_char_start, answer_char_end = map(int, top_answer.split(':'))
+
+    return answer_char_start, answer_char_end
+
+
+def _build_question(question, answer_char_ranges, is_answer_absent, is_question_bad,
+                    validated_answers, consensus_start, consensus_end, consensus_status):
+    """
+    :return: The JSON for a row, see `NewsQaDataset.to_dict`.
+        `is_question_bad` is NaN for questions without a rating.
+        The consensus is from `compute_consensus`.
+    :rtype: dict
+    """
+    q = dict(
+        q=question,
+        answers=map_answers(answer_char_ranges),
+        isAnswerAbsent=is_answer_absent,
+    )
+    if not np.isnan(is_question_bad):
+        q['isQuestionBad'] = is_question_bad
+    if validated_answers and not pd.isnull(validated_answers):
+        q['validatedAnswers'] = []
+        for answer, count in six.iteritems(json.loads(validated_answers)):
+            answer_item = dict(count=count)
+            if answer == 'none':
+                answer_item['noAnswer'] = True
+            elif answer == 'bad_question':
+                answer_item['badQuestion'] = True
+            else:
+                s, e = map(int, answer.split(':'))
+                answer_item['s'] = s
+                answer_item['e'] = e
+            q['validatedAnswers'].append(answer_item)
+    if consensus_status == SPAN:
+        q['consensus'] = dict(s=consensus_start, e=consensus_end)
+    elif consensus_status == BAD_QUESTION:
+        q['consensus'] = dict(badQuestion=True)
+    else:
+        q['consensus'] = dict(noAnswer=True)
+    return q
+
+
+def _build_stories_questions(stories):
+    """
+    :param stories: The arguments to `_build_question` for the rows of each story.
+    :return: The questions of each story.
+    :rtype: list
+    """
+    return [[_build_question(*row) for row in rows] for rows in stories]
+
+
+class StoryIndex(object):
+    """
+    Maps each story ID to the rows of the dataset for that story.
+
+    The row positions are sorted by story ID (keeping the original order within a story) so that
+    the rows for a story are the contiguous slice `positions[start:stop]`.
+    """
+
+    def __init__(self, story_ids):
+        """
+        :param story_ids: The story ID of each row in the dataset.
+        """
+        story_ids = np.asarray(story_ids, dtype=object)
+        self.positions = np.argsort(story_ids, kind='mergesort')
+        sorted_story_ids = story_ids[self.positions]
+        if len(sorted_story_ids) == 0:
+            self.story_ids = sorted_story_ids
+            self.spans = {}
+            return
+        boundaries = np.flatnonzero(sorted_story_ids[1:] != sorted_story_ids[:-1]) + 1
+        starts = np.concatenate([[0], boundaries]).astype(np.int64)
+        stops = np.concatenate([boundaries, [len(sorted_story_ids)]]).astype(np.int64)
+        self.story_ids = sorted_story_ids[starts]
+        self.spans = dict(zip(self.story_ids, zip(starts.tolist(), stops.tolist())))
+
+    def __contains__(self, story_id):
+        return story_id in self.spans
+
+    def __iter__(self):
+        return iter(self.story_ids)
+
+    def __len__(self):
+        return len(self.story_ids)
+
+    def get_positions(self, story_id):
+        """
+        :param story_id: The ID of a story in the index.
+        :return: The positions of the rows for `story_id` in the dataset.
+        :rtype: numpy.ndarray
+        """
+        start, stop = self.spans[story_id]
+        return self.positions[start:stop]
+
+
+class StoryView(object):
+    """
+    A lazy view of one story and its questions.
+
+    Nothing is copied from the dataset until a property is accessed.
+    """
+
+    def __init__(self, newsqa_dataset, story_id, positions):
+        self._newsqa_dataset = newsqa_dataset
+        self.story_id = story_id
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __repr__(self):
+        return "StoryView(story_id=%r, num_questions=%d)" % (self.story_id, len(self))
+
+    @property
+    def rows(self):
+        """
+        :return: The rows of the dataset for this story.
+        :rtype: pandas.DataFrame
+        """
+        return self._newsqa_dataset.dataset.iloc[self.positions]
+
+    @property
+    def text(self):
+        return self._newsqa_dataset.get_story_text(self.story_id)
+
+    @property
+    def title(self):
+        # Note: there are no titles in the dataset.
+        dataset = self._newsqa_dataset.dataset
+        if 'story_title' not in dataset.columns:
+            return None
+        return dataset['story_title'].iat[self.positions[0]]
+
+    @property
+    def questions(self):
+        return list(self._newsqa_dataset.dataset['question'].values[self.positions])
+
+    def get_qa_pairs(self, include_no_answers=False):
+        """
+        :param include_no_answers: `True` to keep answers marked as "None".
+        :return: The questions about the story with their answers as `'|'` separated
+            character ranges.
+        :rtype: list
+        """
+        self._newsqa_dataset._clamp_answer_ranges([self.story_id])
+        dataset = self._newsqa_dataset.dataset
+        result = []
+        for question, validated_answers, answer_char_ranges in zip(
+                dataset['question'].values[self.positions],
+                dataset['validated_answers'].values[self.positions],
+                dataset['answer_char_ranges'].values[self.positions]):
+            # Prefer validated answers; if none fallback to regular ones
+            answers = []
+            if validated_answers and not pd.isnull(validated_answers):
+                answers += json.loads(validated_answers).keys()
+            else:
+                for answer in answer_char_ranges.split("|"):
+                    if answer not in answers:
+                        answers.append(answer)
+
+            if not include_no_answers:
+                answers = [a for a in answers if a.lower() != "none"]
+
+            result.append({'question': question, 'answers': "|".join(answers)})
+        return result
+
+    @property
+    def qa_pairs(self):
+        return self.get_qa_pairs()
+
+
 class NewsQaDataset(object):
     def __init__(self, cnn_stories_path=None, dataset_path=None, log_level=logging.INFO,
-                 combined_data_path=None):
+                 combined_data_path=None, story_corpus_path=None, lazy=False, compact=False):
+        """
+        :param cnn_stories_path: (Optional) The path to the CNN stories (cnn_stories.tgz).
+        :param dataset_path: (Optional) The path to the dataset with questions and answers.
+        :param log_level: The level to log at.
+        :param combined_data_path: (Optional) The path of an already built dataset to load
+            instead of building it from the stories.
+        :param story_corpus_path: (Optional) The path of a story corpus to get story texts from
+            (see `export_story_corpus`). Only used with `combined_data_path`.
+        :param lazy: `True` to only load the questions now and read the text of each story
+            the first time that it's needed. Answer ranges are fixed to fit in a story when its
+            text is read.
+            Only used when building from the stories.
+        :param compact: `True` to use compact column types to save memory, see `compact`.
+        """
         self._logger = _get_logger(log_level)
+        self._compact = compact
+        # The memory used by each column before compacting.
+        self._memory_usage = None
+        self._story_texts = None
+        self._story_text_position = None
+        self._search_index = None
+        # The stories whose rows still need their answer ranges clamped.
+        self._unclamped_story_ids = None
 
         if combined_data_path:
-            self.dataset = self.load_combined(combined_data_path)
+            if story_corpus_path:
+                # The story texts are read from the corpus when they're needed.
+                self.dataset = self.load_combined(combined_data_path, include_story_text=False)
+                header = list(pd.read_csv(combined_data_path, nrows=0, encoding='utf-8').columns)
+                if 'story_text' in header:
+                    self._story_text_position = header.index('story_text')
+                self.open_story_corpus(story_corpus_path)
+            else:
+                self.dataset = self.load_combined(combined_data_path)
             self.version = self._get_version(combined_data_path)
+            self._compact_dataset()
             return
 
-        if not six.PY2:
-            raise Exception("Sorry, the loading logic only works with Python 2 for now.")
-
         dirname = os.path.dirname(os.path.abspath(__file__))
         if cnn_stories_path is None:
             cnn_stories_path = os.path.join(dirname, 'cnn_stories.tgz')
@@ -59,6 +726,7 @@ class NewsQaDataset(object):
                 "your own from http://cs.nyu.edu/~kcho/DMQA/" % cnn_stories_path)
         if dataset_path is None:
             dataset_path = os.path.join(dirname, 'newsqa-data-v1.csv')
+        zipped_dataset_path = None
         if not os.path.exists(dataset_path):
             zipped_dataset_paths = list(filter(os.path.exists,
                 [
@@ -68,10 +736,6 @@ class NewsQaDataset(object):
             if len(zipped_dataset_paths) > 0:
                 zipped_dataset_path = zipped_dataset_paths[0]
                 self._logger.info("Will use zipped dataset at `%s`.", zipped_dataset_path)
-                with tarfile.open(zipped_dataset_path, mode='r:gz', encoding='utf-8') as t:
-                    extraction_destination_path = os.path.dirname(dataset_path)
-                    self._logger.info("Extracting `%s` to `%s`.", zipped_dataset_path, extraction_destination_path)
-                    t.extractall(path=extraction_destination_path)
             else:
                 raise Exception(
                     "`%s` was not found.\nFor legal reasons, you must first accept the terms "
@@ -81,173 +745,266 @@ class NewsQaDataset(object):
 
         self.version = self._get_version(dataset_path)
 
-        self._logger.info("Loading dataset from `%s`...", dataset_path)
         # It's not really combined but it's okay because the method still works
         # to load data with missing columns.
-        self.dataset = self.load_combined(dataset_path)
+        if zipped_dataset_path is None:
+            self._logger.info("Loading dataset from `%s`...", dataset_path)
+            self.dataset = self.load_combined(dataset_path)
+        else:
+            self.dataset = self.load_zipped(zipped_dataset_path, os.path.basename(dataset_path))
 
-        remaining_story_ids = set(self.dataset['story_id'])
-        self._logger.info("Loading stories from `%s`...", cnn_stories_path)
+        story_ids = set(self.dataset['story_id'])
+        if lazy:
+            self._story_texts = LazyStoryTexts(cnn_stories_path, story_ids)
+            self._unclamped_story_ids = story_ids
+        else:
+            self._logger.info("Loading stories from `%s`...", cnn_stories_path)
+            story_id_to_text = load_story_texts(cnn_stories_path, story_ids)
+            set_story_texts(self.dataset, story_id_to_text)
+        self._compact_dataset()
 
-        with io.open(os.path.join(dirname, 'stories_requiring_extra_newline.csv'),
-                     'r', encoding='utf-8') as f:
-            stories_requiring_extra_newline = set(f.read().split('\n'))
+        self._logger.info("Done loading dataset.")
 
-        with io.open(os.path.join(dirname, 'stories_requiring_two_extra_newlines.csv'),
-                     'r', encoding='utf-8') as f:
-            stories_requiring_two_extra_newlines = set(f.read().split('\n'))
+    def _compact_dataset(self):
+        if self._compact:
+            self._memory_usage = get_memory_usage(self.dataset)
+            self.dataset = compact_dataset(self.dataset)
 
-        with io.open(os.path.join(dirname, 'stories_to_decode_specially.csv'),
-                     'r', encoding='utf-8') as f:
-            stories_to_decode_specially = set(f.read().split('\n'))
+    def memory_report(self):
+        """
+        :return: The bytes used by each column of `dataset` with the default column types and
+            with compact column types, see `compact`.
+        :rtype: pandas.DataFrame
+        """
+        if self._memory_usage is None:
+            return memory_report(self.dataset, compact_dataset(self.dataset))
+        return memory_report(self._memory_usage, self.dataset)
+
+    @property
+    def dataset(self):
+        return self._dataset
+
+    @dataset.setter
+    def dataset(self, dataset):
+        self._dataset = dataset
+        self._story_index = None
+        self._consensus = None
+
+    @property
+    def story_index(self):
+        """
+        :return: The index from story ID to rows, built on first use.
+        :rtype: StoryIndex
+        """
+        if self._story_index is None:
+            self._story_index = StoryIndex(self.dataset['story_id'].values)
+        return self._story_index
 
-        story_id_to_text = {}
-        with tarfile.open(cnn_stories_path, mode='r:gz', encoding='utf-8') as t:
-            highlight_indicator = '@highlight'
+    def get_story(self, story_id):
+        """
+        :param story_id: The ID of a story in the dataset.
+        :return: A lazy view of the story and its questions.
+        :rtype: StoryView
+        """
+        return StoryView(self, story_id, self.story_index.get_positions(story_id))
 
-            copyright_line_pattern = re.compile(
-                "^(Copyright|Entire contents of this article copyright, )")
-            with tqdm.tqdm(total=len(remaining_story_ids),
-                           mininterval=2, unit_scale=True, unit=" stories",
-                           desc="Getting story texts") as pbar:
-                for member in t.getmembers():
-                    story_id = member.name
-                    if story_id in remaining_story_ids:
-                        remaining_story_ids.remove(story_id)
-                        story_file = t.extractfile(member)
-
-                        # Correct discrepancies in stories.
-                        # Problems are caused by using several programming languages and libraries.
-                        # When ingesting the stories, we started with Python 2.
-                        # After dealing with unicode issues, we tried switching to Python 3.
-                        # That caused inconsistency problems so we switched back to Python 2.
-                        # Furthermore, when crowdsourcing, JavaScript and HTML templating perturbed
-                        # the stories.
-                        # So here we map the text to be compatible with the indices.
-                        if story_id in stories_to_decode_specially:
-                            lines = map(lambda s: u"".join(six.unichr(ord(c)) for c in s.strip()),
-                                        story_file.readlines())
-                        else:
-                            lines = map(lambda s: s.strip().decode('utf-8'),
-                                        story_file.readlines())
-
-                        story_file.close()
-                        if not six.PY2:
-                            lines = list(lines)
-                        highlights_start = lines.index(highlight_indicator)
-                        story_lines = lines[:highlights_start]
-                        story_lines = strip_empty_strings(story_lines)
-                        while len(story_lines) > 1 and copyright_line_pattern.search(
-                                story_lines[-1]):
-                            story_lines = strip_empty_strings(story_lines[:-2])
-                        if story_id in stories_requiring_two_extra_newlines:
-                            story_text = '\n\n\n'.join(story_lines)
-                        elif story_id in stories_requiring_extra_newline:
-                            story_text = '\n\n'.join(story_lines)
-                        else:
-                            story_text = '\n'.join(story_lines)
-
-                        story_text = story_text.replace(u'\xe2\x80\xa2', u'\xe2\u20ac\xa2')
-                        story_text = story_text.replace(u'\xe2\x82\xac', u'\xe2\u201a\xac')
-                        story_text = story_text.replace('\r', '\n')
-                        if story_id in stories_to_decode_specially:
-                            story_text = story_text.replace(u'\xe9', u'\xc3\xa9')
-                        story_id_to_text[story_id] = story_text
+    def iter_stories(self):
+        """
+        :return: Lazy views of every story, sorted by story ID.
+        """
+        for story_id in self.story_index:
+            yield self.get_story(story_id)
 
-                        pbar.update()
+    def get_story_text(self, story_id):
+        """
+        :param story_id: The ID of a story in the dataset.
+        :return: The text for the story.
+        """
+        if self._story_texts is not None:
+            result = self._story_texts[story_id]
+            self._clamp_answer_ranges([story_id])
+            return result
+        positions = self.story_index.get_positions(story_id)
+        return self.dataset['story_text'].iat[positions[0]]
+
+    def export_story_corpus(self, path):
+        """
+        Write the text of each story once to a corpus that can be memory-mapped.
 
-                        if len(remaining_story_ids) == 0:
-                            break
+        :param path: The path to write the corpus to. The index is written next to it.
+        """
+        self._logger.info("Writing story corpus to `%s`.", path)
+        write_story_corpus(((story_id, self.get_story_text(story_id))
+                            for story_id in self.story_index),
+                           path)
 
-        for row in tqdm.tqdm(self.dataset.itertuples(),
-                             total=len(self.dataset),
-                             mininterval=2, unit_scale=True, unit=" questions",
-                             desc="Setting story texts"):
-            # Set story_text since we cannot include it in the dataset.
-            story_text = story_id_to_text[row.story_id]
-            self.dataset.at[row.Index, 'story_text'] = story_text
-
-            # Handle endings that are too large.
-            answer_char_ranges = row.answer_char_ranges.split('|')
-            updated_answer_char_ranges = []
-            ranges_updated = False
-            for user_answer_char_ranges in answer_char_ranges:
-                updated_user_answer_char_ranges = []
-                for char_range in user_answer_char_ranges.split(','):
-                    if char_range != 'None':
-                        start, end = map(int, char_range.split(':'))
-                        if end > len(story_text):
-                            ranges_updated = True
-                            end = len(story_text)
-                        if start < end:
-                            updated_user_answer_char_ranges.append('%d:%d' % (start, end))
-                        else:
-                            # It's unclear why but sometimes the end is after the start.
-                            # We'll filter these out.
-                            ranges_updated = True
-                    else:
-                        updated_user_answer_char_ranges.append(char_range)
-                if updated_user_answer_char_ranges:
-                    updated_user_answer_char_ranges = ','.join(updated_user_answer_char_ranges)
-                    updated_answer_char_ranges.append(updated_user_answer_char_ranges)
-            if ranges_updated:
-                updated_answer_char_ranges = '|'.join(updated_answer_char_ranges)
-                self.dataset.at[row.Index, 'answer_char_ranges'] = updated_answer_char_ranges
-
-            if row.validated_answers and not pd.isnull(row.validated_answers):
-                updated_validated_answers = {}
-                validated_answers = json.loads(row.validated_answers)
-                for char_range, count in six.iteritems(validated_answers):
-                    if ':' in char_range:
-                        start, end = map(int, char_range.split(':'))
-                        if end > len(story_text):
-                            ranges_updated = True
-                            end = len(story_text)
-                        if start < end:
-                            char_range = '{}:{}'.format(start, end)
-                            updated_validated_answers[char_range] = count
-                        else:
-                            # It's unclear why but sometimes the end is after the start.
-                            # We'll filter these out.
-                            ranges_updated = True
-                    else:
-                        updated_validated_answers[char_range] = count
-                if ranges_updated:
-                    updated_validated_answers = json.dumps(updated_validated_answers,
-                                                           ensure_ascii=False, separators=(',', ':'))
-                    self.dataset.at[row.Index, 'validated_answers'] = updated_validated_answers
+    def open_story_corpus(self, path):
+        """
+        Get story texts from a memory-mapped corpus instead of keeping them in `dataset`.
+        The `story_text` column is dropped and texts are decoded when they are accessed.
 
-        self._logger.info("Done loading dataset.")
+        Processes that open the same corpus share its memory through the OS page cache.
+
+        :param path: The path of a corpus written by `export_story_corpus`.
+        """
+        self._logger.info("Using story corpus at `%s`.", path)
+        self._story_texts = StoryCorpus(path)
+        columns = list(self.dataset.columns)
+        if 'story_text' in columns:
+            self._story_text_position = columns.index('story_text')
+            del self.dataset['story_text']
+
+    def build_search_index(self, path):
+        """
+        Write an inverted index of the stories and questions and use it for `search`.
+
+        :param path: The folder to write the index to.
+        """
+        self._logger.info("Writing search index to `%s`.", path)
+        get_story_text = None
+        if 'story_text' not in self.dataset.columns:
+            get_story_text = self.get_story_text
+        build_search_index(self.dataset, path, get_story_text)
+        self.open_search_index(path)
+
+    def open_search_index(self, path):
+        """
+        Use an index written by `build_search_index` for `search`.
+        The arrays are memory-mapped so processes that open the same index share them.
+
+        :param path: The folder with the index.
+        """
+        search_index = SearchIndex(path)
+        if search_index.num_rows != len(self.dataset):
+            raise ValueError("The search index at `%s` has %d rows but the dataset has %d."
+                             % (path, search_index.num_rows, len(self.dataset)))
+        self._search_index = search_index
+
+    def search(self, query, field='question'):
+        """
+        Find questions or stories with keywords.
+
+        :param query: Words that must all be in the text (ignoring case),
+            words in double quotes must be consecutive.
+            E.g. `"new delhi" court`.
+        :param field: 'question' to search the questions or 'story' to search the stories.
+        :return: The positions of the matching rows in `dataset`, sorted.
+            For stories, every row for a matching story.
+        :rtype: numpy.ndarray
+        """
+        if self._search_index is None:
+            raise Exception("There is no search index, see `build_search_index`.")
+        return self._search_index.search(query, field)
+
+    def _clamp_answer_ranges(self, story_ids):
+        """
+        Make sure the answer ranges for stories fit in the stories.
+        This is only needed for lazily loaded stories.
+        """
+        if not self._unclamped_story_ids:
+            return
+        story_ids = [story_id for story_id in story_ids
+                     if story_id in self._unclamped_story_ids]
+        if not story_ids:
+            return
+        positions = np.concatenate([self.story_index.get_positions(story_id)
+                                    for story_id in story_ids])
+        story_id_to_text = dict((story_id, self._story_texts[story_id])
+                                for story_id in story_ids)
+        set_story_texts(self.dataset, story_id_to_text, self.dataset.index[positions],
+                        include_text=False)
+        self._unclamped_story_ids.difference_update(story_ids)
+        # The answers might have changed.
+        self._consensus = None
+
+    def _require_clamped_answer_ranges(self):
+        """
+        Make sure every answer range fits in its story.
+        """
+        if self._unclamped_story_ids:
+            if isinstance(self._story_texts, LazyStoryTexts):
+                self._story_texts.prefetch(self._unclamped_story_ids)
+            self._clamp_answer_ranges(list(self._unclamped_story_ids))
+
+    def _require_story_texts(self):
+        """
+        Make sure `dataset` has the `story_text` column.
+        """
+        if 'story_text' in self.dataset.columns:
+            return
+        if self._story_texts is None:
+            raise Exception("The dataset does not have story texts.")
+        if isinstance(self._story_texts, LazyStoryTexts):
+            self._story_texts.prefetch()
+        self._require_clamped_answer_ranges()
+        self._logger.info("Setting story texts in the dataset.")
+        story_texts = dict((story_id, self._story_texts[story_id])
+                           for story_id in self.story_index)
+        position = self._story_text_position
+        if position is None:
+            position = len(self.dataset.columns)
+        values = [story_texts[story_id] for story_id in self.dataset['story_id'].values]
+        if self._compact:
+            values = pd.Categorical(values)
+        self.dataset.insert(position, 'story_text', values)
 
     @staticmethod
-    def load_combined(path):
+    def load_combined(path, include_story_text=True):
         """
-        :param path: The path of data to load.
+        :param path: The path of data to load or a binary file object with it.
+        :param include_story_text: `False` to skip the `story_text` column while reading,
+            e.g. when the texts come from a story corpus.
         :return: A `DataFrame` containing the data from `path`.
         :rtype: pandas.DataFrame
         """
 
         logger = _get_logger()
 
-        logger.info("Loading data from `%s`...", path)
-
-        result = pd.read_csv(path,
-                             encoding='utf-8',
-                             dtype=dict(is_answer_absent=float),
-                             na_values=dict(question=[], story_text=[], validated_answers=[]),
-                             keep_default_na=False)
-
-        if 'story_text' in result.keys():
-            for row in tqdm.tqdm(result.itertuples(),
-                                 total=len(result),
-                                 mininterval=2, unit_scale=True, unit=" questions",
-                                 desc="Adjusting story texts"):
+        logger.info("Loading data from `%s`...", getattr(path, 'name', path))
+
+        with get_metrics().stage('load_combined') as record:
+            if isinstance(path, six.string_types):
+                record.add_bytes_read(get_file_size(path))
+            usecols = None
+            if not include_story_text:
+                usecols = lambda column: column != 'story_text'
+            result = pd.read_csv(path,
+                                 usecols=usecols,
+                                 encoding='utf-8',
+                                 dtype=dict(is_answer_absent=float),
+                                 na_values=dict(question=[], story_text=[], validated_answers=[]),
+                                 keep_default_na=False)
+
+            if 'story_text' in result.keys():
                 # Correct story_text to make indices work right.
-                story_text = row.story_text.replace('\r\n', '\n')
-                result.at[row.Index, 'story_text'] = story_text
+                result['story_text'] = result['story_text'].str.replace('\r\n', '\n',
+                                                                        regex=False)
+            record.rows = len(result)
 
         return result
 
+    @staticmethod
+    def load_zipped(path, filename='newsqa-data-v1.csv'):
+        """
+        Load data straight from a tar.gz file without extracting it.
+        The CSV file is decompressed as it's parsed, nothing is written to disk.
+
+        :param path: The path of the tar.gz file.
+        :param filename: The name of the CSV file in the archive, it can be in any folder.
+        :return: A `DataFrame` containing the data from the CSV file.
+        :rtype: pandas.DataFrame
+        """
+        with get_metrics().stage('load_zipped') as record:
+            record.add_bytes_read(get_file_size(path))
+            with tarfile.open(path, mode='r:gz', encoding='utf-8') as t:
+                for member in t:
+                    if member.isfile() and os.path.basename(member.name) == filename:
+                        _get_logger().info("Loading `%s` from `%s`...", member.name, path)
+                        result = NewsQaDataset.load_combined(t.extractfile(member))
+                        record.rows = len(result)
+                        return result
+        raise Exception("`%s` was not found in `%s`." % (filename, path))
+
     def _get_version(self, path):
         m = re.match(r'^.*-v(([\d.])*\d+).[^.]*$', path)
         if not m:
@@ -255,72 +1012,87 @@ class NewsQaDataset(object):
         return m.group(1)
 
     def _map_answers(self, answers):
-        result = []
-        for a in answers.split('|'):
-            user_answers = []
-            result.append(dict(sourcerAnswers=user_answers))
-            for r in a.split(','):
-                if r == 'None':
-                    user_answers.append(dict(noAnswer=True))
-                else:
-                    s, e = map(int, r.split(':'))
-                    user_answers.append(dict(s=s, e=e))
-        return result
+        return map_answers(answers)
+
+    def get_shareable_columns(self):
+        """
+        :return: The columns of `dataset` that can be shared, i.e. without the stories.
+        :rtype: list
+        """
+        return [column for column in self.dataset.columns
+                if column not in UNSHAREABLE_COLUMNS]
 
-    def export_shareable(self, path, package_path=None):
+    def export_shareable(self, path, package_path=None, workers=None, chunk_size=None):
         """
         Export the dataset without the stories so that it can be shared.
 
-        :param path: The path to write the dataset to.
+        :param path: The path to write the dataset to: CSV or, if it ends with ".jsonl",
+            JSON Lines. The output is gzipped if it ends with ".gz".
         :param package_path: (Optional) If given, the path to write the tar.gz for the website.
+        :param workers: (Optional) The number of threads to compress with.
+        :param chunk_size: (Optional) The number of rows to convert at a time.
         """
+        uncompressed_path = path[:-len('.gz')] if path.endswith('.gz') else path
+        if uncompressed_path.endswith('.json'):
+            raise ValueError("The shareable dataset can only be written as CSV or JSON Lines.")
         self._logger.info("Exporting dataset to %s", path)
-        columns = list(self.dataset.columns.values)
-        columns_to_remove = [
-            'story_title',
-            'story_text',
-            'popular_answer_char_ranges',
-            'popular_answers (for humans to read)',
-        ]
-        for col in columns_to_remove:
-            try:
-                columns.remove(col)
-            except:
-                pass
-        self.dataset.to_csv(path, columns=columns, index=False, encoding='utf-8')
+        columns = self.get_shareable_columns()
+        chunk_size = chunk_size or exporters.DEFAULT_CHUNK_SIZE
+        if uncompressed_path.endswith('.jsonl'):
+            exporters.write_json_lines(self.dataset[columns], path, chunk_size=chunk_size,
+                                       workers=workers)
+        else:
+            exporters.write_csv(self.dataset, path, chunk_size=chunk_size, columns=columns,
+                                workers=workers)
 
         if package_path:
             dirname = os.path.dirname(os.path.abspath(__file__))
             project_root = os.path.dirname(os.path.dirname(dirname))
-            os.chdir(os.path.dirname(package_path))
-            with tarfile.open(os.path.basename(package_path), 'w|gz', encoding='utf-8') as t:
+            with ParallelGzipWriter(package_path, workers=workers) as f, \
+                    tarfile.open(fileobj=f, mode='w|', encoding='utf-8') as t:
                 t.add(os.path.join(project_root, 'README-distribution.md'), arcname='README.md')
                 t.add(os.path.join(project_root, 'LICENSE.txt'), arcname='LICENSE.txt')
                 t.add(path, arcname=os.path.basename(path))
 
-    def dump(self, path):
+    def dump(self, path, split_dir_path=None, workers=None, chunk_size=None):
         """
         Export the combined dataset, with stories, to a file.
 
         :param path: The path to write the dataset to.
+            The output is gzipped if it ends with ".gz", e.g. "combined-newsqa-data-v1.csv.gz".
+        :param split_dir_path: (Optional) The folder with the story ID split files
+            to get the type of data for each story in JSON.
+        :param workers: (Optional) The number of threads to compress with
+            and the number of processes to build JSON with.
+        :param chunk_size: (Optional) The number of rows to convert at a time.
         """
         self._logger.info("Packaging dataset to `%s`.", path)
-        if path.endswith('.json'):
-            data = self.to_dict()
-            # Most reliable way to write UTF-8 JSON as described: https://stackoverflow.com/a/18337754/1226799
-            data = json.dumps(data, ensure_ascii=False, separators=(',', ':'), encoding='utf-8')
-            with io.open(path, 'w', encoding='utf-8') as f:
-                f.write(unicode(data))
-        else:
-            if not path.endswith('.csv'):
-                self._logger.warning("Writing data as CSV to `%s`.", path)
-            # Default for backwards compatibility.
-            self.dataset.to_csv(path, index=False, encoding='utf-8')
+        self._require_story_texts()
+        uncompressed_path = path[:-len('.gz')] if path.endswith('.gz') else path
+        # Only replace `path` once it's complete.
+        with get_metrics().stage('dump', rows=len(self.dataset)) as record, \
+                atomic_output(path) as temp_path:
+            if uncompressed_path.endswith('.json'):
+                data = self.to_dict(split_dir_path, workers=workers,
+                                    chunk_size=chunk_size or DEFAULT_TO_DICT_CHUNK_SIZE)
+                # Most reliable way to write UTF-8 JSON as described: https://stackoverflow.com/a/18337754/1226799
+                data = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+                with open_output(temp_path, workers=workers) as f:
+                    f.write(six.text_type(data).encode('utf-8'))
+            else:
+                if not uncompressed_path.endswith('.csv'):
+                    self._logger.warning("Writing data as CSV to `%s`.", path)
+                # Default for backwards compatibility.
+                exporters.write_csv(self.dataset, temp_path,
+                                    chunk_size=chunk_size or exporters.DEFAULT_CHUNK_SIZE,
+                                    workers=workers)
+            record.add_bytes_written(get_file_size(temp_path))
 
     def get_vocab_len(self):
         """
         :return: Approximate vocabulary size.
         """
+        self._require_story_texts()
         vocab = set()
         for _, row in tqdm.tqdm(self.dataset.iterrows(),
                                 total=len(self.dataset),
@@ -331,6 +1103,7 @@ class NewsQaDataset(object):
         return len(vocab)
 
     def get_answers(self, include_no_answers=False):
+        self._require_story_texts()
         answers = []
         for row in tqdm.tqdm(self.dataset.itertuples(),
                              total=len(self.dataset),
@@ -369,6 +1142,7 @@ class NewsQaDataset(object):
         return lengths
 
     def get_questions_and_answers(self, include_no_answers=False):
+        self._require_story_texts()
 
         qa_map = {}
 
@@ -409,6 +1183,21 @@ class NewsQaDataset(object):
 
         return pd.DataFrame(data=list(qa_map.items()), columns=['question', 'answers'])
 
+    def find_near_duplicate_questions(self, threshold=0.8, per_story=False, **kwargs):
+        """
+        Find clusters of questions that are nearly the same, see `maluuba.newsqa.near_duplicates`.
+
+        :param threshold: The estimated Jaccard similarity of the word n-grams that two
+            questions need to be near-duplicates.
+        :param per_story: `True` to only compare questions about the same story.
+        :param kwargs: Other arguments for `near_duplicates.find_near_duplicates`.
+        :return: A row for each question in a cluster with its `cluster`, the `position` of
+            its row in `dataset`, its `similarity` with the first question of the cluster,
+            its `story_id` and the `question`.
+        :rtype: pandas.DataFrame
+        """
+        return find_near_duplicate_questions(self.dataset, threshold, per_story, **kwargs)
+
     def get_average_answer_length_over_questions(self):
 
         def get_word_count(answer):
@@ -434,31 +1223,23 @@ class NewsQaDataset(object):
             Can be `(None, None)` if it was agreed that there was no answer or it was a bad question.
         :rtype: tuple
         """
-        answer_char_start, answer_char_end = None, None
-        if row.validated_answers:
-            validated_answers = json.loads(row.validated_answers)
-            answer, max_count = max(six.iteritems(validated_answers), key=itemgetter(1))
-            total_count = sum(six.itervalues(validated_answers))
-            if max_count >= total_count / 2.0:
-                if answer != 'none' and answer != 'bad_question':
-                    answer_char_start, answer_char_end = map(int, answer.split(':'))
-                else:
-                    # No valid answer.
-                    pass
-        else:
-            # Check row.answer_char_ranges for most common answer.
-            # No validation was done so there must be an answer with consensus.
-            answers = Counter()
-            for user_answer in row.answer_char_ranges.split('|'):
-                for ans in user_answer.split(','):
-                    answers[ans] += 1
-            top_answer = answers.most_common(1)
-            if top_answer:
-                top_answer, count = top_answer[0]
-                if ':' in top_answer:
-                    answer_char_start, answer_char_end = map(int, top_answer.split(':'))
-
-        return answer_char_start, answer_char_end
+        return get_consensus_answer(row.answer_char_ranges, row.validated_answers)
+
+    def compute_consensus(self):
+        """
+        Get the consensus of every question at once.
+        It's computed on first use and kept until `dataset` is replaced.
+
+        :return: The consensus of each row in `dataset` with the same index:
+            `start` and `end`, -1 when there's no consensus answer,
+            and `status`, one of `consensus.STATUSES`.
+        :rtype: pandas.DataFrame
+        """
+        if self._consensus is None:
+            self._require_clamped_answer_ranges()
+            with get_metrics().stage('compute_consensus', rows=len(self.dataset)):
+                self._consensus = compute_consensus(self.dataset)
+        return self._consensus
 
     def get_question_types(self, num_most_common=6):
         # Note: Would be nice not to make a series and just keep track of the counts
@@ -491,6 +1272,7 @@ class NewsQaDataset(object):
         def get_word_count(story):
             return len(story.split())
 
+        self._require_story_texts()
         de_duped = self.dataset.drop_duplicates(subset='story_id')
         return de_duped['story_text'].apply(get_word_count)
 
@@ -507,7 +1289,44 @@ class NewsQaDataset(object):
             lengths = lengths[lengths <= max_length]
         return lengths
 
+    def validate(self, workers=None, shard_size=DEFAULT_SHARD_SIZE):
+        """
+        Check the integrity of the dataset, see `maluuba.newsqa.validation`.
+
+        :param workers: (Optional) The number of processes to check with.
+            Defaults to the number of CPUs.
+        :param shard_size: The number of rows that each process checks at once.
+        :return: The issues found.
+        :rtype: maluuba.newsqa.validation.ValidationReport
+        """
+        self._require_story_texts()
+        self._require_clamped_answer_ranges()
+        return validate_dataset(self.dataset, workers=workers, shard_size=shard_size)
+
+    def evaluate(self, predictions, span_type=CHAR, workers=None):
+        """
+        Score predictions with exact match and F1, see `maluuba.newsqa.evaluation`.
+
+        :param predictions: A prediction for each row of `dataset`: an answer,
+            a `(start, end)` range or `None` for no answer, see `evaluation.evaluate`.
+        :param span_type: How `(start, end)` predictions index the story:
+            `'char'` or `'token'`.
+        :param workers: (Optional) The number of processes to score with.
+            Defaults to the number of CPUs.
+        :return: The scores for each question.
+        :rtype: maluuba.newsqa.evaluation.EvaluationReport
+        """
+        self._require_story_texts()
+        self._require_clamped_answer_ranges()
+        consensus = None
+        if 'answer_token_ranges' not in self.dataset.columns:
+            # The cached consensus is for the character ranges.
+            consensus = self.compute_consensus()
+        return evaluate(self.dataset, predictions, span_type=span_type, workers=workers,
+                        consensus=consensus)
+
     def get_questions_without_answers(self):
+        self._require_clamped_answer_ranges()
         questions_without_answers = []
         for index, row in self.dataset.iterrows():
             if not pd.isnull(row['question']) \
@@ -518,141 +1337,155 @@ class NewsQaDataset(object):
 
         return questions_without_answers
 
-    def save_dataset_as_json_by_columns(self, path, n_entries=None):
+    def _head(self, n_entries=None):
+        self._require_story_texts()
         if not n_entries or n_entries > len(self.dataset):
-            df = self.dataset
-        else:
-            df = self.dataset.head(n_entries)
+            return self.dataset
+        return self.dataset.head(n_entries)
 
-        res = df.to_json(path, force_ascii=False)
+    def save_dataset_as_json_by_columns(self, path, n_entries=None, compress=None, workers=None):
+        exporters.write_json_by_columns(self._head(n_entries), path,
+                                        compress=compress, workers=workers)
 
-        return res
+    def save_dataset_as_json_by_rows(self, path, n_entries=None, chunk_size=None, compress=None,
+                                     workers=None):
+        exporters.write_json_by_rows(self._head(n_entries), path,
+                                     chunk_size=chunk_size or exporters.DEFAULT_CHUNK_SIZE,
+                                     compress=compress, workers=workers)
 
-    def save_dataset_as_json_by_rows(self, path, n_entries=None):
-        if not n_entries or n_entries > len(self.dataset):
-            df = self.dataset
-        else:
-            df = self.dataset.head(n_entries)
+    def save_dataset_as_json_lines(self, path, n_entries=None, chunk_size=None, compress=None,
+                                   workers=None):
+        """
+        Stream the dataset to a JSON Lines file, one row per line.
 
-        data_dict = {}
-        for index, row in df.iterrows():
-            data_dict[str(index)] = dict(row)
+        :param path: The path to write to. The output is gzipped if it ends with ".gz".
+        :param n_entries: (Optional) The number of rows to write. By default, all rows are written.
+        :param chunk_size: (Optional) The number of rows to convert at a time.
+        :param compress: (Optional) `True` or `False` to override gzipping based on `path`.
+        :param workers: (Optional) The number of threads to compress with.
+        """
+        self._logger.info("Writing JSON Lines to `%s`.", path)
+        exporters.write_json_lines(self._head(n_entries), path,
+                                   chunk_size=chunk_size or exporters.DEFAULT_CHUNK_SIZE,
+                                   compress=compress, workers=workers)
 
-        with codecs.open(path, 'w', encoding="utf-8") as f:
-            json.dump(data_dict, f, ensure_ascii=False)
+    def save_dataset_as_csv(self, path, n_entries=None, chunk_size=None, compress=None,
+                            workers=None):
+        """
+        Stream the dataset to a CSV file.
+
+        :param path: The path to write to. The output is gzipped if it ends with ".gz".
+        :param n_entries: (Optional) The number of rows to write. By default, all rows are written.
+        :param chunk_size: (Optional) The number of rows to convert at a time.
+        :param compress: (Optional) `True` or `False` to override gzipping based on `path`.
+        :param workers: (Optional) The number of threads to compress with.
+        """
+        self._logger.info("Writing CSV to `%s`.", path)
+        exporters.write_csv(self._head(n_entries), path,
+                            chunk_size=chunk_size or exporters.DEFAULT_CHUNK_SIZE,
+                            compress=compress, workers=workers)
 
     def get_all_qas_for_story_ids(self, story_ids=None, n_stories=-1, include_no_answers=False):
+        """
+        :param story_ids: (Optional) The stories to get. By default, all stories are used.
+        :param n_stories: (Optional) The maximum number of stories to get.
+        :param include_no_answers: `True` to keep answers marked as "None".
+        :return: The title, text and question-answer pairs for each story, by story ID.
+        :rtype: dict
+        """
+        story_index = self.story_index
+        if story_ids:
+            # Only look up the requested stories instead of scanning every story.
+            story_ids = sorted(story_id for story_id in set(story_ids) if story_id in story_index)
+        else:
+            story_ids = story_index
+        if n_stories >= 0:
+            story_ids = itertools.islice(story_ids, n_stories)
 
         data = {}
-        for story_id, matching_df in self.dataset.groupby('story_id'):
-
-            if story_ids and not story_id in story_ids:
-                continue
-            if n_stories >= 0 and len(data.keys()) >= n_stories:
-                break
-
-            entry = {}
-            for _, row in matching_df.iterrows():
-
-                # Initialization case
-                if 'story_text' not in entry:
-                    # Note: there are no titles in the dataset.
-                    entry['story_title'] = row['story_title']
-                    entry['story_text'] = row['story_text']
-                    entry['qa_pairs'] = []
-
-                # Prefer validated answers; if none fallback to regular ones
-                answers = []
-                if not pd.isnull(row['validated_answers']):
-                    validated_answers_dict = json.loads(row['validated_answers'])
-                    answers += validated_answers_dict.keys()
-
-                else:
-                    answers_split = row['answer_char_ranges'].split("|")
-                    for answer in answers_split:
-                        if answer not in answers:
-                            answers.append(answer)
-
-                if not include_no_answers:
-                    answers = [a for a in answers if a.lower() != "none"]
-
-                entry['qa_pairs'].append(
-                    {'question': row['question'], 'answers': "|".join(answers)})
-
-            data[story_id] = entry
+        for story_id in story_ids:
+            story = self.get_story(story_id)
+            data[story_id] = dict(story_title=story.title,
+                                  story_text=story.text,
+                                  qa_pairs=story.get_qa_pairs(include_no_answers))
 
         return data
 
-    def to_dict(self):
+    def to_dict(self, split_dir_path=None, workers=None, chunk_size=DEFAULT_TO_DICT_CHUNK_SIZE):
         """
+        Stories are split into chunks that are converted by a pool of processes.
+
+        :param split_dir_path: (Optional) The folder with the story ID split files
+            to get the type of data for each story.
+        :param workers: (Optional) The number of processes. Defaults to the number of CPUs.
+        :param chunk_size: The number of rows for a process to convert at a time.
         :return: The data in a `dict`.
         :rtype: dict
         """
+        self._require_story_texts()
+        story_id_to_split = get_story_id_to_split(split_dir_path)
+        dataset = self.dataset
+        consensus = self.compute_consensus()
+        # Plain floats for JSON, NaN for questions without a rating ('?').
+        rows = list(zip(
+            dataset['question'].tolist(),
+            dataset['answer_char_ranges'].tolist(),
+            dataset['is_answer_absent'].values.astype(np.float64).tolist(),
+            pd.to_numeric(dataset['is_question_bad'], errors='coerce')
+            .values.astype(np.float64).tolist(),
+            dataset['validated_answers'].tolist(),
+            consensus['start'].tolist(),
+            consensus['end'].tolist(),
+            consensus['status'].tolist()))
+        story_texts = dataset['story_text'].values
+        # In the order that they first appear.
+        story_ids = list(pd.unique(dataset['story_id']))
+        story_index = self.story_index
+
+        def _get_chunks():
+            chunk_story_ids, chunk = [], []
+            num_rows = 0
+            for story_id in story_ids:
+                positions = story_index.get_positions(story_id)
+                chunk_story_ids.append(story_id)
+                chunk.append([rows[position] for position in positions])
+                num_rows += len(positions)
+                if num_rows >= chunk_size:
+                    yield chunk_story_ids, chunk
+                    chunk_story_ids, chunk = [], []
+                    num_rows = 0
+            if chunk:
+                yield chunk_story_ids, chunk
+
+        def _get_datum(story_id, questions):
+            data_type = story_id_to_split.get(story_id)
+            if data_type is None:
+                data_type = ValueError("{} not found in any story ID set.".format(story_id))
+            text = story_texts[story_index.get_positions(story_id)[0]]
+            return dict(storyId=story_id, type=data_type, text=text, questions=questions)
+
+        workers = workers or multiprocessing.cpu_count()
         data = []
-        cache = dict()
-
-        dir_name = os.path.dirname(os.path.abspath(__file__))
-
-        train_story_ids = set(
-            pd.read_csv(os.path.join(dir_name, 'train_story_ids.csv'))['story_id'].values)
-        dev_story_ids = set(
-            pd.read_csv(os.path.join(dir_name, 'dev_story_ids.csv'))['story_id'].values)
-        test_story_ids = set(
-            pd.read_csv(os.path.join(dir_name, 'test_story_ids.csv'))['story_id'].values)
-
-        def _get_data_type(story_id):
-            if story_id in train_story_ids:
-                return 'train'
-            elif story_id in dev_story_ids:
-                return 'dev'
-            elif story_id in test_story_ids:
-                return 'test'
+        with get_metrics().stage('to_dict', rows=len(dataset)) as record, \
+                tqdm.tqdm(total=len(dataset), mininterval=2, unit_scale=True, unit=" questions",
+                          desc="Building json") as progress:
+            chunks = list(_get_chunks())
+            pool = None
+            if workers > 1 and len(chunks) > 1:
+                pool = multiprocessing.Pool(min(workers, len(chunks)))
+                results = pool.imap(_build_stories_questions, [chunk for _, chunk in chunks])
             else:
-                return ValueError("{} not found in any story ID set.".format(story_id))
-
-        for row in tqdm.tqdm(self.dataset.itertuples(),
-                             total=len(self.dataset),
-                             mininterval=2, unit_scale=True, unit=" questions",
-                             desc="Building json"):
-            questions = cache.get(row.story_id)
-            if questions is None:
-                questions = []
-                datum = dict(storyId=row.story_id,
-                             type=_get_data_type(row.story_id),
-                             text=row.story_text,
-                             questions=questions)
-                cache[row.story_id] = questions
-                data.append(datum)
-            q = dict(
-                q=row.question,
-                answers=self._map_answers(row.answer_char_ranges),
-                isAnswerAbsent=row.is_answer_absent,
-            )
-            if row.is_question_bad != '?':
-                q['isQuestionBad'] = float(row.is_question_bad)
-            if row.validated_answers and not pd.isnull(row.validated_answers):
-                validated_answers = json.loads(row.validated_answers)
-                q['validatedAnswers'] = []
-                for answer, count in six.iteritems(validated_answers):
-                    answer_item = dict(count=count)
-                    if answer == 'none':
-                        answer_item['noAnswer'] = True
-                    elif answer == 'bad_question':
-                        answer_item['badQuestion'] = True
-                    else:
-                        s, e = map(int, answer.split(':'))
-                        answer_item['s'] = s
-                        answer_item['e'] = e
-                    q['validatedAnswers'].append(answer_item)
-            consensus_start, consensus_end = self.get_consensus_answer(row)
-            if consensus_start is None and consensus_end is None:
-                if q.get('isQuestionBad', 0) >= 0.5:
-                    q['consensus'] = dict(badQuestion=True)
-                else:
-                    q['consensus'] = dict(noAnswer=True)
-            else:
-                q['consensus'] = dict(s=consensus_start, e=consensus_end)
-            questions.append(q)
+                results = six.moves.map(_build_stories_questions, [chunk for _, chunk in chunks])
+            try:
+                for (chunk_story_ids, _), stories_questions in zip(chunks, results):
+                    for story_id, questions in zip(chunk_story_ids, stories_questions):
+                        data.append(_get_datum(story_id, questions))
+                        progress.update(len(questions))
+            finally:
+                if pool is not None:
+                    pool.terminate()
+                    pool.join()
+            record.stories = len(data)
 
         data = dict(data=data, version=self.version)
         return data
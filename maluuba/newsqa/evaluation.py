@@ -0,0 +1,376 @@
+"""
+Score answer predictions with exact match (EM) and token-level F1 like SQuAD.
+
+Answers are normalized before comparing them: they're lowercased and punctuation, articles
+("a", "an", "the") and extra whitespace are removed.
+Predicting no answer is an empty answer, it only matches questions without an answer.
+
+Each prediction is scored against:
+
+* The consensus answer (`exact_match` and `f1`), see `consensus.compute_consensus`.
+* Every answer of the crowdsourcers and validators (`exact_match_all` and `f1_all`),
+  the best score is kept.
+
+For the tokenized data, the answers are the ranges in `answer_token_ranges` since the
+character ranges are for the original text. The consensus is the most common range.
+
+    from maluuba.newsqa.data_processing import NewsQaDataset
+
+    newsqa_dataset = NewsQaDataset()
+    # A prediction for each row: an answer, a `(start, end)` character range or `None`.
+    report = newsqa_dataset.evaluate(predictions)
+    print(report.summary())
+    print(report.by_question_type())
+"""
+import logging
+import multiprocessing
+import re
+import string
+from collections import Counter, OrderedDict
+
+import numpy as np
+import pandas as pd
+import six
+
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    from maluuba.newsqa.consensus import compute_consensus
+    from maluuba.newsqa.metrics import get_metrics
+except:
+    # In case you're running this file from this folder.
+    from consensus import compute_consensus
+    from metrics import get_metrics
+
+# The number of rows that each process scores at once.
+DEFAULT_SHARD_SIZE = 20000
+
+# How `(start, end)` predictions index the story.
+CHAR = 'char'
+TOKEN = 'token'
+SPAN_TYPES = [CHAR, TOKEN]
+
+SCORE_COLUMNS = ['exact_match', 'f1', 'exact_match_all', 'f1_all']
+
+_ARTICLES_PATTERN = re.compile(r'\b(a|an|the)\b', re.UNICODE)
+_PUNCTUATION_TRANSLATION = dict((ord(c), None) for c in string.punctuation)
+# A key of `validated_answers`, keys can't have quotes.
+_VALIDATED_ANSWER_PATTERN = re.compile(r'"([^"]*)"\s*:')
+
+logger = logging.getLogger('newsqa')
+
+
+def normalize_answer(answer):
+    """
+    :param answer: An answer.
+    :return: The answer lowercased without punctuation, articles and extra whitespace.
+    :rtype: str
+    """
+    answer = six.text_type(answer).lower().translate(_PUNCTUATION_TRANSLATION)
+    return u' '.join(_ARTICLES_PATTERN.sub(u' ', answer).split())
+
+
+def get_f1(prediction_tokens, answer_tokens):
+    """
+    :param prediction_tokens: The tokens of a normalized prediction.
+    :param answer_tokens: The tokens of a normalized answer.
+    :return: The F1 of the tokens in common.
+    :rtype: float
+    """
+    if not prediction_tokens or not answer_tokens:
+        # No answer only matches no answer.
+        return float(prediction_tokens == answer_tokens)
+    num_same = sum((Counter(prediction_tokens) & Counter(answer_tokens)).values())
+    if num_same == 0:
+        return 0.0
+    precision = num_same / float(len(prediction_tokens))
+    recall = num_same / float(len(answer_tokens))
+    return 2 * precision * recall / (precision + recall)
+
+
+def _score_shard(shard):
+    """
+    :param shard: The predictions, consensus answers and all of the answers of some rows.
+    :return: The scores of each row in the order of `SCORE_COLUMNS`.
+    :rtype: numpy.ndarray
+    """
+    predictions, consensus_answers, all_answers = shard
+    # Many rows have the same answers so each distinct answer is only normalized once.
+    normalized = dict()
+
+    def _normalize(answer):
+        result = normalized.get(answer)
+        if result is None:
+            result = normalized[answer] = normalize_answer(answer).split()
+        return result
+
+    scores = np.zeros((len(predictions), len(SCORE_COLUMNS)), dtype=np.float64)
+    for i, (prediction, consensus_answer, answers) in enumerate(
+            six.moves.zip(predictions, consensus_answers, all_answers)):
+        prediction = _normalize(prediction)
+        consensus_answer = _normalize(consensus_answer)
+        scores[i, 0] = prediction == consensus_answer
+        scores[i, 1] = get_f1(prediction, consensus_answer)
+        for answer in answers:
+            answer = _normalize(answer)
+            if prediction == answer:
+                scores[i, 2] = scores[i, 3] = 1.0
+                break
+            scores[i, 3] = max(scores[i, 3], get_f1(prediction, answer))
+    return scores
+
+
+def _parse_ranges(text):
+    """
+    :return: The answers in `answer_char_ranges` or `answer_token_ranges`,
+        `None` for no answer.
+    """
+    result = []
+    for user in text.split('|'):
+        for answer in user.split(','):
+            if ':' in answer:
+                start, end = map(int, answer.split(':'))
+                result.append(None if start < 0 else (start, end))
+            elif answer:
+                result.append(None)
+    return result
+
+
+def _parse_validated_answers(text):
+    """
+    :return: The answers in `validated_answers`, `None` for no answer or a bad question.
+    """
+    # Faster than `json.loads`.
+    result = []
+    for answer in _VALIDATED_ANSWER_PATTERN.findall(text):
+        if ':' in answer:
+            result.append(tuple(map(int, answer.split(':'))))
+        else:
+            result.append(None)
+    return result
+
+
+class _StoryTokens(object):
+    """
+    The tokens of each tokenized story, split on first use.
+    """
+
+    def __init__(self):
+        self._story_id = None
+        self._tokens = None
+
+    def get(self, story_id, story_text):
+        # Rows of a story are usually next to each other.
+        if story_id != self._story_id:
+            self._story_id = story_id
+            self._tokens = story_text.split(' ')
+        return self._tokens
+
+
+def _get_text(answer, span_type, story_id, story_text, story_tokens):
+    """
+    :return: The text of an answer, a range is looked up in the story.
+    """
+    if answer is None:
+        return u''
+    if not isinstance(answer, (tuple, list)):
+        return answer
+    start, end = answer
+    if start < 0:
+        return u''
+    if span_type == TOKEN:
+        return u' '.join(story_tokens.get(story_id, story_text)[start:end])
+    return story_text[start:end]
+
+
+def _get_predictions(dataset, predictions):
+    """
+    :return: The prediction for each row of `dataset`, `None` for no answer.
+    """
+    if isinstance(predictions, pd.DataFrame):
+        predictions = predictions.reindex(dataset.index)
+        starts = predictions['start'].fillna(-1).astype(np.int64).tolist()
+        ends = predictions['end'].fillna(-1).astype(np.int64).tolist()
+        return [(start, end) if start >= 0 else None for start, end in zip(starts, ends)]
+    if isinstance(predictions, pd.Series):
+        predictions = predictions.reindex(dataset.index)
+        predictions = predictions.astype(object).where(predictions.notnull(), None).tolist()
+    elif isinstance(predictions, dict):
+        predictions = [predictions.get(index) for index in dataset.index]
+    else:
+        predictions = list(predictions)
+    if len(predictions) != len(dataset):
+        raise ValueError("Got %d predictions for %d rows." % (len(predictions), len(dataset)))
+    return predictions
+
+
+def get_question_types(questions):
+    """
+    :param questions: The questions.
+    :return: The type of each question: its first word lowercased.
+    :rtype: list
+    """
+    result = []
+    for question in questions:
+        split = question.split(None, 1) if isinstance(question, six.string_types) else None
+        result.append(split[0].lower() if split else u'')
+    return result
+
+
+class EvaluationReport(object):
+    """
+    The scores of the predictions for each question.
+    """
+
+    def __init__(self, scores):
+        """
+        :param scores: The scores of each row (see `SCORE_COLUMNS`) and its `question_type`.
+        """
+        self.scores = scores
+
+    def __len__(self):
+        return len(self.scores)
+
+    def get_totals(self):
+        """
+        :return: The average of each score as a percentage.
+        :rtype: collections.OrderedDict
+        """
+        return OrderedDict((column, 100.0 * self.scores[column].mean() if len(self) else 0.0)
+                           for column in SCORE_COLUMNS)
+
+    def by_question_type(self, num_most_common=6):
+        """
+        :param num_most_common: The number of most common question types to show,
+            the others are counted as "*other".
+        :return: The number of questions of each type and the average of each score as a
+            percentage, with a "*total" row for all of the questions.
+        :rtype: pandas.DataFrame
+        """
+        question_types = self.scores['question_type']
+        most_common = question_types.value_counts().index[:num_most_common]
+        question_types = question_types.where(question_types.isin(most_common), '*other')
+        grouped = self.scores[SCORE_COLUMNS].groupby(question_types.values)
+        result = grouped.mean() * 100.0
+        result.insert(0, 'count', grouped.size())
+        result = result.sort_values('count', ascending=False)
+        total = pd.DataFrame([[len(self)] + list(self.get_totals().values())],
+                             columns=result.columns, index=['*total'])
+        result = pd.concat([result, total])
+        result.index.name = 'question_type'
+        return result
+
+    def to_dict(self):
+        """
+        :return: The number of questions and the average scores as percentages for JSON.
+        :rtype: dict
+        """
+        result = dict(self.get_totals())
+        result['num_questions'] = len(self)
+        return result
+
+    def summary(self):
+        """
+        :return: The number of questions and the average scores.
+        :rtype: str
+        """
+        totals = self.get_totals()
+        return ("Questions: %d\n"
+                "Consensus answer: EM %.2f F1 %.2f\n"
+                "Any answer: EM %.2f F1 %.2f"
+                % (len(self), totals['exact_match'], totals['f1'],
+                   totals['exact_match_all'], totals['f1_all']))
+
+
+def evaluate(dataset, predictions, span_type=CHAR, workers=None, shard_size=DEFAULT_SHARD_SIZE,
+             consensus=None):
+    """
+    Score predictions for the questions of a dataset.
+
+    :param dataset: The combined or tokenized dataset with the `story_text` column,
+        e.g. `NewsQaDataset.dataset`.
+    :param predictions: A prediction for each row of `dataset`: an answer, a `(start, end)`
+        range or `None` for no answer.
+        It can be a list in the order of the rows, a `dict` or a `pandas.Series` by index or a
+        `pandas.DataFrame` by index with `start` and `end` columns where -1 means no answer.
+    :param span_type: How `(start, end)` predictions index the story, one of `SPAN_TYPES`.
+        Tokens are separated by spaces in the tokenized data.
+    :param workers: (Optional) The number of processes to score with.
+        Defaults to the number of CPUs.
+    :param shard_size: The number of rows that each process scores at once.
+    :param consensus: (Optional) The consensus of each row of `dataset` from
+        `consensus.compute_consensus`, e.g. `NewsQaDataset.compute_consensus()`.
+        By default, it's computed. Ignored for the tokenized data.
+    :return: The scores for each question.
+    :rtype: EvaluationReport
+    """
+    if span_type not in SPAN_TYPES:
+        raise ValueError("Unknown span type: %r." % span_type)
+    if 'story_text' not in dataset.columns:
+        raise ValueError("The dataset does not have story texts.")
+    predictions = _get_predictions(dataset, predictions)
+    is_tokenized = 'answer_token_ranges' in dataset.columns
+    workers = workers or multiprocessing.cpu_count()
+    with get_metrics().stage('evaluate', rows=len(dataset)):
+        story_ids = dataset['story_id'].tolist()
+        story_texts = dataset['story_text'].tolist()
+        if is_tokenized:
+            ranges_column = 'answer_token_ranges'
+            consensus = compute_consensus(pd.DataFrame(
+                dict(answer_char_ranges=dataset[ranges_column].values), index=dataset.index))
+        else:
+            ranges_column = 'answer_char_ranges'
+            if consensus is None:
+                consensus = compute_consensus(dataset)
+            elif len(consensus) != len(dataset):
+                raise ValueError("Got the consensus of %d rows for %d rows."
+                                 % (len(consensus), len(dataset)))
+        answer_ranges = dataset[ranges_column].fillna('').astype(six.text_type).tolist()
+        if is_tokenized or 'validated_answers' not in dataset.columns:
+            validated_answers = [''] * len(dataset)
+        else:
+            validated_answers = dataset['validated_answers'].fillna('') \
+                .astype(six.text_type).tolist()
+
+        # Get the text of the answers here so that the stories aren't sent to each process.
+        story_tokens = _StoryTokens()
+        gold_span_type = TOKEN if is_tokenized else CHAR
+        prediction_texts = []
+        consensus_texts = []
+        all_answer_texts = []
+        for story_id, story_text, prediction, start, end, ranges, validated in six.moves.zip(
+                story_ids, story_texts, predictions, consensus['start'].tolist(),
+                consensus['end'].tolist(), answer_ranges, validated_answers):
+            prediction_texts.append(
+                _get_text(prediction, span_type, story_id, story_text, story_tokens))
+            consensus_texts.append(
+                _get_text((start, end), gold_span_type, story_id, story_text, story_tokens))
+            answers = _parse_ranges(ranges)
+            if validated:
+                answers.extend(_parse_validated_answers(validated))
+            all_answer_texts.append(list(set(
+                _get_text(answer, gold_span_type, story_id, story_text, story_tokens)
+                for answer in answers)) or [u''])
+
+        shards = [(prediction_texts[start:start + shard_size],
+                   consensus_texts[start:start + shard_size],
+                   all_answer_texts[start:start + shard_size])
+                  for start in six.moves.range(0, len(dataset), shard_size)]
+        if workers <= 1 or len(shards) <= 1:
+            results = [_score_shard(shard) for shard in shards]
+        else:
+            pool = multiprocessing.Pool(min(workers, len(shards)))
+            try:
+                results = pool.map(_score_shard, shards, chunksize=1)
+            finally:
+                pool.terminate()
+                pool.join()
+    if results:
+        scores = np.concatenate(results)
+    else:
+        scores = np.zeros((0, len(SCORE_COLUMNS)), dtype=np.float64)
+    scores = pd.DataFrame(scores, index=dataset.index, columns=SCORE_COLUMNS)
+    scores.insert(0, 'question_type', get_question_types(dataset['question'].tolist()))
+    report = EvaluationReport(scores)
+    logger.info("Evaluated %d predictions.", len(report))
+    return report
@@ -0,0 +1,131 @@
+"""
+Streaming exporters for the dataset.
+
+Rows are converted and written a chunk at a time so that the memory used doesn't grow with the
+size of the dataset.
+When the output is gzipped, chunks are compressed in parallel (see `compression`).
+"""
+import json
+
+import six
+
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    from maluuba.newsqa.compression import open_output
+except:
+    # In case you're running this file from this folder.
+    from compression import open_output
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def iter_chunks(df, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    :param df: The `DataFrame` to split.
+    :param chunk_size: The maximum number of rows in each chunk.
+    :return: Consecutive slices of `df`.
+    """
+    for start in six.moves.range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def _to_bytes(text):
+    if isinstance(text, six.text_type):
+        return text.encode('utf-8')
+    return text
+
+
+def _json_default(value):
+    # NumPy scalars.
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError("%r is not JSON serializable" % (value,))
+
+
+def write_json_lines(df, path, chunk_size=DEFAULT_CHUNK_SIZE, compress=None, workers=None):
+    """
+    Write one JSON object per row.
+
+    :param df: The `DataFrame` to write.
+    :param path: The path to write to.
+    :param chunk_size: The number of rows to convert at a time.
+    :param compress: (Optional) `True` to gzip the output.
+        By default, the output is gzipped when `path` ends with ".gz".
+    :param workers: (Optional) The number of compression threads.
+    """
+    with open_output(path, compress=compress, workers=workers) as f:
+        for chunk in iter_chunks(df, chunk_size):
+            text = chunk.to_json(orient='records', lines=True, force_ascii=False)
+            if not text.endswith('\n'):
+                text += '\n'
+            f.write(_to_bytes(text))
+
+
+def write_csv(df, path, chunk_size=DEFAULT_CHUNK_SIZE, compress=None, workers=None,
+              columns=None):
+    """
+    Write the rows as CSV, the same way as `df.to_csv(path, index=False)`.
+
+    :param df: The `DataFrame` to write.
+    :param path: The path to write to.
+    :param chunk_size: The number of rows to convert at a time.
+    :param compress: (Optional) `True` to gzip the output.
+        By default, the output is gzipped when `path` ends with ".gz".
+    :param workers: (Optional) The number of compression threads.
+    :param columns: (Optional) The columns to write.
+    """
+    with open_output(path, compress=compress, workers=workers) as f:
+        if len(df) == 0:
+            f.write(_to_bytes(df.to_csv(index=False, columns=columns)))
+        for i, chunk in enumerate(iter_chunks(df, chunk_size)):
+            f.write(_to_bytes(chunk.to_csv(index=False, header=i == 0, columns=columns)))
+
+
+def write_json_by_rows(df, path, chunk_size=DEFAULT_CHUNK_SIZE, compress=None, workers=None):
+    """
+    Write the rows as one JSON object keyed by the row index.
+
+    :param df: The `DataFrame` to write.
+    :param path: The path to write to.
+    :param chunk_size: The number of rows to convert at a time.
+    :param compress: (Optional) `True` to gzip the output.
+        By default, the output is gzipped when `path` ends with ".gz".
+    :param workers: (Optional) The number of compression threads.
+    """
+    columns = list(df.columns)
+    separator = u''
+    with open_output(path, compress=compress, workers=workers) as f:
+        f.write(b'{')
+        for chunk in iter_chunks(df, chunk_size):
+            items = []
+            for row in chunk.itertuples():
+                items.append(u'%s: %s' % (
+                    json.dumps(str(row[0])),
+                    json.dumps(dict(zip(columns, row[1:])),
+                               ensure_ascii=False, default=_json_default)))
+            if items:
+                f.write(_to_bytes(separator + u', '.join(items)))
+                separator = u', '
+        f.write(b'}')
+
+
+def write_json_by_columns(df, path, compress=None, workers=None):
+    """
+    Write the data as one JSON object per column, the same way as `df.to_json(path)`.
+    Only one column is converted at a time.
+
+    :param df: The `DataFrame` to write.
+    :param path: The path to write to.
+    :param compress: (Optional) `True` to gzip the output.
+        By default, the output is gzipped when `path` ends with ".gz".
+    :param workers: (Optional) The number of compression threads.
+    """
+    with open_output(path, compress=compress, workers=workers) as f:
+        f.write(b'{')
+        for i, column in enumerate(df.columns):
+            if i > 0:
+                f.write(b',')
+            f.write(_to_bytes(u'%s:' % json.dumps(six.text_type(column), ensure_ascii=False)))
+            f.write(_to_bytes(df[column].to_json(force_ascii=False)))
+        f.write(b'}')
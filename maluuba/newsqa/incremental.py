@@ -0,0 +1,304 @@
+"""
+Add new or changed questions to an already built dataset without rebuilding it.
+
+A delta is a CSV file with the same columns as `newsqa-data-v1.csv`.
+Rows are matched to the built dataset by story ID and question.
+Only the stories that aren't in the built dataset are read from `cnn_stories.tgz`,
+only the rows in the delta are tokenized and the new rows are appended to the
+combined, tokenized and split files.
+Changed rows are replaced where they are, which requires rewriting the files.
+Every file is written to a temporary path next to it and they're only renamed once every stage
+is done, so if a stage fails, the built dataset is left as it was.
+"""
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    from maluuba.newsqa.checkpoints import get_temp_path, replace_file
+    from maluuba.newsqa.data_processing import NewsQaDataset, load_story_texts, set_story_texts
+    from maluuba.newsqa.metrics import get_metrics
+    from maluuba.newsqa.split_dataset import split_rows, write_rows
+    from maluuba.newsqa.story_corpus import StoryCorpus, add_to_story_corpus, \
+        get_story_corpus_paths
+    from maluuba.newsqa.tokenize_dataset import tokenize_data
+except:
+    # In case you're running this file from this folder.
+    from checkpoints import get_temp_path, replace_file
+    from data_processing import NewsQaDataset, load_story_texts, set_story_texts
+    from metrics import get_metrics
+    from split_dataset import split_rows, write_rows
+    from story_corpus import StoryCorpus, add_to_story_corpus, get_story_corpus_paths
+    from tokenize_dataset import tokenize_data
+
+KEY_COLUMNS = ['story_id', 'question']
+
+_SPLIT_DATA_TYPES = ('train', 'dev', 'test')
+
+logger = logging.getLogger('newsqa')
+
+
+def _read_columns(path, columns, chunksize=None):
+    return pd.read_csv(path, usecols=columns, chunksize=chunksize,
+                       encoding='utf-8',
+                       na_values=dict(question=[], story_text=[]),
+                       keep_default_na=False)
+
+
+def _get_header(path):
+    return list(pd.read_csv(path, nrows=0, encoding='utf-8').columns)
+
+
+def _get_keys(dataset):
+    return list(zip(dataset['story_id'].values, dataset['question'].values))
+
+
+def _read_built_story_texts(combined_data_path, story_ids, story_corpus_path=None):
+    """
+    :return: The texts of stories that are already in the built dataset.
+    """
+    result = {}
+    if not story_ids:
+        return result
+    if story_corpus_path:
+        corpus = StoryCorpus(story_corpus_path)
+        for story_id in story_ids:
+            story_text = corpus.get(story_id)
+            if story_text is not None:
+                result[story_id] = story_text
+        corpus.close()
+    remaining_story_ids = set(story_ids) - set(result)
+    if remaining_story_ids:
+        # Only read the columns needed.
+        for chunk in _read_columns(combined_data_path, ['story_id', 'story_text'],
+                                   chunksize=10000):
+            for story_id, story_text in zip(chunk['story_id'].values,
+                                            chunk['story_text'].values):
+                if story_id in remaining_story_ids:
+                    remaining_story_ids.remove(story_id)
+                    # Same correction as in `NewsQaDataset.load_combined`.
+                    result[story_id] = story_text.replace('\r\n', '\n')
+            if not remaining_story_ids:
+                break
+    return result
+
+
+class _Outputs(object):
+    """
+    Files that are written to temporary paths and renamed to their paths once they're all done.
+    """
+
+    def __init__(self):
+        self._paths = []
+
+    def add(self, temp_path, path):
+        """
+        :param temp_path: The temporary path that a file is written to.
+        :param path: The path to rename it to.
+        """
+        self._paths.append((temp_path, path))
+
+    def get_path(self, path, copy=False):
+        """
+        :param path: The path of a file to update.
+        :param copy: `True` to start with a copy of the file, e.g. to append to it.
+        :return: The temporary path to write to instead of `path`.
+        """
+        temp_path = get_temp_path(path)
+        self.add(temp_path, path)
+        if copy:
+            shutil.copyfile(path, temp_path)
+        return temp_path
+
+    def replace(self):
+        """
+        Rename each temporary file to its path, in the order that they were added.
+        """
+        while self._paths:
+            temp_path, path = self._paths.pop(0)
+            replace_file(temp_path, path)
+
+    def remove(self):
+        """
+        Remove the temporary files that weren't renamed.
+        """
+        for temp_path, _ in self._paths:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._paths = []
+
+
+def _update_file(path, delta, positions, is_changed, outputs):
+    """
+    Add the new rows of `delta` to the end of the file at `path` and replace the changed ones.
+    The updated file is written to a temporary path from `outputs`.
+
+    :return: The whole updated dataset if it had to be loaded, otherwise `None`.
+    """
+    header = _get_header(path)
+    delta = delta[header]
+    new_rows = delta[~is_changed]
+    changed_rows = delta[is_changed]
+    if len(changed_rows) > 0:
+        logger.info("Replacing %d rows in `%s`.", len(changed_rows), path)
+        result = NewsQaDataset.load_combined(path)
+        if len(result) <= max(positions):
+            raise Exception("`%s` does not match the combined dataset." % path)
+        changed_rows = changed_rows.copy()
+        changed_rows.index = positions
+        result = pd.concat([result.drop(positions), changed_rows]).sort_index()
+        result = pd.concat([result, new_rows], ignore_index=True)
+        result.to_csv(outputs.get_path(path), index=False, encoding='utf-8')
+        return result
+
+    logger.info("Appending %d rows to `%s`.", len(new_rows), path)
+    new_rows.to_csv(outputs.get_path(path, copy=True), mode='a', header=False, index=False,
+                    encoding='utf-8')
+    return None
+
+
+def ingest_delta(delta_path, combined_data_path, cnn_stories_path=None,
+                 tokenized_data_path=None, split_output_dir_path=None, split_dir_path=None,
+                 story_corpus_path=None, tokenizer=None):
+    """
+    Add new or changed questions to an already built dataset.
+
+    :param delta_path: The path to a CSV file with new or changed rows
+        in the format of `newsqa-data-v1.csv`.
+    :param combined_data_path: The path to the combined dataset to update.
+    :param cnn_stories_path: (Optional) The path to the CNN stories (cnn_stories.tgz).
+        Only needed if the delta has stories that aren't in the combined dataset.
+    :param tokenized_data_path: (Optional) The path to the tokenized dataset to update.
+        It must have been tokenized from the combined dataset.
+    :param split_output_dir_path: (Optional) The folder with the split data to update.
+        The split data comes from the tokenized dataset if `tokenized_data_path` is given,
+        otherwise from the combined dataset.
+    :param split_dir_path: (Optional) The folder with the story ID split files.
+        Defaults to the split from the paper.
+    :param story_corpus_path: (Optional) The path of a story corpus (see
+        `NewsQaDataset.export_story_corpus`) to get story texts from and to add new stories to.
+    :param tokenizer: (Optional) The tokenizer to pass to `tokenize_data`.
+    :return: The number of new rows and the number of changed rows.
+    :rtype: tuple
+    """
+    delta = NewsQaDataset.load_combined(delta_path)
+    delta = delta.drop_duplicates(KEY_COLUMNS, keep='last').reset_index(drop=True)
+
+    logger.info("Loading keys from `%s`.", combined_data_path)
+    built = _read_columns(combined_data_path, KEY_COLUMNS)
+    built_positions = dict((key, position) for position, key in enumerate(_get_keys(built)))
+    built_story_ids = set(built['story_id'].values)
+    del built
+
+    delta_positions = [built_positions.get(key) for key in _get_keys(delta)]
+    is_changed = pd.Series([position is not None for position in delta_positions],
+                           index=delta.index)
+    positions = [position for position in delta_positions if position is not None]
+    num_changed = len(positions)
+    num_new = len(delta) - num_changed
+
+    story_ids = set(delta['story_id'].values)
+    new_story_ids = story_ids - built_story_ids
+    outputs = _Outputs()
+    try:
+        with get_metrics().stage('ingest_delta', rows=len(delta), stories=len(new_story_ids)):
+            logger.info("Ingesting %d new rows and %d changed rows with %d new stories.",
+                        num_new, num_changed, len(new_story_ids))
+
+            story_id_to_text = _read_built_story_texts(combined_data_path,
+                                                       story_ids - new_story_ids,
+                                                       story_corpus_path)
+            if new_story_ids:
+                if cnn_stories_path is None:
+                    cnn_stories_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                    'cnn_stories.tgz')
+                new_story_texts = load_story_texts(cnn_stories_path, new_story_ids)
+                missing_story_ids = new_story_ids - set(new_story_texts)
+                if missing_story_ids:
+                    raise Exception("Stories were not found in `%s`: %s"
+                                    % (cnn_stories_path, ', '.join(sorted(missing_story_ids))))
+                story_id_to_text.update(new_story_texts)
+
+                if story_corpus_path:
+                    logger.info("Adding %d stories to `%s`.", len(new_story_texts),
+                                story_corpus_path)
+                    corpus_temp_path = get_temp_path(story_corpus_path)
+                    for paths in zip(get_story_corpus_paths(corpus_temp_path),
+                                     get_story_corpus_paths(story_corpus_path)):
+                        outputs.add(*paths)
+                    add_to_story_corpus(new_story_texts, story_corpus_path, corpus_temp_path)
+
+            # Only the rows in the delta need to be clamped.
+            set_story_texts(delta, story_id_to_text)
+
+            combined = _update_file(combined_data_path, delta, positions, is_changed,
+                                    outputs)
+            split_source = delta
+            full_split_source = combined
+
+            if tokenized_data_path:
+                work_dir_path = tempfile.mkdtemp()
+                try:
+                    tokenized_delta_path = os.path.join(work_dir_path, 'delta-tokenized.csv')
+                    tokenize_data(delta, tokenized_delta_path,
+                                  os.path.join(work_dir_path, 'delta'), tokenizer)
+                    tokenized_delta = NewsQaDataset.load_combined(tokenized_delta_path)
+                finally:
+                    shutil.rmtree(work_dir_path)
+                tokenized = _update_file(tokenized_data_path, tokenized_delta, positions,
+                                         is_changed, outputs)
+                split_source = tokenized_delta
+                full_split_source = tokenized
+
+            if split_output_dir_path:
+                split_paths = [os.path.join(split_output_dir_path, '%s.csv' % data_type)
+                               for data_type in _SPLIT_DATA_TYPES]
+                columns = _get_header(split_paths[0])
+                if full_split_source is not None:
+                    # Rows changed so which split they're in and whether they're kept can change.
+                    split_data = split_rows(full_split_source, split_dir_path)
+                    append = False
+                else:
+                    split_data = split_rows(split_source[~is_changed], split_dir_path)
+                    append = True
+                for data, path in zip(split_data, split_paths):
+                    write_rows(data, columns, outputs.get_path(path, copy=append),
+                               append=append)
+        outputs.replace()
+    finally:
+        outputs.remove()
+
+    return num_new, num_changed
+
+
+if __name__ == '__main__':
+    dir_name = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(
+        description="Add new or changed questions to an already built dataset.")
+    parser.add_argument('--delta_path', required=True,
+                        help="The path to a CSV file with new or changed rows "
+                             "in the format of newsqa-data-v1.csv.")
+    parser.add_argument('--combined_data_path', default='combined-newsqa-data-v1.csv',
+                        help="The path to the combined dataset to update.")
+    parser.add_argument('--cnn_stories_path', default=os.path.join(dir_name, 'cnn_stories.tgz'),
+                        help="The path to the CNN stories (cnn_stories.tgz).")
+    parser.add_argument('--tokenized_data_path',
+                        help="(Optional) The path to the tokenized dataset to update.")
+    parser.add_argument('--split_output_dir_path',
+                        help="(Optional) The folder with the split data to update.")
+    parser.add_argument('--story_corpus_path',
+                        help="(Optional) The path of a story corpus to use and update.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    ingest_delta(args.delta_path, args.combined_data_path, args.cnn_stories_path,
+                 tokenized_data_path=args.tokenized_data_path,
+                 split_output_dir_path=args.split_output_dir_path,
+                 story_corpus_path=args.story_corpus_path)
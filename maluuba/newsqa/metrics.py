@@ -0,0 +1,276 @@
+"""
+Stage-level metrics for building and processing the dataset.
+
+Each stage of the pipeline (loading, packing, tokenizing, splitting, ...) is recorded with its
+wall time, throughput, memory and I/O.
+The records can be written to a JSON file and hooks can be registered to get them as they happen:
+
+    from maluuba.newsqa.metrics import get_metrics
+
+    metrics = get_metrics()
+    metrics.register_hook(lambda event, record: print(event, record.name))
+    metrics.profile_stages.add('unpack')
+    # Build, tokenize, ...
+    metrics.dump('metrics.json')
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import timeit
+from collections import OrderedDict
+
+import six
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2.
+    tracemalloc = None
+
+
+_process_time = getattr(time, 'process_time', None) or time.clock
+
+
+def get_max_rss():
+    """
+    :return: The peak resident set size of the process in bytes since it started,
+        if it's available.
+    """
+    if resource is None:
+        return None
+    result = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        # Linux reports kilobytes.
+        result *= 1024
+    return result
+
+
+def _get_children_cpu_seconds():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def get_file_size(path):
+    """
+    :return: The size of the file at `path` or `None` if it doesn't exist.
+    """
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+class StageRecord(object):
+    """
+    The metrics for one run of a stage.
+    Stages can fill in `rows`, `stories`, `bytes_read` and `bytes_written` while they run.
+    """
+
+    def __init__(self, name, rows=None, stories=None):
+        self.name = name
+        self.rows = rows
+        self.stories = stories
+        self.bytes_read = None
+        self.bytes_written = None
+        self.start_time = None
+        self.wall_seconds = None
+        self.cpu_seconds = None
+        self.external_cpu_seconds = None
+        # The peak of the whole process so far, not only during the stage.
+        self.process_max_rss_bytes = None
+        # How much the peak of the process grew during the stage.
+        self.max_rss_increase_bytes = None
+        self.peak_traced_bytes = None
+        self.profile_path = None
+        self.error = None
+        self.extra = OrderedDict()
+
+    def add_bytes_read(self, num_bytes):
+        if num_bytes is not None:
+            self.bytes_read = (self.bytes_read or 0) + num_bytes
+
+    def add_bytes_written(self, num_bytes):
+        if num_bytes is not None:
+            self.bytes_written = (self.bytes_written or 0) + num_bytes
+
+    def _per_second(self, count):
+        if count is None or not self.wall_seconds:
+            return None
+        return count / self.wall_seconds
+
+    @property
+    def rows_per_second(self):
+        return self._per_second(self.rows)
+
+    @property
+    def stories_per_second(self):
+        return self._per_second(self.stories)
+
+    def to_dict(self):
+        result = OrderedDict([
+            ('name', self.name),
+            ('start_time', self.start_time),
+            ('wall_seconds', self.wall_seconds),
+            ('cpu_seconds', self.cpu_seconds),
+            ('external_cpu_seconds', self.external_cpu_seconds),
+            ('rows', self.rows),
+            ('rows_per_second', self.rows_per_second),
+            ('stories', self.stories),
+            ('stories_per_second', self.stories_per_second),
+            ('bytes_read', self.bytes_read),
+            ('bytes_written', self.bytes_written),
+            ('process_max_rss_bytes', self.process_max_rss_bytes),
+            ('max_rss_increase_bytes', self.max_rss_increase_bytes),
+            ('peak_traced_bytes', self.peak_traced_bytes),
+            ('profile_path', self.profile_path),
+            ('error', self.error),
+        ])
+        result.update(self.extra)
+        return result
+
+
+class Metrics(object):
+    """
+    Collects `StageRecord`s.
+
+    :ivar trace_memory: `True` to measure the peak memory allocated in each stage
+        with `tracemalloc`. This slows stages down.
+    :ivar profile_stages: The names of the stages to profile with `cProfile`.
+    :ivar profile_dir_path: The folder to write profiles to. Defaults to the working directory.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.trace_memory = False
+        self.profile_stages = set()
+        self.profile_dir_path = None
+        self._hooks = []
+        # The peak traced memory seen so far by each stage that's running, outermost first.
+        # Nested stages reset the peak so it's saved here first.
+        self._traced_peaks = []
+
+    def register_hook(self, hook):
+        """
+        :param hook: A function called with `('start', record)` when a stage starts and
+            `('end', record)` when it ends.
+        """
+        self._hooks.append(hook)
+
+    def unregister_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def _call_hooks(self, event, record):
+        for hook in self._hooks:
+            hook(event, record)
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None, stories=None):
+        """
+        Record a stage.
+
+        :param name: The name of the stage.
+        :param rows: (Optional) The number of rows processed.
+        :param stories: (Optional) The number of stories processed.
+        :return: A context manager giving the `StageRecord`.
+        """
+        record = StageRecord(name, rows, stories)
+        record.start_time = time.time()
+        self._call_hooks('start', record)
+
+        started_tracing = False
+        is_tracing = self.trace_memory and tracemalloc is not None
+        if is_tracing:
+            if tracemalloc.is_tracing():
+                if self._traced_peaks:
+                    _, peak = tracemalloc.get_traced_memory()
+                    self._traced_peaks[-1] = max(self._traced_peaks[-1], peak)
+                if hasattr(tracemalloc, 'reset_peak'):
+                    tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+                started_tracing = True
+            self._traced_peaks.append(0)
+        profiler = None
+        if name in self.profile_stages:
+            import cProfile
+            profiler = cProfile.Profile()
+
+        children_cpu_seconds = _get_children_cpu_seconds()
+        max_rss_start = get_max_rss()
+        cpu_start = _process_time()
+        wall_start = timeit.default_timer()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        except BaseException as e:
+            record.error = repr(e)
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record.wall_seconds = timeit.default_timer() - wall_start
+            record.cpu_seconds = _process_time() - cpu_start
+            if children_cpu_seconds is not None:
+                record.external_cpu_seconds = _get_children_cpu_seconds() - children_cpu_seconds
+            record.process_max_rss_bytes = get_max_rss()
+            if max_rss_start is not None:
+                record.max_rss_increase_bytes = record.process_max_rss_bytes - max_rss_start
+            if is_tracing:
+                peak = self._traced_peaks.pop()
+                if tracemalloc.is_tracing():
+                    _, current_peak = tracemalloc.get_traced_memory()
+                    peak = max(peak, current_peak)
+                    if started_tracing:
+                        tracemalloc.stop()
+                record.peak_traced_bytes = peak
+                if self._traced_peaks:
+                    # The enclosing stage's peak is at least this stage's.
+                    self._traced_peaks[-1] = max(self._traced_peaks[-1], peak)
+            if profiler is not None:
+                record.profile_path = os.path.join(self.profile_dir_path or '.',
+                                                   '%s.prof' % name)
+                profiler.dump_stats(record.profile_path)
+            self.records.append(record)
+            self._call_hooks('end', record)
+
+    def to_dict(self):
+        return OrderedDict([
+            ('python', sys.version.split()[0]),
+            ('pid', os.getpid()),
+            ('stages', [record.to_dict() for record in self.records]),
+        ])
+
+    def dump(self, path):
+        """
+        Write the metrics to a JSON file.
+
+        :param path: The path to write to.
+        """
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(six.text_type(json.dumps(self.to_dict(), indent=2)))
+
+    def reset(self):
+        self.records = []
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    """
+    :return: The metrics that the pipeline records stages to.
+    :rtype: Metrics
+    """
+    return _metrics
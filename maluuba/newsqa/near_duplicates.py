@@ -0,0 +1,310 @@
+"""
+Find questions that are nearly the same with MinHash and locality-sensitive hashing (LSH).
+
+Each question is turned into a set of word n-grams (shingles) and a MinHash signature that
+estimates the Jaccard similarity of the sets.
+Signatures are split into bands and questions with the same values for a band are compared,
+so the time is about linear in the number of questions instead of comparing every pair:
+
+    from maluuba.newsqa.data_processing import NewsQaDataset
+
+    newsqa_dataset = NewsQaDataset(combined_data_path='combined-newsqa-data-v1.csv')
+    clusters = newsqa_dataset.find_near_duplicate_questions(threshold=0.8)
+    leaks = find_split_leakage(newsqa_dataset.dataset)
+"""
+import argparse
+import logging
+import zlib
+
+import numpy as np
+import pandas as pd
+import six
+
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    from maluuba.newsqa.metrics import get_metrics
+    from maluuba.newsqa.search_index import get_terms
+except:
+    # In case you're running this file from this folder.
+    from metrics import get_metrics
+    from search_index import get_terms
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 128
+DEFAULT_SHINGLE_SIZE = 2
+
+# A Mersenne prime so that `a * x + b` fits in 64 bits for 31 bit values.
+_PRIME = (1 << 31) - 1
+# The number of shingles to hash at once.
+_HASH_CHUNK_SIZE = 1 << 15
+
+logger = logging.getLogger('newsqa')
+
+
+def get_shingles(text, shingle_size=DEFAULT_SHINGLE_SIZE):
+    """
+    :param text: A question.
+    :param shingle_size: The number of words in each shingle.
+    :return: The distinct lowercase word n-grams in the text.
+        Texts with fewer words have one shingle with all of them.
+    :rtype: set
+    """
+    terms = get_terms(text)
+    if len(terms) <= shingle_size:
+        return {u' '.join(terms)} if terms else set()
+    return set(u' '.join(terms[i:i + shingle_size])
+               for i in six.moves.range(len(terms) - shingle_size + 1))
+
+
+def _hash_shingle(shingle):
+    # Stable across processes and runs, unlike `hash`.
+    return zlib.crc32(shingle.encode('utf-8')) & 0xffffffff
+
+
+def compute_signatures(texts, num_perm=DEFAULT_NUM_PERM, shingle_size=DEFAULT_SHINGLE_SIZE,
+                       seed=1):
+    """
+    :param texts: The questions.
+    :param num_perm: The number of hash functions in each signature.
+    :param shingle_size: The number of words in each shingle.
+    :param seed: The seed for the hash functions.
+    :return: The MinHash signature of each text and whether it has any shingles.
+        Texts without shingles have signatures that don't match anything.
+    :rtype: tuple
+    """
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, _PRIME, size=num_perm).astype(np.uint64)
+    b = rng.randint(0, _PRIME, size=num_perm).astype(np.uint64)
+
+    shingle_hashes = []
+    counts = np.zeros(len(texts), dtype=np.int64)
+    for i, text in enumerate(texts):
+        hashes = [_hash_shingle(shingle) for shingle in get_shingles(text, shingle_size)]
+        shingle_hashes.extend(hashes)
+        counts[i] = len(hashes)
+    shingle_hashes = np.array(shingle_hashes, dtype=np.uint64) % np.uint64(_PRIME)
+
+    has_shingles = counts > 0
+    signatures = np.full((len(texts), num_perm), _PRIME, dtype=np.uint64)
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    start = 0
+    while start < len(texts):
+        # Hash chunks of whole texts so that the minimums can be taken per text.
+        stop = int(np.searchsorted(offsets, offsets[start] + _HASH_CHUNK_SIZE, side='right'))
+        stop = min(max(stop - 1, start + 1), len(texts))
+        chunk = shingle_hashes[offsets[start]:offsets[stop]]
+        chunk_texts = np.flatnonzero(has_shingles[start:stop]) + start
+        if len(chunk_texts):
+            values = (chunk[:, None] * a[None, :] + b[None, :]) % np.uint64(_PRIME)
+            signatures[chunk_texts] = np.minimum.reduceat(
+                values, offsets[chunk_texts] - offsets[start], axis=0)
+        start = stop
+    return signatures, has_shingles
+
+
+def choose_bands(threshold, num_perm=DEFAULT_NUM_PERM):
+    """
+    :param threshold: The Jaccard similarity that pairs should have to be compared.
+    :param num_perm: The number of hash functions in each signature.
+    :return: The number of bands and rows per band whose threshold `(1 / bands) ** (1 / rows)`
+        is the closest to `threshold` without going over it, to find most similar pairs.
+    :rtype: tuple
+    """
+    best = None
+    for rows in six.moves.range(1, num_perm + 1):
+        bands = num_perm // rows
+        approximate_threshold = (1.0 / bands) ** (1.0 / rows)
+        if approximate_threshold <= threshold \
+                and (best is None or approximate_threshold > best[0]):
+            best = (approximate_threshold, bands, rows)
+    if best is None:
+        return num_perm, 1
+    return best[1], best[2]
+
+
+def _estimate_similarities(signatures, first, second):
+    result = np.empty(len(first), dtype=np.float64)
+    for start in six.moves.range(0, len(first), _HASH_CHUNK_SIZE):
+        stop = start + _HASH_CHUNK_SIZE
+        result[start:stop] = (signatures[first[start:stop]]
+                              == signatures[second[start:stop]]).mean(axis=1)
+    return result
+
+
+def _find_root(parents, i):
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+
+def find_near_duplicates(texts, threshold=DEFAULT_THRESHOLD, scopes=None,
+                         num_perm=DEFAULT_NUM_PERM, bands=None, shingle_size=DEFAULT_SHINGLE_SIZE,
+                         seed=1):
+    """
+    Group texts that are nearly the same.
+
+    :param texts: The questions.
+    :param threshold: The estimated Jaccard similarity of the shingles that two texts need to
+        be near-duplicates.
+    :param scopes: (Optional) A value for each text, e.g. its story ID, so that only texts with
+        the same value are compared.
+    :param num_perm: The number of hash functions in each signature.
+        More are more accurate but slower.
+    :param bands: (Optional) The number of bands to split signatures into.
+        More find more pairs but compare more pairs that aren't similar.
+        Defaults to the number for `threshold`, see `choose_bands`.
+    :param shingle_size: The number of words in each shingle.
+    :param seed: The seed for the hash functions.
+    :return: A row for each text in a cluster of near-duplicates with:
+        `cluster`: The number of the cluster.
+        `position`: The position of the text in `texts`.
+        `similarity`: The estimated similarity with the first text of the cluster.
+    :rtype: pandas.DataFrame
+    """
+    if bands is None:
+        bands, rows = choose_bands(threshold, num_perm)
+    else:
+        rows = num_perm // bands
+    signatures, has_shingles = compute_signatures(texts, num_perm, shingle_size, seed)
+    candidates = np.flatnonzero(has_shingles)
+    if scopes is None:
+        scope_numbers = np.zeros(len(texts), dtype=np.int64)
+    else:
+        scope_numbers = np.asarray(pd.factorize(pd.Series(list(scopes)))[0], dtype=np.int64)
+
+    # Link every text in a bucket to the first one so the number of pairs stays linear.
+    rng = np.random.RandomState(seed + 1)
+    multipliers = rng.randint(1, np.iinfo(np.int64).max, size=rows, dtype=np.int64) \
+        .astype(np.uint64) | np.uint64(1)
+    first, second = [], []
+    for band in six.moves.range(bands):
+        band_values = signatures[candidates, band * rows:(band + 1) * rows]
+        keys = (band_values * multipliers[None, :]).sum(axis=1)
+        order = np.lexsort((candidates, keys, scope_numbers[candidates]))
+        sorted_keys = keys[order]
+        sorted_scopes = scope_numbers[candidates][order]
+        is_new_bucket = np.ones(len(order), dtype=bool)
+        is_new_bucket[1:] = (sorted_keys[1:] != sorted_keys[:-1]) \
+            | (sorted_scopes[1:] != sorted_scopes[:-1])
+        bucket_heads = np.maximum.accumulate(np.where(is_new_bucket, np.arange(len(order)), 0))
+        members = np.flatnonzero(~is_new_bucket)
+        first.append(candidates[order[bucket_heads[members]]])
+        second.append(candidates[order[members]])
+
+    first = np.concatenate(first) if first else np.zeros(0, dtype=np.int64)
+    second = np.concatenate(second) if second else np.zeros(0, dtype=np.int64)
+    if len(first):
+        pairs = np.unique(np.stack([first, second], axis=1), axis=0)
+        first, second = pairs[:, 0], pairs[:, 1]
+    similar = _estimate_similarities(signatures, first, second) >= threshold
+    first, second = first[similar], second[similar]
+
+    parents = np.arange(len(texts))
+    for i, j in zip(first.tolist(), second.tolist()):
+        root_i, root_j = _find_root(parents, i), _find_root(parents, j)
+        if root_i != root_j:
+            parents[max(root_i, root_j)] = min(root_i, root_j)
+    roots = np.array([_find_root(parents, i) for i in six.moves.range(len(texts))],
+                     dtype=np.int64)
+
+    cluster_sizes = np.bincount(roots, minlength=len(texts))
+    positions = np.flatnonzero(cluster_sizes[roots] > 1)
+    representatives = roots[positions]
+    cluster_numbers = np.unique(representatives, return_inverse=True)[1].reshape(-1)
+    return pd.DataFrame(dict(
+        cluster=cluster_numbers,
+        position=positions,
+        similarity=_estimate_similarities(signatures, representatives, positions)),
+        columns=['cluster', 'position', 'similarity'])
+
+
+def find_near_duplicate_questions(dataset, threshold=DEFAULT_THRESHOLD, per_story=False,
+                                  **kwargs):
+    """
+    :param dataset: The dataset, e.g. `NewsQaDataset.dataset`.
+    :param threshold: The estimated Jaccard similarity that two questions need to be
+        near-duplicates.
+    :param per_story: `True` to only compare questions about the same story.
+    :param kwargs: Other arguments for `find_near_duplicates`.
+    :return: A row for each question in a cluster of near-duplicates, see
+        `find_near_duplicates`, with the `story_id` and `question` of the row.
+    :rtype: pandas.DataFrame
+    """
+    questions = dataset['question'].fillna('').values
+    story_ids = dataset['story_id'].values
+    with get_metrics().stage('near_duplicates', rows=len(dataset)):
+        result = find_near_duplicates(questions, threshold,
+                                      scopes=story_ids if per_story else None, **kwargs)
+    result['story_id'] = story_ids[result['position'].values]
+    result['question'] = questions[result['position'].values]
+    logger.info("Found %d near-duplicate questions in %d clusters.",
+                len(result), result['cluster'].nunique())
+    return result
+
+
+def find_split_leakage(dataset, split_dir_path=None, threshold=DEFAULT_THRESHOLD, **kwargs):
+    """
+    Find near-duplicate questions that are in more than one of the train, dev and test data.
+
+    :param dataset: The dataset, e.g. `NewsQaDataset.dataset`.
+    :param split_dir_path: (Optional) The folder with the story ID split files.
+        Defaults to the split from the paper.
+    :param threshold: The estimated Jaccard similarity that two questions need to be
+        near-duplicates.
+    :param kwargs: Other arguments for `find_near_duplicates`.
+    :return: The rows of `find_near_duplicate_questions` for clusters in more than one split
+        with the `split` ('train', 'dev', 'test' or `None`) of each row.
+    :rtype: pandas.DataFrame
+    """
+    try:
+        from maluuba.newsqa.data_processing import load_story_id_splits
+    except:
+        from data_processing import load_story_id_splits
+    result = find_near_duplicate_questions(dataset, threshold, **kwargs)
+    story_id_to_split = {}
+    for split, story_ids in zip(['train', 'dev', 'test'], load_story_id_splits(split_dir_path)):
+        story_id_to_split.update((story_id, split) for story_id in story_ids)
+    result['split'] = [story_id_to_split.get(story_id) for story_id in result['story_id']]
+    num_splits = result.groupby('cluster')['split'].transform('nunique')
+    return result[num_splits > 1].reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Find near-duplicate questions.")
+    parser.add_argument('--dataset_path', default='combined-newsqa-data-v1.csv',
+                        help="The path to the dataset.")
+    parser.add_argument('--output_path', default='near-duplicate-questions.csv',
+                        help="The path to write the clusters to as CSV.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="The estimated Jaccard similarity of the word n-grams that two "
+                             "questions need to be near-duplicates.")
+    parser.add_argument('--num_perm', type=int, default=DEFAULT_NUM_PERM,
+                        help="The number of hash functions for MinHash.")
+    parser.add_argument('--bands', type=int,
+                        help="(Optional) The number of LSH bands. "
+                             "Defaults to the number for the threshold.")
+    parser.add_argument('--per_story', action='store_true',
+                        help="Only compare questions about the same story.")
+    parser.add_argument('--leakage', action='store_true',
+                        help="Only write clusters in more than one of train, dev and test.")
+    parser.add_argument('--split_dir_path',
+                        help="(Optional) The folder with the story ID split files.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        from maluuba.newsqa.data_processing import NewsQaDataset
+    except:
+        from data_processing import NewsQaDataset
+    data = NewsQaDataset.load_combined(args.dataset_path)
+    options = dict(num_perm=args.num_perm, bands=args.bands)
+    if args.leakage:
+        clusters = find_split_leakage(data, args.split_dir_path, args.threshold,
+                                      per_story=args.per_story, **options)
+    else:
+        clusters = find_near_duplicate_questions(data, args.threshold, args.per_story,
+                                                 **options)
+    clusters.to_csv(args.output_path, index=False, encoding='utf-8')
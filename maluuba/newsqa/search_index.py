@@ -0,0 +1,296 @@
+"""
+An inverted index for keyword search over the stories and the questions.
+
+The index is a folder of arrays that are memory-mapped when it's opened:
+
+* `metadata.json`: The number of rows and stories that were indexed.
+* `story_ids.npy`: The story IDs, sorted. A story's number is its position in this array.
+* `story_row_offsets.npy` and `story_rows.npy`: The positions of the rows for story `i` in the
+  dataset are `story_rows[story_row_offsets[i]:story_row_offsets[i + 1]]`.
+* For each field (`story` and `question`):
+  * `<field>_terms.npy`: The terms, sorted.
+  * `<field>_term_offsets.npy`: The postings for term `i` are
+    `[<field>_term_offsets[i], <field>_term_offsets[i + 1])`.
+  * `<field>_docs.npy`: The story number or the row position of each posting.
+  * `<field>_position_offsets.npy` and `<field>_positions.npy`: The positions of the term in the
+    text for posting `p` are
+    `<field>_positions[<field>_position_offsets[p]:<field>_position_offsets[p + 1]]`.
+
+Each distinct story is only indexed once.
+Terms are the lowercase words in the text.
+A query is words that must all be in the text, words in double quotes must be consecutive:
+
+    newsqa_dataset.build_search_index('search_index')
+    positions = newsqa_dataset.search('"new delhi" court', field='story')
+"""
+import io
+import json
+import os
+import re
+
+import numpy as np
+import six
+
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    from maluuba.newsqa.metrics import get_metrics
+except:
+    # In case you're running this file from this folder.
+    from metrics import get_metrics
+
+FIELDS = ['story', 'question']
+
+METADATA_FILENAME = 'metadata.json'
+
+_TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+_QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)', re.UNICODE)
+
+_FIELD_ARRAY_NAMES = ['terms', 'term_offsets', 'docs', 'position_offsets', 'positions']
+
+
+def get_terms(text):
+    """
+    :param text: Text to index or search for.
+    :return: The terms in the text.
+    :rtype: list
+    """
+    return _TERM_PATTERN.findall(text.lower())
+
+
+def parse_query(query):
+    """
+    :param query: Words that must all be in the text, words in double quotes must be consecutive.
+    :return: The phrases that must all be in the text, each one is a list of terms.
+    :rtype: list
+    """
+    result = []
+    for phrase, word in _QUERY_PATTERN.findall(query):
+        terms = get_terms(phrase or word)
+        if terms:
+            result.append(terms)
+    return result
+
+
+def _build_postings(texts):
+    """
+    :param texts: The text of each document.
+    :return: The arrays for a field, see `_FIELD_ARRAY_NAMES`.
+    :rtype: dict
+    """
+    term_numbers = {}
+    doc_term_numbers = []
+    doc_lengths = np.zeros(len(texts), dtype=np.int64)
+    for doc, text in enumerate(texts):
+        numbers = [term_numbers.setdefault(term, len(term_numbers))
+                   for term in get_terms(text)]
+        doc_term_numbers.append(np.array(numbers, dtype=np.int32))
+        doc_lengths[doc] = len(numbers)
+
+    terms = np.array(sorted(term_numbers), dtype=six.text_type)
+    # Renumber the terms in sorted order.
+    ranks = np.empty(len(term_numbers), dtype=np.int32)
+    ranks[[term_numbers[term] for term in terms]] = np.arange(len(terms), dtype=np.int32)
+
+    if doc_lengths.sum():
+        occurrence_terms = ranks[np.concatenate(doc_term_numbers)]
+    else:
+        occurrence_terms = np.zeros(0, dtype=np.int32)
+    occurrence_docs = np.repeat(np.arange(len(texts), dtype=np.int32), doc_lengths)
+    doc_starts = np.zeros(len(texts), dtype=np.int64)
+    np.cumsum(doc_lengths[:-1], out=doc_starts[1:])
+    occurrence_positions = (np.arange(len(occurrence_docs), dtype=np.int64)
+                            - np.repeat(doc_starts, doc_lengths)).astype(np.int32)
+
+    order = np.lexsort((occurrence_positions, occurrence_docs, occurrence_terms))
+    occurrence_terms = occurrence_terms[order]
+    occurrence_docs = occurrence_docs[order]
+    positions = occurrence_positions[order]
+
+    # A posting for each distinct pair of term and document.
+    is_new_posting = np.ones(len(order), dtype=bool)
+    is_new_posting[1:] = (occurrence_terms[1:] != occurrence_terms[:-1]) \
+        | (occurrence_docs[1:] != occurrence_docs[:-1])
+    posting_starts = np.flatnonzero(is_new_posting)
+    position_offsets = np.append(posting_starts, len(order)).astype(np.int64)
+    docs = occurrence_docs[posting_starts]
+    term_offsets = np.searchsorted(occurrence_terms[posting_starts],
+                                   np.arange(len(terms) + 1)).astype(np.int64)
+    return dict(terms=terms, term_offsets=term_offsets, docs=docs,
+                position_offsets=position_offsets, positions=positions)
+
+
+def build_search_index(dataset, path, get_story_text=None):
+    """
+    Write an inverted index for a dataset.
+
+    :param dataset: The dataset, e.g. `NewsQaDataset.dataset`.
+    :param path: The folder to write the index to.
+    :param get_story_text: (Optional) A function from a story ID to its text,
+        e.g. `NewsQaDataset.get_story_text`. Defaults to using the `story_text` column.
+    :return: The number of stories indexed.
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    with get_metrics().stage('build_search_index', rows=len(dataset)) as record:
+        row_story_ids = np.asarray(dataset['story_id'].values, dtype=object)
+        story_rows = np.argsort(row_story_ids, kind='mergesort')
+        sorted_story_ids = row_story_ids[story_rows]
+        is_new_story = np.ones(len(sorted_story_ids), dtype=bool)
+        is_new_story[1:] = sorted_story_ids[1:] != sorted_story_ids[:-1]
+        story_starts = np.flatnonzero(is_new_story)
+        story_ids = sorted_story_ids[story_starts]
+        story_row_offsets = np.append(story_starts, len(story_rows)).astype(np.int64)
+        record.stories = len(story_ids)
+
+        if get_story_text is None:
+            texts = dataset['story_text'].values
+            story_texts = [texts[story_rows[start]] for start in story_starts]
+        else:
+            story_texts = [get_story_text(story_id) for story_id in story_ids]
+
+        arrays = dict(story_ids=np.array(story_ids, dtype=six.text_type),
+                      story_row_offsets=story_row_offsets,
+                      story_rows=story_rows.astype(np.int64))
+        field_texts = dict(story=story_texts, question=dataset['question'].fillna('').values)
+        for field in FIELDS:
+            postings = _build_postings(field_texts[field])
+            for name in _FIELD_ARRAY_NAMES:
+                arrays['%s_%s' % (field, name)] = postings[name]
+
+        for name, array in six.iteritems(arrays):
+            array_path = os.path.join(path, '%s.npy' % name)
+            np.save(array_path, array, allow_pickle=False)
+            record.add_bytes_written(os.path.getsize(array_path))
+        with io.open(os.path.join(path, METADATA_FILENAME), 'w', encoding='utf-8') as f:
+            f.write(six.text_type(json.dumps(dict(num_rows=len(dataset),
+                                                  num_stories=len(story_ids)))))
+    return len(story_ids)
+
+
+class _FieldIndex(object):
+    def __init__(self, dir_path, field, mmap_mode):
+        for name in _FIELD_ARRAY_NAMES:
+            setattr(self, name, np.load(os.path.join(dir_path, '%s_%s.npy' % (field, name)),
+                                        mmap_mode=mmap_mode))
+
+    def _find_term(self, term):
+        i = int(np.searchsorted(self.terms, term))
+        if i < len(self.terms) and self.terms[i] == term:
+            return i
+        return -1
+
+    def get_postings(self, term):
+        """
+        :return: The posting numbers for a term.
+        :rtype: numpy.ndarray
+        """
+        i = self._find_term(term)
+        if i < 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.arange(self.term_offsets[i], self.term_offsets[i + 1])
+
+    def get_docs(self, term):
+        """
+        :return: The documents with a term, sorted.
+        :rtype: numpy.ndarray
+        """
+        i = self._find_term(term)
+        if i < 0:
+            return np.zeros(0, dtype=np.int32)
+        return np.asarray(self.docs[self.term_offsets[i]:self.term_offsets[i + 1]])
+
+    def _get_position_keys(self, term, docs, shift):
+        """
+        :return: `doc << 32 | (position - shift)` for each occurrence of the term in `docs`.
+        """
+        postings = self.get_postings(term)
+        postings = postings[np.isin(self.docs[postings], docs)]
+        starts = self.position_offsets[postings]
+        counts = self.position_offsets[postings + 1] - starts
+        occurrences = np.repeat(starts - np.cumsum(counts) + counts, counts) \
+            + np.arange(counts.sum())
+        occurrence_docs = np.repeat(np.asarray(self.docs[postings], dtype=np.int64), counts)
+        positions = np.asarray(self.positions[occurrences], dtype=np.int64) - shift
+        return (occurrence_docs << 32) | (positions & 0xffffffff)
+
+    def search(self, phrases):
+        """
+        :param phrases: The phrases that must all be in a document, see `parse_query`.
+        :return: The documents with every phrase, sorted.
+        :rtype: numpy.ndarray
+        """
+        if not phrases:
+            return np.zeros(0, dtype=np.int64)
+        result = None
+        # Intersect the rarest terms first.
+        terms = sorted(set(term for phrase in phrases for term in phrase),
+                       key=lambda term: len(self.get_postings(term)))
+        for term in terms:
+            docs = self.get_docs(term)
+            result = docs if result is None else np.intersect1d(result, docs,
+                                                                assume_unique=True)
+            if len(result) == 0:
+                return result.astype(np.int64)
+
+        for phrase in phrases:
+            if len(phrase) < 2:
+                continue
+            keys = None
+            for shift, term in enumerate(phrase):
+                term_keys = self._get_position_keys(term, result, shift)
+                keys = term_keys if keys is None else np.intersect1d(keys, term_keys)
+            result = np.unique(keys >> 32)
+            if len(result) == 0:
+                break
+        return np.asarray(result, dtype=np.int64)
+
+
+class SearchIndex(object):
+    """
+    The index written by `build_search_index`.
+    """
+
+    def __init__(self, path, mmap=True):
+        """
+        :param path: The folder with the index.
+        :param mmap: `False` to read the arrays into memory.
+        """
+        self.path = path
+        mmap_mode = 'r' if mmap else None
+        with io.open(os.path.join(path, METADATA_FILENAME), 'r', encoding='utf-8') as f:
+            metadata = json.loads(f.read())
+        self.num_rows = metadata['num_rows']
+        self.story_ids = np.load(os.path.join(path, 'story_ids.npy'), mmap_mode=mmap_mode)
+        self.story_row_offsets = np.load(os.path.join(path, 'story_row_offsets.npy'),
+                                         mmap_mode=mmap_mode)
+        self.story_rows = np.load(os.path.join(path, 'story_rows.npy'), mmap_mode=mmap_mode)
+        self._fields = dict((field, _FieldIndex(path, field, mmap_mode)) for field in FIELDS)
+
+    def search_stories(self, query):
+        """
+        :param query: The query, see `parse_query`.
+        :return: The IDs of the stories that match, sorted.
+        :rtype: list
+        """
+        story_numbers = self._fields['story'].search(parse_query(query))
+        return [six.text_type(story_id) for story_id in self.story_ids[story_numbers]]
+
+    def search(self, query, field='question'):
+        """
+        :param query: The query, see `parse_query`.
+        :param field: 'question' to search the questions or 'story' to search the stories.
+        :return: The positions of the matching rows in the dataset, sorted.
+            For stories, every row for a matching story.
+        :rtype: numpy.ndarray
+        """
+        if field not in self._fields:
+            raise ValueError("`field` must be one of %s." % FIELDS)
+        docs = self._fields[field].search(parse_query(query))
+        if field == 'question':
+            return docs
+        starts = self.story_row_offsets[docs]
+        counts = self.story_row_offsets[docs + 1] - starts
+        rows = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return np.sort(self.story_rows[rows])
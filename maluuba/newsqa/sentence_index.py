@@ -0,0 +1,157 @@
+"""
+Find the sentences in stories that contain answers.
+
+Sentences come from the `sentence_starts` of the tokenized data. Despite its name, each number in
+`sentence_starts` is the token offset where a sentence ends (and where the next one starts),
+so the last one is the number of tokens in the story.
+
+All of the lookups take arrays and are vectorized:
+
+    import numpy as np
+    from maluuba.newsqa.sentence_index import SentenceIndex
+    from maluuba.newsqa.token_arrays import TokenArrays
+
+    arrays = TokenArrays('token_arrays/train')
+    index = SentenceIndex.from_token_arrays(arrays)
+    questions = np.arange(len(arrays))
+    first_answers = arrays.answers[arrays.answer_offsets[:-1]]
+    first, last = index.find_answer_sentences(arrays.question_stories[questions],
+                                              first_answers[:, 0], first_answers[:, 1])
+"""
+import numpy as np
+
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    from maluuba.newsqa.token_arrays import parse_sentence_starts
+except:
+    # In case you're running this file from this folder.
+    from token_arrays import parse_sentence_starts
+
+
+class SentenceIndex(object):
+    """
+    The token ranges of the sentences of stories.
+
+    Stories are referred to by their number: their position in `sentence_offsets`.
+    Positions that aren't in a story give a sentence of -1.
+    """
+
+    def __init__(self, sentence_ends, sentence_offsets):
+        """
+        :param sentence_ends: The token offset where each sentence ends for every story.
+        :param sentence_offsets: The ends of story `i` are
+            `sentence_ends[sentence_offsets[i]:sentence_offsets[i + 1]]`.
+        """
+        self.sentence_ends = np.asarray(sentence_ends, dtype=np.int64)
+        self.sentence_offsets = np.asarray(sentence_offsets, dtype=np.int64)
+        self.num_sentences = self.sentence_offsets[1:] - self.sentence_offsets[:-1]
+        self.story_lengths = np.zeros(len(self.num_sentences), dtype=np.int64)
+        has_sentences = self.num_sentences > 0
+        self.story_lengths[has_sentences] = \
+            self.sentence_ends[self.sentence_offsets[1:][has_sentences] - 1]
+
+        # Put all of the stories one after the other so that one search finds sentences
+        # in any story.
+        self._story_bases = np.zeros(len(self.story_lengths), dtype=np.int64)
+        np.cumsum(self.story_lengths[:-1], out=self._story_bases[1:])
+        sentence_stories = np.repeat(np.arange(len(self.num_sentences)), self.num_sentences)
+        self._global_ends = self.sentence_ends + self._story_bases[sentence_stories]
+
+    @classmethod
+    def from_token_arrays(cls, token_arrays):
+        """
+        :param token_arrays: The `TokenArrays`, stories are numbered the same way.
+        """
+        return cls(token_arrays.sentence_starts, token_arrays.sentence_offsets)
+
+    @classmethod
+    def from_sentence_starts(cls, sentence_starts):
+        """
+        :param sentence_starts: The `sentence_starts` strings from the tokenized data,
+            e.g. `dataset['sentence_starts'].values`. Each one is numbered as a story.
+        """
+        sentence_ends = [parse_sentence_starts(s) for s in sentence_starts]
+        offsets = np.zeros(len(sentence_ends) + 1, dtype=np.int64)
+        np.cumsum([len(ends) for ends in sentence_ends], out=offsets[1:])
+        flat = np.fromiter((end for ends in sentence_ends for end in ends), dtype=np.int64,
+                           count=offsets[-1])
+        return cls(flat, offsets)
+
+    def __len__(self):
+        return len(self.num_sentences)
+
+    def find_sentences(self, stories, positions):
+        """
+        :param stories: The story of each position.
+        :param positions: Token positions.
+        :return: The number of the sentence containing each position within its story.
+        :rtype: numpy.ndarray
+        """
+        stories = np.asarray(stories, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+        global_sentences = np.searchsorted(self._global_ends,
+                                           self._story_bases[stories] + positions,
+                                           side='right')
+        result = global_sentences - self.sentence_offsets[stories]
+        result[(positions < 0) | (positions >= self.story_lengths[stories])] = -1
+        return result
+
+    def get_sentence_ranges(self, stories, sentences):
+        """
+        :param stories: The story of each sentence.
+        :param sentences: The numbers of the sentences within their stories.
+        :return: The token offsets where each sentence starts and ends (exclusive).
+        :rtype: tuple
+        """
+        stories = np.asarray(stories, dtype=np.int64)
+        sentences = np.asarray(sentences, dtype=np.int64)
+        positions = self.sentence_offsets[stories] + sentences
+        ends = self.sentence_ends[positions]
+        starts = np.where(sentences > 0, self.sentence_ends[np.maximum(positions - 1, 0)], 0)
+        return starts, ends
+
+    def find_answer_sentences(self, stories, answer_starts, answer_ends):
+        """
+        :param stories: The story of each answer.
+        :param answer_starts: The token offsets where the answers start.
+        :param answer_ends: The token offsets where the answers end (exclusive).
+        :return: The numbers of the first and the last sentences of each answer,
+            -1 for both if the answer isn't in the story.
+        :rtype: tuple
+        """
+        stories = np.asarray(stories, dtype=np.int64)
+        answer_starts = np.asarray(answer_starts, dtype=np.int64)
+        # The end may be after the last token.
+        last_tokens = np.minimum(np.asarray(answer_ends, dtype=np.int64) - 1,
+                                 self.story_lengths[stories] - 1)
+        last_tokens = np.maximum(last_tokens, answer_starts)
+        first = self.find_sentences(stories, answer_starts)
+        last = self.find_sentences(stories, last_tokens)
+        missing = (first < 0) | (last < 0)
+        first[missing] = -1
+        last[missing] = -1
+        return first, last
+
+    def get_answer_windows(self, stories, answer_starts, answer_ends, num_sentences=1):
+        """
+        :param stories: The story of each answer.
+        :param answer_starts: The token offsets where the answers start.
+        :param answer_ends: The token offsets where the answers end (exclusive).
+        :param num_sentences: The number of sentences to include before and after the
+            sentences of each answer.
+        :return: The token offsets where the window around each answer starts and ends
+            (exclusive), -1 for both if the answer isn't in the story.
+        :rtype: tuple
+        """
+        stories = np.asarray(stories, dtype=np.int64)
+        first, last = self.find_answer_sentences(stories, answer_starts, answer_ends)
+        found = first >= 0
+        stories = stories[found]
+        first = np.maximum(first[found] - num_sentences, 0)
+        last = np.minimum(last[found] + num_sentences, self.num_sentences[stories] - 1)
+        starts = np.full(len(found), -1, dtype=np.int64)
+        ends = np.full(len(found), -1, dtype=np.int64)
+        starts[found] = self.get_sentence_ranges(stories, first)[0]
+        ends[found] = self.get_sentence_ranges(stories, last)[1]
+        return starts, ends
@@ -0,0 +1,428 @@
+"""
+A read-only server for the dataset so that jobs on the same host share one copy of it.
+
+The dataset is loaded once by the server and clients get stories, questions, answer ranges and
+the consensus answers over HTTP on localhost or over a Unix socket:
+
+    python -m maluuba.newsqa serve --combined_data_path combined-newsqa-data-v1.csv --port 8765
+
+    from maluuba.newsqa.server import DatasetClient
+
+    client = DatasetClient(('127.0.0.1', 8765))
+    stories = client.get_all_qas_for_story_ids(story_ids)
+    rows = client.get_rows(0, 100)
+
+The responses are JSON:
+
+* `GET /info`: The number of rows and stories, the version of the dataset and `max_rows`.
+* `GET /story_ids`: The ID of every story, sorted.
+* `POST /stories` with `{"story_ids": [...], "include_no_answers": false}`:
+  Like `NewsQaDataset.get_all_qas_for_story_ids`, many stories are sent in one request.
+* `GET /rows?start=0&stop=100`: The questions, answer ranges and consensus of rows by position,
+  at most `max_rows` (from `GET /info`) rows per request.
+
+The JSON for each story and each range of rows is kept in an LRU cache.
+"""
+import json
+import logging
+import socket
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import six
+from six.moves import BaseHTTPServer, http_client, socketserver
+from six.moves.urllib.parse import parse_qs, urlencode, urlsplit
+
+# The number of responses to keep.
+DEFAULT_CACHE_SIZE = 4096
+# The number of stories for a client to get in one request.
+DEFAULT_BATCH_SIZE = 200
+# The maximum number of rows to send for one request so that a response (which is cached) can't
+# hold most of the dataset.
+DEFAULT_MAX_ROWS = 1000
+
+# The columns of the rows that are sent when they're in the dataset.
+ROW_COLUMNS = ['story_id', 'question', 'answer_char_ranges', 'validated_answers',
+               'is_answer_absent', 'is_question_bad', 'answer_token_ranges', 'sentence_starts']
+
+logger = logging.getLogger('newsqa')
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _to_json_value(value):
+    """
+    :return: A value of the dataset that can be written as JSON, `None` for NaN.
+    """
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+class LruCache(object):
+    """
+    The most recently used values by key. It can be used by many threads.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        """
+        :param max_size: The number of values to keep.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._values.pop(key, None)
+            if value is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            # Make it the most recently used.
+            self._values[key] = value
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._values.pop(key, None)
+            self._values[key] = value
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+
+
+class DatasetService(object):
+    """
+    Makes the JSON responses for a dataset.
+    """
+
+    def __init__(self, newsqa_dataset, cache_size=DEFAULT_CACHE_SIZE,
+                 max_rows=DEFAULT_MAX_ROWS):
+        """
+        :param newsqa_dataset: The `NewsQaDataset` to serve. It's not changed.
+        :param cache_size: The number of stories and ranges of rows to keep as JSON.
+        :param max_rows: The maximum number of rows to send for one request.
+        """
+        self.newsqa_dataset = newsqa_dataset
+        self.max_rows = max_rows
+        self.cache = LruCache(cache_size)
+        # Everything that's computed on first use is computed now so that requests only read.
+        newsqa_dataset._require_story_texts()
+        newsqa_dataset._require_clamped_answer_ranges()
+        self._story_index = newsqa_dataset.story_index
+        self._consensus = newsqa_dataset.compute_consensus()
+        self._info = _dumps(dict(num_rows=len(newsqa_dataset.dataset),
+                                 num_stories=len(self._story_index),
+                                 version=newsqa_dataset.version,
+                                 max_rows=max_rows))
+        self._story_ids = _dumps([story_id for story_id in self._story_index])
+
+    def get_info(self):
+        return self._info
+
+    def get_story_ids(self):
+        return self._story_ids
+
+    def _get_story(self, story_id, include_no_answers):
+        key = ('story', story_id, include_no_answers)
+        result = self.cache.get(key)
+        if result is None:
+            story = self.newsqa_dataset.get_story(story_id)
+            result = _dumps(dict(story_title=story.title,
+                                 story_text=story.text,
+                                 qa_pairs=story.get_qa_pairs(include_no_answers)))
+            self.cache.put(key, result)
+        return result
+
+    def get_stories(self, story_ids, include_no_answers=False):
+        """
+        :param story_ids: The stories to get, unknown stories are left out.
+        :param include_no_answers: `True` to keep answers marked as "None".
+        :return: The title, text and question-answer pairs for each story, by story ID.
+        :rtype: bytes
+        """
+        parts = [_dumps(story_id) + b':' + self._get_story(story_id, include_no_answers)
+                 for story_id in sorted(set(story_ids))
+                 if story_id in self._story_index]
+        return b'{' + b','.join(parts) + b'}'
+
+    def get_rows(self, start, stop):
+        """
+        :param start: The position of the first row.
+        :param stop: The position after the last row.
+            There can be at most `max_rows` rows in the dataset between `start` and `stop`.
+        :return: The rows with their `index` and their consensus answer
+            (`consensus_start`, `consensus_end` and `consensus_status`).
+        :rtype: bytes
+        """
+        dataset = self.newsqa_dataset.dataset
+        start, stop, _ = slice(start, stop).indices(len(dataset))
+        if stop - start > self.max_rows:
+            raise ValueError("At most %d rows can be requested at once, got %d."
+                             % (self.max_rows, stop - start))
+        key = ('rows', start, stop)
+        result = self.cache.get(key)
+        if result is None:
+            rows = dataset.iloc[start:stop]
+            consensus = self._consensus.iloc[start:stop]
+            columns = OrderedDict([('index', rows.index.tolist())])
+            for column in ROW_COLUMNS:
+                if column in rows.columns:
+                    columns[column] = rows[column].tolist()
+            columns['consensus_start'] = consensus['start'].tolist()
+            columns['consensus_end'] = consensus['end'].tolist()
+            columns['consensus_status'] = consensus['status'].astype(object).tolist()
+            names = list(columns.keys())
+            result = _dumps([OrderedDict(zip(names, map(_to_json_value, values)))
+                             for values in zip(*columns.values())])
+            self.cache.put(key, result)
+        return result
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Keep connections open for more requests.
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message):
+        self._send(status, _dumps(dict(error=message)))
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        try:
+            if url.path == '/info':
+                self._send(200, service.get_info())
+            elif url.path == '/story_ids':
+                self._send(200, service.get_story_ids())
+            elif url.path == '/rows':
+                params = parse_qs(url.query)
+                self._send(200, service.get_rows(int(params['start'][0]),
+                                                 int(params['stop'][0])))
+            else:
+                self._send_error(404, "Unknown path: %s" % url.path)
+        except (KeyError, ValueError) as e:
+            self._send_error(400, "Invalid request: %s" % e)
+
+    def do_POST(self):
+        service = self.server.service
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if urlsplit(self.path).path != '/stories':
+            self._send_error(404, "Unknown path: %s" % self.path)
+            return
+        try:
+            request = json.loads(body.decode('utf-8'))
+            story_ids = request['story_ids']
+            if not isinstance(story_ids, list) or \
+                    not all(isinstance(story_id, six.string_types) for story_id in story_ids):
+                raise ValueError("`story_ids` must be a list of strings.")
+            include_no_answers = bool(request.get('include_no_answers', False))
+            result = service.get_stories(story_ids, include_no_answers)
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_error(400, "Invalid request: %s" % e)
+            return
+        self._send(200, result)
+
+    def log_message(self, format, *args):
+        # The client address is empty for Unix sockets.
+        logger.debug("%s", format % args)
+
+
+class _HttpServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixHttpServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class DatasetServer(object):
+    """
+    Serves a dataset to many clients at once, see `DatasetClient`.
+    """
+
+    def __init__(self, newsqa_dataset, address=('127.0.0.1', 0), cache_size=DEFAULT_CACHE_SIZE,
+                 max_rows=DEFAULT_MAX_ROWS):
+        """
+        :param newsqa_dataset: The `NewsQaDataset` to serve. It's not changed.
+        :param address: A `(host, port)` pair to serve HTTP on (port 0 picks a free port)
+            or the path of a Unix socket.
+        :param cache_size: The number of stories and ranges of rows to keep as JSON.
+        :param max_rows: The maximum number of rows to send for one request.
+        """
+        if isinstance(address, six.string_types):
+            self._server = _UnixHttpServer(address, _RequestHandler)
+        else:
+            self._server = _HttpServer(tuple(address), _RequestHandler)
+        self._server.service = DatasetService(newsqa_dataset, cache_size, max_rows)
+        self._thread = None
+
+    @property
+    def address(self):
+        """
+        :return: The address to give to `DatasetClient`.
+        """
+        return self._server.server_address
+
+    @property
+    def cache(self):
+        return self._server.service.cache
+
+    def serve_forever(self):
+        logger.info("Serving the dataset at %s.", self.address)
+        self._server.serve_forever()
+
+    def start(self):
+        """
+        Serve in a background thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+
+
+class _UnixHttpConnection(http_client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        http_client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class DatasetClient(object):
+    """
+    Gets data from a `DatasetServer`. A client should only be used by one thread.
+    """
+
+    def __init__(self, address, batch_size=DEFAULT_BATCH_SIZE, timeout=None):
+        """
+        :param address: The address of the server: a `(host, port)` pair or the path of a
+            Unix socket.
+        :param batch_size: The number of stories to get in one request.
+        :param timeout: (Optional) The number of seconds to wait for the server.
+        """
+        self.address = address
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._connection = None
+        self._info = None
+
+    def _connect(self):
+        if isinstance(self.address, six.string_types):
+            return _UnixHttpConnection(self.address, timeout=self.timeout)
+        host, port = self.address
+        return http_client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _request(self, method, path, data=None):
+        body = None
+        headers = dict()
+        if data is not None:
+            body = _dumps(data)
+            headers['Content-Type'] = 'application/json; charset=utf-8'
+        if self._connection is None:
+            self._connection = self._connect()
+        try:
+            self._connection.request(method, path, body, headers)
+            response = self._connection.getresponse()
+            result = json.loads(response.read().decode('utf-8'))
+        except Exception:
+            self.close()
+            raise
+        if response.status != 200:
+            raise ValueError("%s %s failed with status %d: %s"
+                             % (method, path, response.status, result.get('error')))
+        return result
+
+    def get_info(self):
+        """
+        :return: The number of rows (`num_rows`), the number of stories (`num_stories`), the
+            `version` of the dataset and the maximum number of rows per request (`max_rows`).
+        :rtype: dict
+        """
+        self._info = self._request('GET', '/info')
+        return self._info
+
+    def get_story_ids(self):
+        """
+        :return: The ID of every story, sorted.
+        :rtype: list
+        """
+        return self._request('GET', '/story_ids')
+
+    def get_all_qas_for_story_ids(self, story_ids=None, n_stories=-1, include_no_answers=False):
+        """
+        Like `NewsQaDataset.get_all_qas_for_story_ids`.
+
+        :param story_ids: (Optional) The stories to get. By default, all stories are used.
+        :param n_stories: (Optional) The maximum number of stories to get.
+        :param include_no_answers: `True` to keep answers marked as "None".
+        :return: The title, text and question-answer pairs for each story, by story ID.
+        :rtype: dict
+        """
+        if story_ids:
+            story_ids = set(story_ids)
+            if n_stories >= 0:
+                # Skip unknown stories before limiting the number of stories.
+                story_ids.intersection_update(self.get_story_ids())
+            story_ids = sorted(story_ids)
+        else:
+            story_ids = self.get_story_ids()
+        if n_stories >= 0:
+            story_ids = story_ids[:n_stories]
+        data = dict()
+        for start in six.moves.range(0, len(story_ids), self.batch_size):
+            data.update(self._request('POST', '/stories', dict(
+                story_ids=story_ids[start:start + self.batch_size],
+                include_no_answers=include_no_answers)))
+        return data
+
+    def get_rows(self, start, stop):
+        """
+        :param start: The position of the first row.
+        :param stop: The position after the last row.
+        :return: The rows, see `DatasetService.get_rows`.
+        :rtype: list
+        """
+        info = self._info or self.get_info()
+        start, stop, _ = slice(start, stop).indices(info['num_rows'])
+        result = []
+        # The server sends at most `max_rows` rows per request.
+        for batch_start in six.moves.range(start, stop, info['max_rows']):
+            batch_stop = min(batch_start + info['max_rows'], stop)
+            rows = self._request('GET', '/rows?' + urlencode(dict(start=batch_start,
+                                                                  stop=batch_stop)))
+            result.extend(rows)
+        return result
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -3,7 +3,6 @@ import re
 import string
 from collections import Counter, namedtuple
 
-import numpy as np
 import six
 
 TAG_B = "BBBBBB"
@@ -15,6 +14,9 @@ EDGE_DELIMITER = ":"
 
 Span = namedtuple('Span', ['s', 'e'])
 
+# `string.letters` only exists in Python 2.
+_LETTERS = getattr(string, 'letters', string.ascii_letters)
+
 
 def span_to_string(span):
     return "%d%s%d" % (span.s, EDGE_DELIMITER, span.e)
@@ -133,7 +135,8 @@ def get_most_overlap(span_rack):
             if has_overlap(span_rack[i], span_rack[j]):
                 overlap_counts[i] += 1
                 overlap_counts[j] += 1
-    return np.argmax(overlap_counts)
+    # The first one with the most overlap.
+    return overlap_counts.index(max(overlap_counts))
 
 
 def refine_answers(span_rack, untokenized_text):
@@ -145,12 +148,12 @@ def refine_answers(span_rack, untokenized_text):
 
                 while head < len(tl) and head >= 0 and (tl[head] in string.punctuation or tl[head] in string.whitespace):
                     head += 1
-                while head >= 1 and head < len(tl) and tl[head - 1] in string.letters:
+                while head >= 1 and head < len(tl) and tl[head - 1] in _LETTERS:
                     head -= 1
 
                 while tail >= 1 and tail <= len(tl) and (tl[tail - 1] in string.punctuation or tl[tail - 1] in string.whitespace):
                     tail -= 1
-                while tail >= 1 and tail < len(tl) and tl[tail] in string.letters:
+                while tail >= 1 and tail < len(tl) and tl[tail] in _LETTERS:
                     tail += 1
 
                 if head >= len(tl):
@@ -186,11 +189,11 @@ def valid_span_rack_from_string(validated_answers, untokenized_text):
 
     while head < len(tl) and head >= 0 and (tl[head] in string.punctuation or tl[head] in string.whitespace):
         head += 1
-    while head >= 1 and head < len(tl) and tl[head - 1] in string.letters:
+    while head >= 1 and head < len(tl) and tl[head - 1] in _LETTERS:
         head -= 1
     while tail >= 1 and tail <= len(tl) and (tl[tail - 1] in string.punctuation or tl[tail - 1] in string.whitespace):
         tail -= 1
-    while tail < len(tl) and tail >= 1 and tl[tail] in string.letters:
+    while tail < len(tl) and tail >= 1 and tl[tail] in _LETTERS:
         tail += 1
     if head >= len(tl):
         head = _span.s
@@ -7,69 +7,100 @@ from tqdm import tqdm
 
 try:
     # Prefer a more specific path.
-    from maluuba.newsqa.data_processing import NewsQaDataset
+    from maluuba.newsqa.data_processing import NewsQaDataset, load_story_id_splits
+    from maluuba.newsqa.metrics import get_file_size, get_metrics
 except:
-    from data_processing import NewsQaDataset
+    from data_processing import NewsQaDataset, load_story_id_splits
+    from metrics import get_file_size, get_metrics
 
 _dir_name = os.path.dirname(os.path.abspath(__file__))
 
 logger = logging.getLogger('newsqa')
 
 
-def split_data(dataset_path, output_dir_path='split_data'):
+def split_rows(dataset, split_dir_path=None):
+    """
+    :param dataset: The dataset to split.
+    :param split_dir_path: (Optional) The folder with the story ID split files.
+        Defaults to the split from the paper.
+    :return: The rows for train, dev and test.
+        Rows where no answer was picked are left out.
+    :rtype: tuple
+    """
+    logger.info("Loading story ID's split.")
+    train_story_ids, dev_story_ids, test_story_ids = load_story_id_splits(split_dir_path)
+
+    with get_metrics().stage('split_data', rows=len(dataset)):
+        train_data = []
+        dev_data = []
+        test_data = []
+
+        for row in tqdm(dataset.itertuples(), total=len(dataset),
+                        mininterval=2, unit_scale=True, unit=" questions",
+                        desc="Splitting data"):
+            story_id = row.story_id
+
+            # Filter out when no answer was picked because these weren't used in the original paper.
+            # FIXME Soon, if data was tokenized first, then it won't have answer_char_ranges, so we should check something else.
+            # See the FIXME in the tokenizer for what field to check.
+            answer_char_ranges = row.answer_char_ranges.split('|')
+            none_count = answer_char_ranges.count('None')
+            if none_count == len(answer_char_ranges):
+                continue
+            if story_id in train_story_ids:
+                train_data.append(row)
+            elif story_id in dev_story_ids:
+                dev_data.append(row)
+            elif story_id in test_story_ids:
+                test_data.append(row)
+            else:
+                logger.warning(
+                    "%s is not in train, dev, nor test", story_id)
+
+    return train_data, dev_data, test_data
+
+
+def write_rows(data, columns, path, append=False):
+    """
+    Write rows from `split_rows` to a CSV file.
+
+    :param data: The rows.
+    :param columns: The columns to write.
+    :param path: The path to write to.
+    :param append: `True` to add the rows to the end of an existing file without a header.
+    """
+    logger.info("Writing %d rows to %s", len(data), path)
+    with get_metrics().stage('split_data.write', rows=len(data)) as record:
+        frame = pd.DataFrame(data=data) if data else pd.DataFrame(columns=columns)
+        frame.to_csv(path, mode='a' if append else 'w', header=not append,
+                     columns=columns, index=False, encoding='utf-8')
+        record.add_bytes_written(get_file_size(path))
+
+
+def split_data(dataset_path, output_dir_path='split_data', split_dir_path=None):
+    """
+    :param dataset_path: The path to the dataset to split.
+    :param output_dir_path: The folder to write `train.csv`, `dev.csv` and `test.csv` to.
+    :param split_dir_path: (Optional) The folder with the story ID split files.
+        Defaults to the split from the paper.
+    """
     original = NewsQaDataset.load_combined(dataset_path)
 
-    logger.info("Loading story ID's split.")
-    train_story_ids = set(
-        pd.read_csv(os.path.join(_dir_name, 'train_story_ids.csv'))['story_id'].values)
-    dev_story_ids = set(
-        pd.read_csv(os.path.join(_dir_name, 'dev_story_ids.csv'))['story_id'].values)
-    test_story_ids = set(
-        pd.read_csv(os.path.join(_dir_name, 'test_story_ids.csv'))['story_id'].values)
-
-    train_data = []
-    dev_data = []
-    test_data = []
-
-    for row in tqdm(original.itertuples(), total=len(original),
-                    mininterval=2, unit_scale=True, unit=" questions",
-                    desc="Splitting data"):
-        story_id = row.story_id
-
-        # Filter out when no answer was picked because these weren't used in the original paper.
-        # FIXME Soon, if data was tokenized first, then it won't have answer_char_ranges, so we should check something else.
-        # See the FIXME in the tokenizer for what field to check.
-        answer_char_ranges = row.answer_char_ranges.split('|')
-        none_count = answer_char_ranges.count('None')
-        if none_count == len(answer_char_ranges):
-            continue
-        if story_id in train_story_ids:
-            train_data.append(row)
-        elif story_id in dev_story_ids:
-            dev_data.append(row)
-        elif story_id in test_story_ids:
-            test_data.append(row)
-        else:
-            logger.warning(
-                "%s is not in train, dev, nor test", story_id)
+    train_data, dev_data, test_data = split_rows(original, split_dir_path)
 
     if not os.path.exists(output_dir_path):
         os.makedirs(output_dir_path)
 
-    def _write_to_csv(data, path):
-        logger.info("Writing %d rows to %s", len(data), path)
-        pd.DataFrame(data=data).to_csv(path,
-                                       columns=original.columns.values,
-                                       index=False, encoding='utf-8')
-
-    assert len(train_data) == 92549, "Incorrect amount of training data."
-    assert len(dev_data) == 5166, "Incorrect amount of validation data."
-    assert len(test_data) == 5126, "Incorrect amount of test data."
+    if split_dir_path is None:
+        assert len(train_data) == 92549, "Incorrect amount of training data."
+        assert len(dev_data) == 5166, "Incorrect amount of validation data."
+        assert len(test_data) == 5126, "Incorrect amount of test data."
 
     logger.info("Writing split data to %s", output_dir_path)
-    _write_to_csv(train_data, os.path.join(output_dir_path, 'train.csv'))
-    _write_to_csv(dev_data, os.path.join(output_dir_path, 'dev.csv'))
-    _write_to_csv(test_data, os.path.join(output_dir_path, 'test.csv'))
+    columns = original.columns.values
+    write_rows(train_data, columns, os.path.join(output_dir_path, 'train.csv'))
+    write_rows(dev_data, columns, os.path.join(output_dir_path, 'dev.csv'))
+    write_rows(test_data, columns, os.path.join(output_dir_path, 'test.csv'))
 
 
 if __name__ == '__main__':
@@ -83,5 +114,13 @@ if __name__ == '__main__':
     parser.add_argument('--output_dir_path', '--output_dir', default=default_output_dir,
                         help="The path folder to put the split up data. Default: %s"
                              % default_output_dir)
+    parser.add_argument('--metrics_path',
+                        help="(Optional) The path to write the metrics for each stage to as JSON.")
+    parser.add_argument('--profile_stages', nargs='*', default=[],
+                        help="(Optional) The names of the stages to profile with cProfile.")
     args = parser.parse_args()
+
+    get_metrics().profile_stages.update(args.profile_stages)
     split_data(args.dataset_path, args.output_dir_path)
+    if args.metrics_path:
+        get_metrics().dump(args.metrics_path)
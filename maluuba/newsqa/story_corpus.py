@@ -0,0 +1,230 @@
+"""
+A file of story texts that can be memory-mapped and shared by several processes.
+
+A corpus at `path` is made of:
+
+* `path`: the UTF-8 encoded texts of all stories concatenated together.
+* `path + '.ids.npy'`: the story IDs, sorted.
+* `path + '.offsets.npy'`: the byte offsets of each story in `path`
+  so the text for `story_ids[i]` is `path[offsets[i]:offsets[i + 1]]`.
+
+Opening a corpus only maps the files, story texts are decoded when they are accessed.
+Since the pages come from the OS page cache, processes that open the same corpus share them.
+
+Files are written to temporary paths and renamed over the old ones, index files last,
+so processes that have the old corpus mapped keep reading the old files.
+"""
+import io
+import os
+
+import numpy as np
+import six
+
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    from maluuba.newsqa.checkpoints import get_temp_path, replace_file
+except:
+    # In case you're running this file from this folder.
+    from checkpoints import get_temp_path, replace_file
+
+_IDS_SUFFIX = '.ids.npy'
+_OFFSETS_SUFFIX = '.offsets.npy'
+
+
+def _save_array(path, array):
+    # `np.save` would add ".npy" to paths without it so use a file object.
+    with io.open(path, 'wb') as f:
+        np.save(f, array, allow_pickle=False)
+
+
+def _remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _install(path, text_temp_path, story_ids, offsets):
+    """
+    Write the index of a corpus next to `path` and rename the texts at `text_temp_path` and the
+    index to their paths. Nothing is renamed until every file is written.
+    """
+    ids_temp_path = get_temp_path(path + _IDS_SUFFIX)
+    offsets_temp_path = get_temp_path(path + _OFFSETS_SUFFIX)
+    try:
+        _save_array(ids_temp_path, np.array(story_ids, dtype=six.text_type))
+        _save_array(offsets_temp_path, offsets)
+    except BaseException:
+        _remove_files([text_temp_path, ids_temp_path, offsets_temp_path])
+        raise
+    replace_file(text_temp_path, path)
+    replace_file(ids_temp_path, path + _IDS_SUFFIX)
+    replace_file(offsets_temp_path, path + _OFFSETS_SUFFIX)
+
+
+def write_story_corpus(story_texts, path):
+    """
+    Write a story corpus.
+
+    :param story_texts: A `dict` (or iterable of pairs) from story ID to story text.
+    :param path: The path to write the texts to.
+        The index is written next to it.
+    :return: The number of stories written.
+    """
+    if isinstance(story_texts, dict):
+        story_texts = six.iteritems(story_texts)
+    story_texts = sorted(story_texts)
+    story_ids = [story_id for story_id, _ in story_texts]
+    if len(set(story_ids)) != len(story_ids):
+        raise ValueError("Story IDs must be unique.")
+
+    offsets = np.zeros(len(story_texts) + 1, dtype=np.int64)
+    text_temp_path = get_temp_path(path)
+    try:
+        with io.open(text_temp_path, 'wb') as f:
+            for i, (_, story_text) in enumerate(story_texts):
+                data = story_text.encode('utf-8')
+                f.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+    except BaseException:
+        _remove_files([text_temp_path])
+        raise
+
+    _install(path, text_temp_path, story_ids, offsets)
+    return len(story_ids)
+
+
+def add_to_story_corpus(story_texts, path, output_path=None):
+    """
+    Add stories to a story corpus.
+    The texts of the stories already in the corpus are copied as they are, without decoding them.
+
+    :param story_texts: A `dict` (or iterable of pairs) from story ID to story text.
+        Stories that are already in the corpus are left as they are.
+    :param path: The path of the corpus, as given to `write_story_corpus`.
+    :param output_path: (Optional) The path to write the new corpus to. Defaults to `path`.
+    :return: The number of stories added.
+    """
+    if output_path is None:
+        output_path = path
+    if isinstance(story_texts, dict):
+        story_texts = six.iteritems(story_texts)
+    corpus = StoryCorpus(path)
+    story_texts = sorted((story_id, story_text) for story_id, story_text in story_texts
+                         if story_id not in corpus)
+    new_story_ids = np.array([story_id for story_id, _ in story_texts], dtype=six.text_type)
+    if len(set(new_story_ids)) != len(new_story_ids):
+        raise ValueError("Story IDs must be unique.")
+    new_data = [story_text.encode('utf-8') for _, story_text in story_texts]
+
+    # Where each new story goes between the stories already in the corpus.
+    positions = np.searchsorted(corpus.story_ids, new_story_ids)
+    offsets = corpus.offsets
+    text_temp_path = get_temp_path(output_path)
+    try:
+        with io.open(text_temp_path, 'wb') as f:
+            previous = 0
+            for position, data in zip(positions, new_data):
+                f.write(corpus._texts[offsets[previous]:offsets[position]])
+                f.write(data)
+                previous = position
+            f.write(corpus._texts[offsets[previous]:offsets[-1]])
+    except BaseException:
+        _remove_files([text_temp_path])
+        raise
+
+    story_ids = np.concatenate([corpus.story_ids, new_story_ids])
+    lengths = np.concatenate([np.diff(offsets),
+                              np.array([len(data) for data in new_data], dtype=np.int64)])
+    corpus.close()
+    order = np.argsort(story_ids, kind='mergesort')
+    offsets = np.zeros(len(story_ids) + 1, dtype=np.int64)
+    np.cumsum(lengths[order], out=offsets[1:])
+    _install(output_path, text_temp_path, story_ids[order], offsets)
+    return len(new_data)
+
+
+def get_story_corpus_paths(path):
+    """
+    :param path: The path of a corpus, as given to `write_story_corpus`.
+    :return: The paths of the files of the corpus, the texts first.
+    :rtype: list
+    """
+    return [path, path + _IDS_SUFFIX, path + _OFFSETS_SUFFIX]
+
+
+class StoryCorpus(object):
+    """
+    Read-only, memory-mapped story texts by story ID.
+
+    Behaves like a `dict` from story ID to story text.
+    Pickling only keeps the path so a corpus sent to worker processes is re-mapped, not copied.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The path of the corpus, as given to `write_story_corpus`.
+        """
+        self.path = path
+        self.story_ids = np.load(path + _IDS_SUFFIX, mmap_mode='r')
+        self.offsets = np.load(path + _OFFSETS_SUFFIX, mmap_mode='r')
+        if len(self.offsets) != len(self.story_ids) + 1:
+            # The index files were opened while they were being replaced.
+            raise ValueError("The index of the story corpus `%s` is inconsistent, "
+                             "open it again." % path)
+        if os.path.getsize(path) > 0:
+            self._texts = np.memmap(path, dtype=np.uint8, mode='r')
+        else:
+            # Empty files can't be mapped.
+            self._texts = np.zeros(0, dtype=np.uint8)
+
+    def __getstate__(self):
+        return dict(path=self.path)
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def __len__(self):
+        return len(self.story_ids)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, story_id):
+        return self._find(story_id) >= 0
+
+    def __getitem__(self, story_id):
+        i = self._find(story_id)
+        if i < 0:
+            raise KeyError(story_id)
+        return self._get_text(i)
+
+    def _find(self, story_id):
+        i = int(np.searchsorted(self.story_ids, story_id))
+        if i < len(self.story_ids) and self.story_ids[i] == story_id:
+            return i
+        return -1
+
+    def _get_text(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self._texts[start:end].tobytes().decode('utf-8')
+
+    def get(self, story_id, default=None):
+        i = self._find(story_id)
+        if i < 0:
+            return default
+        return self._get_text(i)
+
+    def keys(self):
+        return [six.text_type(story_id) for story_id in self.story_ids]
+
+    def items(self):
+        for i, story_id in enumerate(self.story_ids):
+            yield six.text_type(story_id), self._get_text(i)
+
+    def close(self):
+        """
+        Drop the references to the mapped files.
+        They get unmapped once no more views of them exist.
+        """
+        self.story_ids = self.offsets = self._texts = None
@@ -0,0 +1,308 @@
+"""
+Generate synthetic data shaped like NewsQA.
+
+The real stories and questions can't be distributed so this makes a fake `cnn_stories.tgz`,
+a matching `newsqa-data-v1.csv` and story ID split files to measure performance with.
+The stories have `@highlight` sections and copyright lines, and the story IDs that need special
+handling when loading are used so that every path of the loader is exercised.
+
+At a scale of 1 there are as many stories as in the real dataset with about as many questions.
+"""
+from __future__ import unicode_literals
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import tarfile
+
+import pandas as pd
+import six
+
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    from maluuba.newsqa.data_processing import get_num_extra_newlines, read_story_text
+except:
+    # In case you're running this file from this folder.
+    from data_processing import get_num_extra_newlines, read_story_text
+
+_dir_name = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger('newsqa')
+
+# Roughly the shape of the real data.
+NUM_QUESTIONS_PER_STORY = 9.5
+NUM_LINES_PER_STORY = (8, 40)
+NUM_WORDS_PER_SENTENCE = (6, 32)
+NUM_SOURCERS = 3
+
+METADATA_FILENAME = 'synthetic_data.json'
+
+_QUESTION_WORDS = ['What', 'What', 'What', 'Who', 'Who', 'How', 'When', 'Where', 'Which', 'Why',
+                   'In', 'The', 'Did']
+_CITIES = ['NEW DELHI, India', 'ATLANTA, Georgia', 'LONDON, England', 'NAIROBI, Kenya',
+           'TOKYO, Japan', 'Caf\xe9 CITY, France']
+_COPYRIGHT_LINES = ['Copyright 2008 CNN. All rights reserved.',
+                    'Entire contents of this article copyright, Cable News Network.']
+
+_token_pattern = re.compile(r'\S+')
+
+
+def _read_ids(path, has_header):
+    with io.open(path, 'r', encoding='utf-8') as f:
+        lines = f.read().split('\n')
+    if has_header:
+        lines = lines[1:]
+    return [line for line in lines if line]
+
+
+def _make_vocab(rng, size=20000):
+    consonants = 'bcdfghjklmnprstvwz'
+    vowels = 'aeiou'
+    vocab = set()
+    while len(vocab) < size:
+        word = ''.join(rng.choice(consonants) + rng.choice(vowels)
+                       for _ in six.moves.range(rng.randint(1, 4)))
+        vocab.add(word)
+    vocab = sorted(vocab)
+    # A few accented words to exercise decoding.
+    vocab.extend(['caf\xe9', 'na\xefve', '\u2022', '\u20ac5'])
+    return vocab
+
+
+def _make_sentence(rng, vocab):
+    words = [rng.choice(vocab) for _ in six.moves.range(rng.randint(*NUM_WORDS_PER_SENTENCE))]
+    words[0] = words[0].capitalize()
+    if rng.random() < 0.2:
+        words[rng.randrange(len(words))] += ','
+    return ' '.join(words) + rng.choice(['.', '.', '.', '?', '!'])
+
+
+def make_story_file(rng, vocab):
+    """
+    :return: The bytes of a story file like in `cnn_stories.tgz`.
+    """
+    lines = ['%s (CNN) -- %s' % (rng.choice(_CITIES), _make_sentence(rng, vocab)), '']
+    for _ in six.moves.range(rng.randint(*NUM_LINES_PER_STORY)):
+        lines.append(' '.join(_make_sentence(rng, vocab)
+                               for _ in six.moves.range(rng.randint(1, 3))))
+        lines.append('')
+    if rng.random() < 0.3:
+        lines.append(rng.choice(_COPYRIGHT_LINES))
+        lines.append('')
+    for _ in six.moves.range(rng.randint(3, 4)):
+        lines.extend(['@highlight', '', _make_sentence(rng, vocab), ''])
+    # Some files have Windows line endings.
+    newline = '\r\n' if rng.random() < 0.05 else '\n'
+    return newline.join(lines).encode('utf-8')
+
+
+def _make_char_range(rng, tokens, story_length):
+    start = rng.randrange(len(tokens))
+    end = min(len(tokens), start + rng.randint(1, 6)) - 1
+    char_start, char_end = tokens[start].start(), tokens[end].end()
+    if char_end < story_length:
+        # Most answers include the whitespace after them.
+        char_end += 1
+    r = rng.random()
+    if r < 0.003:
+        # A few ranges go past the end of the story.
+        char_end = story_length + rng.randint(1, 20)
+    elif r < 0.005:
+        # And a few are backwards.
+        char_start, char_end = char_end, char_start
+    return '%d:%d' % (char_start, char_end)
+
+
+def _is_forward(char_range):
+    start, end = map(int, char_range.split(':'))
+    return start < end
+
+
+def make_question_rows(rng, vocab, story_id, story_text, num_questions):
+    """
+    :return: The rows for questions about a story like in `newsqa-data-v1.csv`.
+    """
+    tokens = list(_token_pattern.finditer(story_text))
+    rows = []
+    for _ in six.moves.range(num_questions):
+        question = '%s %s?' % (
+            rng.choice(_QUESTION_WORDS),
+            ' '.join(rng.choice(vocab) for _ in six.moves.range(rng.randint(2, 9))))
+        answers = []
+        for _ in six.moves.range(NUM_SOURCERS):
+            if rng.random() < 0.15 or not tokens:
+                answers.append('None')
+            else:
+                answers.append(','.join(_make_char_range(rng, tokens, len(story_text))
+                                        for _ in six.moves.range(
+                                            1 if rng.random() < 0.9 else 2)))
+        num_none = answers.count('None')
+        is_answer_absent = num_none * 1.0 / NUM_SOURCERS
+        is_question_bad = '?' if rng.random() < 0.1 else repr(rng.choice([0.0, 0.0, 0.0, 0.5]))
+        validated_answers = ''
+        if rng.random() < 0.5:
+            candidates = [a for a in '|'.join(answers).replace(',', '|').split('|')
+                          if a != 'None' and _is_forward(a)] + ['none', 'bad_question']
+            counts = {}
+            for _ in six.moves.range(rng.choice([2, 3, 3, 5])):
+                choice = rng.choice(candidates)
+                counts[choice] = counts.get(choice, 0) + 1
+            validated_answers = '{%s}' % ', '.join(
+                '"%s": %d' % (k, v) for k, v in sorted(counts.items()))
+        rows.append(dict(story_id=story_id,
+                         question=question,
+                         answer_char_ranges='|'.join(answers),
+                         is_answer_absent=is_answer_absent,
+                         is_question_bad=is_question_bad,
+                         validated_answers=validated_answers))
+    return rows
+
+
+def get_story_ids(scale=1.0):
+    """
+    :param scale: The size relative to the real dataset.
+    :return: The story IDs to generate and the IDs requiring each special case.
+        The real story IDs are used first, starting with the ones that need special handling.
+    """
+    special_ids = [
+        set(_read_ids(os.path.join(_dir_name, name), has_header=False))
+        for name in ['stories_to_decode_specially.csv',
+                     'stories_requiring_extra_newline.csv',
+                     'stories_requiring_two_extra_newlines.csv']]
+    real_ids = []
+    for data_type in ('train', 'dev', 'test'):
+        real_ids.extend(_read_ids(os.path.join(_dir_name, '%s_story_ids.csv' % data_type),
+                                  has_header=True))
+    real_ids.sort(key=lambda story_id: (story_id not in special_ids[0], story_id))
+
+    num_stories = max(1, int(round(len(real_ids) * scale)))
+    story_ids = real_ids[:num_stories]
+    for i in six.moves.range(num_stories - len(story_ids)):
+        story_ids.append('./cnn/stories/%s.story'
+                         % hashlib.sha1(('synthetic-%d' % i).encode('utf-8')).hexdigest())
+    return story_ids, special_ids
+
+
+def generate(output_dir_path, scale=1.0, seed=0, chunk_size=10000):
+    """
+    Write `cnn_stories.tgz`, `newsqa-data-v1.csv` and the story ID split files.
+
+    :param output_dir_path: The folder to write the files to.
+    :param scale: The size relative to the real dataset.
+    :param seed: The seed for the random number generator.
+    :param chunk_size: The number of question rows to write at a time.
+    :return: The paths of the stories and of the questions.
+    :rtype: tuple
+    """
+    if not os.path.exists(output_dir_path):
+        os.makedirs(output_dir_path)
+    rng = random.Random(seed)
+    vocab = _make_vocab(rng)
+    story_ids, (decode_specially_ids, extra_newline_ids, two_extra_newlines_ids) = \
+        get_story_ids(scale)
+    logger.info("Generating %d stories in `%s`.", len(story_ids), output_dir_path)
+
+    cnn_stories_path = os.path.join(output_dir_path, 'cnn_stories.tgz')
+    dataset_path = os.path.join(output_dir_path, 'newsqa-data-v1.csv')
+    columns = ['story_id', 'question', 'answer_char_ranges', 'is_answer_absent',
+               'is_question_bad', 'validated_answers']
+    rows = []
+    header = True
+    splits = dict(train=[], dev=[], test=[])
+    with tarfile.open(cnn_stories_path, 'w:gz') as t:
+        for i, story_id in enumerate(story_ids):
+            data = make_story_file(rng, vocab)
+            info = tarfile.TarInfo(story_id)
+            info.size = len(data)
+            t.addfile(info, io.BytesIO(data))
+
+            story_text = read_story_text(
+                data,
+                decode_specially=story_id in decode_specially_ids,
+                num_extra_newlines=get_num_extra_newlines(story_id, extra_newline_ids,
+                                                          two_extra_newlines_ids))
+            num_questions = max(1, int(rng.gauss(NUM_QUESTIONS_PER_STORY, 3)))
+            rows.extend(make_question_rows(rng, vocab, story_id, story_text, num_questions))
+            splits['train' if i % 20 < 18 else ('dev' if i % 20 == 18 else 'test')].append(
+                story_id)
+
+            if len(rows) >= chunk_size:
+                pd.DataFrame(rows, columns=columns).to_csv(
+                    dataset_path, mode='w' if header else 'a', header=header, index=False,
+                    encoding='utf-8')
+                header = False
+                rows = []
+    pd.DataFrame(rows, columns=columns).to_csv(
+        dataset_path, mode='w' if header else 'a', header=header, index=False, encoding='utf-8')
+
+    for data_type, ids in splits.items():
+        pd.DataFrame(dict(story_id=ids), columns=['story_id']).to_csv(
+            os.path.join(output_dir_path, '%s_story_ids.csv' % data_type), index=False)
+
+    metadata_path = os.path.join(output_dir_path, METADATA_FILENAME)
+    with io.open(metadata_path, 'w', encoding='utf-8') as f:
+        f.write(six.text_type(json.dumps(dict(scale=scale, seed=seed,
+                                              num_stories=len(story_ids)))))
+
+    return cnn_stories_path, dataset_path
+
+
+_tokenizer_pattern = re.compile(r"\w+|[^\w\s]+", re.UNICODE)
+_sentence_endings = {'.', '?', '!'}
+
+
+def tokenize_line(line):
+    """
+    A rough stand-in for `TokenizerSplitter.java`.
+
+    :param line: A line of text.
+    :return: The sentences in the line with tokens separated by spaces.
+    :rtype: list
+    """
+    sentences = []
+    tokens = []
+    for token in _tokenizer_pattern.findall(line):
+        tokens.append(token)
+        if token in _sentence_endings:
+            sentences.append(' '.join(tokens))
+            tokens = []
+    if tokens:
+        sentences.append(' '.join(tokens))
+    if not sentences:
+        sentences.append('')
+    return sentences
+
+
+def tokenize_packed_file(packed_path, output_path):
+    """
+    Tokenize a packed file in the same format as `TokenizerSplitter.java` but with
+    `tokenize_line`, for when Java and the Stanford JARs aren't available.
+    """
+    # Like Java's `readLine`, split on any kind of line ending.
+    with io.open(packed_path, 'r', encoding='utf-8') as packed, \
+            io.open(output_path, 'w', encoding='utf-8', newline='\n') as output:
+        for line in packed:
+            sentences = tokenize_line(line.rstrip('\n'))
+            output.write('%d\n' % len(sentences))
+            for sentence in sentences:
+                output.write(sentence)
+                output.write('\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic NewsQA-shaped data.")
+    parser.add_argument('--output_dir_path', default='synthetic_data',
+                        help="The folder to write the data to.")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="The size relative to the real dataset. E.g. 1, 10, or 100.")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    generate(args.output_dir_path, args.scale, args.seed)
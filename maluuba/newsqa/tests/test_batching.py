@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from maluuba.newsqa.batching import BatchIterator
+from maluuba.newsqa.token_arrays import PAD_ID, TokenArrays, export_token_arrays
+
+
+class TestBatching(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir_path = tempfile.mkdtemp()
+        rng = np.random.RandomState(0)
+        rows = []
+        for story_number in range(20):
+            story_text = ' '.join('w%d' % rng.randint(50)
+                                  for _ in range(rng.randint(5, 60)))
+            for question_number in range(rng.randint(1, 5)):
+                rows.append(dict(
+                    story_id='s%d' % story_number,
+                    question=' '.join('q%d' % rng.randint(20)
+                                      for _ in range(rng.randint(2, 8))),
+                    is_answer_absent=0.0,
+                    story_text=story_text,
+                    answer_token_ranges='1:3' if question_number % 3 else '-1:-1',
+                    sentence_starts=str(len(story_text.split()))))
+        cls.num_questions = len(rows)
+        export_token_arrays(pd.DataFrame(rows), cls.dir_path)
+        cls.token_arrays = TokenArrays(cls.dir_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir_path)
+
+    def test_batches(self):
+        batches = BatchIterator(self.token_arrays, batch_size=4, bucket_size=2, workers=2,
+                                prefetch=2)
+        seen = []
+        for batch in batches.iterate(0):
+            for row, question_index in enumerate(batch.question_indices):
+                seen.append(question_index)
+                story_tokens = self.token_arrays.get_story_tokens(
+                    self.token_arrays.question_stories[question_index])
+                self.assertEqual(len(story_tokens), batch.story_lengths[row])
+                np.testing.assert_array_equal(story_tokens,
+                                              batch.story_tokens[row, :len(story_tokens)])
+                self.assertTrue((batch.story_tokens[row, len(story_tokens):] == PAD_ID).all())
+                np.testing.assert_array_equal(
+                    self.token_arrays.get_question_tokens(question_index),
+                    batch.question_tokens[row, :batch.question_lengths[row]])
+                answers = self.token_arrays.get_answers(question_index)
+                self.assertEqual(answers[0][0], batch.answer_starts[row])
+                self.assertEqual(answers[0][1], batch.answer_ends[row])
+        self.assertListEqual(list(range(self.num_questions)), sorted(seen))
+        self.assertEqual(len(batches), len(batches.get_batch_indices(0)))
+
+    def test_deterministic(self):
+        def get_order(epoch, workers):
+            batches = BatchIterator(self.dir_path, batch_size=4, seed=3, workers=workers)
+            return [list(batch.question_indices) for batch in batches.iterate(epoch)]
+
+        self.assertListEqual(get_order(0, 1), get_order(0, 3))
+        self.assertNotEqual(get_order(0, 1), get_order(1, 1))
+
+    def test_bucketing(self):
+        batches = BatchIterator(self.token_arrays, batch_size=4, shuffle=False, drop_last=True,
+                                max_story_length=30)
+        lengths = [batch.story_lengths for batch in batches]
+        self.assertEqual(self.num_questions // 4, len(lengths))
+        for previous, current in zip(lengths, lengths[1:]):
+            self.assertLessEqual(previous.max(), current.min())
+        self.assertLessEqual(max(length.max() for length in lengths), 30)
+
+    def test_truncated_answers(self):
+        # The answers are at tokens 1 to 3.
+        for max_story_length, expected in [(2, (1, 2)), (1, (-1, -1)), (3, (1, 3))]:
+            batches = BatchIterator(self.token_arrays, batch_size=8, shuffle=False,
+                                    max_story_length=max_story_length, workers=1)
+            for batch in batches:
+                for row, question_index in enumerate(batch.question_indices):
+                    if len(self.token_arrays.get_answers(question_index)) == 0 \
+                            or self.token_arrays.get_answers(question_index)[0][0] < 0:
+                        self.assertEqual(-1, batch.answer_starts[row])
+                        continue
+                    self.assertEqual(expected,
+                                     (batch.answer_starts[row], batch.answer_ends[row]))
+                    self.assertLessEqual(batch.answer_ends[row], batch.story_lengths[row])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from maluuba.newsqa import synthetic_data
+from maluuba.newsqa.checkpoints import atomic_output, get_frame_key
+from maluuba.newsqa.data_processing import NewsQaDataset
+from maluuba.newsqa.tokenize_dataset import get_java_tokenizer_version, tokenize_data
+
+
+class _Interrupted(Exception):
+    pass
+
+
+class TestCheckpoints(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.num_tokenized = 0
+        self.fail_after = None
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def _tokenizer(self, packed_path, tokenized_path):
+        if self.fail_after is not None and self.num_tokenized >= self.fail_after:
+            raise _Interrupted()
+        self.num_tokenized += 1
+        synthetic_data.tokenize_packed_file(packed_path, tokenized_path)
+
+    def _read(self, path):
+        with io.open(path, 'rb') as f:
+            return f.read()
+
+    def test_atomic_output(self):
+        path = os.path.join(self.dir_path, 'output.csv')
+        with atomic_output(path) as temp_path:
+            self.assertTrue(temp_path.endswith('.csv'))
+            with io.open(temp_path, 'w') as f:
+                f.write(u"done")
+        with self.assertRaises(_Interrupted):
+            with atomic_output(path) as temp_path:
+                with io.open(temp_path, 'w') as f:
+                    f.write(u"partial")
+                raise _Interrupted()
+        self.assertEqual(b"done", self._read(path))
+        self.assertListEqual(['output.csv'], os.listdir(self.dir_path))
+
+    def test_resume(self):
+        cnn_stories_path, dataset_path = synthetic_data.generate(self.dir_path, scale=0.002)
+        dataset = NewsQaDataset(cnn_stories_path, dataset_path).dataset
+        self.assertNotEqual(get_frame_key(dataset.iloc[:50]), get_frame_key(dataset.iloc[1:51]))
+        self.assertNotEqual(get_frame_key(dataset, 'v1'), get_frame_key(dataset, 'v2'))
+
+        expected_path = os.path.join(self.dir_path, 'expected.csv')
+        tokenize_data(dataset, expected_path, os.path.join(self.dir_path, 'expected'),
+                      self._tokenizer, shard_size=len(dataset))
+
+        shard_size = 50
+        num_shards = (len(dataset) + shard_size - 1) // shard_size
+        self.assertGreater(num_shards, 3)
+        output_path = os.path.join(self.dir_path, 'tokenized.csv')
+        work_path_prefix = os.path.join(self.dir_path, 'tokenized')
+        self.num_tokenized = 0
+        self.fail_after = 2
+        with self.assertRaises(_Interrupted):
+            tokenize_data(dataset, output_path, work_path_prefix, self._tokenizer,
+                          shard_size=shard_size)
+        self.assertFalse(os.path.exists(output_path))
+        self.assertEqual(2, len(os.listdir(work_path_prefix + '.shards')))
+
+        # Only the shards that weren't done are tokenized.
+        self.num_tokenized = 0
+        self.fail_after = None
+        tokenize_data(dataset, output_path, work_path_prefix, self._tokenizer,
+                      shard_size=shard_size)
+        self.assertEqual(num_shards - 2, self.num_tokenized)
+        self.assertEqual(self._read(expected_path), self._read(output_path))
+        self.assertFalse(os.path.exists(work_path_prefix + '.shards'))
+
+        # Shards whose rows changed are tokenized again.
+        self.fail_after = 1
+        with self.assertRaises(_Interrupted):
+            tokenize_data(dataset, output_path, work_path_prefix, self._tokenizer,
+                          shard_size=shard_size)
+        self.assertEqual(self._read(expected_path), self._read(output_path))
+        changed = dataset.copy()
+        changed.iat[0, changed.columns.get_loc('question')] = u"What changed here?"
+        self.num_tokenized = 0
+        self.fail_after = None
+        tokenize_data(changed, output_path, work_path_prefix, self._tokenizer,
+                      shard_size=shard_size)
+        self.assertEqual(num_shards, self.num_tokenized)
+
+
+    def test_resume_done_java_shards(self):
+        cnn_stories_path, dataset_path = synthetic_data.generate(self.dir_path, scale=0.002)
+        dataset = NewsQaDataset(cnn_stories_path, dataset_path).dataset
+        output_path = os.path.join(self.dir_path, 'tokenized.csv')
+        work_path_prefix = os.path.join(self.dir_path, 'tokenized')
+        shard_size = 50
+        self.fail_after = 2
+        with self.assertRaises(_Interrupted):
+            tokenize_data(dataset, output_path, work_path_prefix, self._tokenizer,
+                          tokenizer_version=get_java_tokenizer_version(), shard_size=shard_size)
+
+        # Every shard is done so the JARs and Java aren't needed.
+        tokenize_data(dataset.iloc[:2 * shard_size], output_path, work_path_prefix,
+                      shard_size=shard_size)
+        self.assertEqual(2 * shard_size, len(NewsQaDataset.load_combined(output_path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from maluuba.newsqa import synthetic_data
+from maluuba.newsqa.__main__ import main
+from maluuba.newsqa.data_processing import NewsQaDataset
+
+_ROOT_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+
+class TestCli(unittest.TestCase):
+    def test_lazy_imports(self):
+        code = ("import sys\n"
+                "from maluuba.newsqa import __main__, span_utils\n"
+                "__main__._get_parser()\n"
+                "print(','.join(sorted(m for m in ('numpy', 'pandas', 'tqdm') "
+                "if m in sys.modules)))\n")
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=_ROOT_PATH)
+        self.assertEqual(b'', output.strip())
+
+    def test_commands(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            cnn_stories_path, dataset_path = synthetic_data.generate(dir_path, scale=0.002)
+            combined_path = os.path.join(dir_path, 'combined-v1.csv')
+            json_path = os.path.join(dir_path, 'combined-v1.json')
+            self.assertEqual(0, main(['build', '--cnn_stories_path', cnn_stories_path,
+                                      '--dataset_path', dataset_path,
+                                      '--split_dir_path', dir_path, '--workers', '1',
+                                      '--output_paths', combined_path, json_path]))
+            expected = NewsQaDataset(cnn_stories_path, dataset_path)
+            with io.open(json_path, 'r', encoding='utf-8') as f:
+                self.assertEqual(len(expected.story_index), len(json.load(f)['data']))
+
+            combined = ['--combined_data_path', combined_path]
+            common = combined + ['--workers', '1']
+            self.assertIn(main(['validate', '--chunk-size', '50'] + common), [0, 1])
+            self.assertEqual(0, main(['stats'] + combined))
+            # Commands that don't process rows in parallel don't take the options.
+            with self.assertRaises(SystemExit):
+                main(['stats'] + common)
+
+            path = os.path.join(dir_path, 'combined.jsonl.gz')
+            self.assertEqual(0, main(['export', '--output_path', path] + common))
+            with gzip.open(path, 'rt') as f:
+                self.assertEqual(len(expected.dataset), sum(1 for _ in f))
+        finally:
+            shutil.rmtree(dir_path)
+
+    def test_export_shareable(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            cnn_stories_path, dataset_path = synthetic_data.generate(dir_path, scale=0.002)
+            combined_path = os.path.join(dir_path, 'combined-v1.csv')
+            NewsQaDataset(cnn_stories_path, dataset_path).dump(combined_path, workers=1)
+            common = ['export', '--shareable', '--combined_data_path', combined_path,
+                      '--workers', '1', '--output_path']
+
+            path = os.path.join(dir_path, 'shareable.jsonl.gz')
+            self.assertEqual(0, main(common + [path]))
+            with gzip.open(path, 'rt') as f:
+                rows = [json.loads(line) for line in f]
+            self.assertEqual(len(NewsQaDataset.load_combined(combined_path)), len(rows))
+            self.assertIn('question', rows[0])
+            self.assertNotIn('story_text', rows[0])
+
+            path = os.path.join(dir_path, 'shareable.csv')
+            self.assertEqual(0, main(common + [path]))
+            with io.open(path, 'r', encoding='utf-8') as f:
+                header = f.readline()
+            self.assertIn('question', header)
+            self.assertNotIn('story_text', header)
+
+            path = os.path.join(dir_path, 'shareable.json')
+            self.assertEqual(2, main(common + [path]))
+            self.assertFalse(os.path.exists(path))
+        finally:
+            shutil.rmtree(dir_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from maluuba.newsqa import synthetic_data
+from maluuba.newsqa.consensus import BAD_QUESTION, NO_ANSWER, SPAN, compute_consensus
+from maluuba.newsqa.data_processing import NewsQaDataset, get_consensus_answer
+
+
+class TestConsensus(unittest.TestCase):
+    def test_compute_consensus(self):
+        rows = [
+            ('4:8|4:8|0:3', '', '0.0', (4, 8, SPAN)),
+            # The first answer given on a tie.
+            ('0:3,4:8|4:8,0:3', '', '?', (0, 3, SPAN)),
+            ('None|None|4:8', '', '0.0', (-1, -1, NO_ANSWER)),
+            ('None|None|4:8', '', '0.5', (-1, -1, BAD_QUESTION)),
+            ('', '', '0.0', (-1, -1, NO_ANSWER)),
+            ('None|4:8|0:3', '{"4:8":2,"none":1}', '0.0', (4, 8, SPAN)),
+            ('None|4:8|0:3', '{"none":2,"4:8":1}', '0.0', (-1, -1, NO_ANSWER)),
+            ('None|4:8|0:3', '{"bad_question":2,"4:8":1}', '1.0', (-1, -1, BAD_QUESTION)),
+            # No majority.
+            ('None|4:8|0:3', '{"4:8":1,"0:3":1,"none":1}', '0.0', (-1, -1, NO_ANSWER)),
+            # Half of the votes.
+            ('None|4:8|0:3', '{"0:3":1,"4:8":1}', '0.0', (0, 3, SPAN)),
+        ]
+        dataset = pd.DataFrame(
+            [dict(answer_char_ranges=answer_char_ranges, validated_answers=validated_answers,
+                  is_question_bad=is_question_bad)
+             for answer_char_ranges, validated_answers, is_question_bad, _ in rows],
+            index=range(5, 5 + len(rows)))
+        consensus = compute_consensus(dataset)
+        self.assertListEqual(list(dataset.index), list(consensus.index))
+        self.assertListEqual([expected for _, _, _, expected in rows],
+                             list(zip(consensus['start'], consensus['end'],
+                                      consensus['status'])))
+
+        consensus = compute_consensus(dataset[['answer_char_ranges']])
+        self.assertListEqual([4, 0] + [-1] * 8, consensus['start'].tolist())
+        self.assertNotIn(BAD_QUESTION, consensus['status'].tolist())
+        self.assertEqual(0, len(compute_consensus(dataset.iloc[:0])))
+
+    def test_synthetic(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            cnn_stories_path, dataset_path = synthetic_data.generate(dir_path, scale=0.005)
+            newsqa_dataset = NewsQaDataset(cnn_stories_path, dataset_path, lazy=True)
+            consensus = newsqa_dataset.compute_consensus()
+            self.assertIs(consensus, newsqa_dataset.compute_consensus())
+            expected = [get_consensus_answer(row.answer_char_ranges, row.validated_answers)
+                        for row in newsqa_dataset.dataset.itertuples()]
+            self.assertListEqual(expected,
+                                 [(start, end) if start >= 0 else (None, None)
+                                  for start, end in zip(consensus['start'].tolist(),
+                                                        consensus['end'].tolist())])
+        finally:
+            shutil.rmtree(dir_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from maluuba.newsqa import synthetic_data
+from maluuba.newsqa.data_processing import NewsQaDataset
+from maluuba.newsqa.evaluation import TOKEN, evaluate, get_f1, normalize_answer
+
+
+class TestEvaluation(unittest.TestCase):
+    def test_normalize_answer(self):
+        self.assertEqual(u"cat sat on mat", normalize_answer(u" The cat, sat on a  MAT! "))
+        self.assertEqual(u"", normalize_answer(u"The."))
+        self.assertAlmostEqual(0.5, get_f1(u"a b".split(), u"a c".split()))
+        self.assertEqual(1.0, get_f1([], []))
+        self.assertEqual(0.0, get_f1([], [u"a"]))
+
+    def test_evaluate(self):
+        story_text = u"The cat sat on the mat in Paris ."
+        dataset = pd.DataFrame(dict(
+            story_id=['a'] * 4,
+            story_text=[story_text] * 4,
+            question=[u"Who sat?", u"where is it?", u"Where was it?", u"What happened?"],
+            answer_char_ranges=['0:7|0:7|4:7', '27:33|16:23', 'None|None', '8:14'],
+            validated_answers=['', '{"16:23":2,"27:33":1}', '', ''],
+            is_question_bad=['0.0'] * 4),
+            index=[3, 4, 5, 6])
+        predictions = {3: u"a cat", 4: (27, 33), 5: None, 6: u"sat on the mat"}
+        report = evaluate(dataset, predictions, workers=1)
+        self.assertListEqual([1, 0, 1, 0], report.scores['exact_match'].tolist())
+        self.assertListEqual([1, 1, 1, 0], report.scores['exact_match_all'].tolist())
+        self.assertAlmostEqual(0.8, report.scores['f1'].iat[3])
+        self.assertEqual(len(dataset), len(report))
+        self.assertListEqual(list(dataset.index), list(report.scores.index))
+        self.assertAlmostEqual(50.0, report.get_totals()['exact_match'])
+
+        by_question_type = report.by_question_type(num_most_common=1)
+        self.assertListEqual(['*other', 'where', '*total'], list(by_question_type.index))
+        self.assertListEqual([2, 2, 4], by_question_type['count'].tolist())
+        self.assertEqual(100.0, by_question_type.at['where', 'exact_match_all'])
+
+        with self.assertRaises(ValueError):
+            evaluate(dataset, [None], workers=1)
+
+    def test_tokenized(self):
+        dataset = pd.DataFrame(dict(
+            story_id=['a', 'a'],
+            story_text=[u"The cat sat on the mat ."] * 2,
+            question=[u"Who sat ?", u"What ?"],
+            answer_char_ranges=['0:7', '0:3'],
+            answer_token_ranges=['1:2,4:6', '-1:-1']))
+        report = evaluate(dataset, [(0, 2), (1, 2)], span_type=TOKEN, workers=1)
+        self.assertListEqual([1, 0], report.scores['exact_match'].tolist())
+        self.assertListEqual([1, 0], report.scores['exact_match_all'].tolist())
+        report = evaluate(dataset, [u"the mat", None], workers=1)
+        self.assertListEqual([0, 1], report.scores['exact_match'].tolist())
+        self.assertListEqual([1, 1], report.scores['exact_match_all'].tolist())
+
+    def test_synthetic(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            cnn_stories_path, dataset_path = synthetic_data.generate(dir_path, scale=0.005)
+            newsqa_dataset = NewsQaDataset(cnn_stories_path, dataset_path)
+            consensus = newsqa_dataset.compute_consensus()
+            report = newsqa_dataset.evaluate(consensus, workers=1)
+            self.assertEqual(100.0, report.get_totals()['exact_match'])
+            # Questions without a consensus might not have a "None" answer.
+            self.assertTrue((report.scores['f1_all'][consensus['start'] >= 0] == 1).all())
+
+            predictions = [u"" for _ in range(len(newsqa_dataset.dataset))]
+            serial = newsqa_dataset.evaluate(predictions, workers=1)
+            parallel = evaluate(newsqa_dataset.dataset, predictions, workers=2, shard_size=50)
+            pd.testing.assert_frame_equal(serial.scores, parallel.scores)
+            given = evaluate(newsqa_dataset.dataset, predictions, workers=1,
+                             consensus=consensus)
+            pd.testing.assert_frame_equal(serial.scores, given.scores)
+            with self.assertRaises(ValueError):
+                evaluate(newsqa_dataset.dataset, predictions, workers=1,
+                         consensus=consensus.iloc[1:])
+            self.assertLess(serial.get_totals()['exact_match'], 100.0)
+        finally:
+            shutil.rmtree(dir_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from maluuba.newsqa import exporters
+from maluuba.newsqa.compression import ParallelGzipWriter
+
+
+class TestExporters(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.df = pd.DataFrame(dict(
+            story_id=['a', 'a', 'b'],
+            question=[u"Who did it?", u"Où?", u"What?"],
+            is_answer_absent=[0.0, 0.5, 1.0],
+        ), columns=['story_id', 'question', 'is_answer_absent'])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_parallel_gzip_multi_member(self):
+        path = os.path.join(self.dir_path, 'data.gz')
+        data = os.urandom(1000) * 300
+        with ParallelGzipWriter(path, block_size=64 * 1024, workers=3) as f:
+            for start in range(0, len(data), 10000):
+                f.write(data[start:start + 10000])
+        with gzip.open(path, 'rb') as f:
+            self.assertEqual(data, f.read())
+
+    def test_csv(self):
+        expected_path = os.path.join(self.dir_path, 'expected.csv')
+        self.df.to_csv(expected_path, index=False, encoding='utf-8')
+        path = os.path.join(self.dir_path, 'data.csv.gz')
+        exporters.write_csv(self.df, path, chunk_size=2, workers=2)
+        with io.open(expected_path, 'rb') as expected, gzip.open(path, 'rb') as actual:
+            self.assertEqual(expected.read(), actual.read())
+
+    def test_json_lines(self):
+        path = os.path.join(self.dir_path, 'data.jsonl')
+        exporters.write_json_lines(self.df, path, chunk_size=2)
+        with io.open(path, 'r', encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(3, len(rows))
+        self.assertEqual(u"Où?", rows[1]['question'])
+        self.assertEqual(0.5, rows[1]['is_answer_absent'])
+
+    def test_json_by_rows(self):
+        path = os.path.join(self.dir_path, 'data.json')
+        exporters.write_json_by_rows(self.df, path, chunk_size=2)
+        with io.open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.assertListEqual(['0', '1', '2'], sorted(data.keys()))
+        self.assertEqual('b', data['2']['story_id'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from maluuba.newsqa import synthetic_data
+from maluuba.newsqa.data_processing import NewsQaDataset
+from maluuba.newsqa.incremental import KEY_COLUMNS, ingest_delta
+from maluuba.newsqa.split_dataset import split_data
+from maluuba.newsqa.story_corpus import StoryCorpus, write_story_corpus
+from maluuba.newsqa.tokenize_dataset import tokenize_data
+
+
+def _build(dir_path, cnn_stories_path, dataset_path, name):
+    combined_path = os.path.join(dir_path, '%s-combined.csv' % name)
+    tokenized_path = os.path.join(dir_path, '%s-tokenized.csv' % name)
+    split_output_dir_path = os.path.join(dir_path, '%s-split' % name)
+    newsqa_dataset = NewsQaDataset(cnn_stories_path, dataset_path)
+    newsqa_dataset.dump(combined_path)
+    tokenize_data(newsqa_dataset.dataset, tokenized_path, os.path.join(dir_path, name),
+                  tokenizer=synthetic_data.tokenize_packed_file)
+    split_data(tokenized_path, split_output_dir_path, split_dir_path=dir_path)
+    return combined_path, tokenized_path, split_output_dir_path
+
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.cnn_stories_path, dataset_path = synthetic_data.generate(self.dir_path, scale=0.002)
+        self.questions = pd.read_csv(dataset_path, encoding='utf-8', keep_default_na=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def _write_questions(self, questions, name):
+        path = os.path.join(self.dir_path, '%s-v1.csv' % name)
+        questions.to_csv(path, index=False, encoding='utf-8')
+        return path
+
+    def _assert_same_rows(self, expected_path, actual_path):
+        expected = pd.read_csv(expected_path, encoding='utf-8', keep_default_na=False)
+        actual = pd.read_csv(actual_path, encoding='utf-8', keep_default_na=False)
+        self.assertListEqual(list(expected.columns), list(actual.columns))
+        expected = expected.sort_values(KEY_COLUMNS).reset_index(drop=True)
+        actual = actual.sort_values(KEY_COLUMNS).reset_index(drop=True)
+        pd.testing.assert_frame_equal(expected, actual)
+
+    def _check(self, base_questions, delta_questions, full_questions):
+        base_paths = _build(self.dir_path, self.cnn_stories_path,
+                            self._write_questions(base_questions, 'base'), 'base')
+        full_paths = _build(self.dir_path, self.cnn_stories_path,
+                            self._write_questions(full_questions, 'full'), 'full')
+
+        combined_path, tokenized_path, split_output_dir_path = base_paths
+        result = ingest_delta(self._write_questions(delta_questions, 'delta'), combined_path,
+                              self.cnn_stories_path,
+                              tokenized_data_path=tokenized_path,
+                              split_output_dir_path=split_output_dir_path,
+                              split_dir_path=self.dir_path,
+                              tokenizer=synthetic_data.tokenize_packed_file)
+
+        self._assert_same_rows(full_paths[0], combined_path)
+        self._assert_same_rows(full_paths[1], tokenized_path)
+        for data_type in ('train', 'dev', 'test'):
+            self._assert_same_rows(os.path.join(full_paths[2], '%s.csv' % data_type),
+                                   os.path.join(split_output_dir_path, '%s.csv' % data_type))
+        return result
+
+    def test_new_rows(self):
+        story_ids = sorted(set(self.questions['story_id']))
+        # Some new stories and some new questions for stories that are already built.
+        is_delta = self.questions['story_id'].isin(story_ids[:5]) | \
+            (self.questions.index % 7 == 0)
+        result = self._check(self.questions[~is_delta], self.questions[is_delta],
+                             self.questions)
+        self.assertEqual((is_delta.sum(), 0), result)
+
+    def test_changed_rows(self):
+        delta = self.questions.iloc[[3, 10, len(self.questions) - 1]].copy()
+        delta['answer_char_ranges'] = ['0:5|None|None', '0:100000|None|None', 'None|None|None']
+        full = self.questions.copy()
+        full.loc[delta.index, 'answer_char_ranges'] = delta['answer_char_ranges']
+        result = self._check(self.questions.iloc[:-1], delta, full)
+        self.assertEqual((1, 2), result)
+
+
+    def test_failure_leaves_dataset(self):
+        story_ids = sorted(set(self.questions['story_id']))
+        is_delta = self.questions['story_id'].isin(story_ids[:3])
+        combined_path, tokenized_path, split_output_dir_path = _build(
+            self.dir_path, self.cnn_stories_path,
+            self._write_questions(self.questions[~is_delta], 'base'), 'base')
+        corpus_path = os.path.join(self.dir_path, 'stories.bin')
+        combined = NewsQaDataset.load_combined(combined_path)
+        write_story_corpus(dict(zip(combined['story_id'], combined['story_text'])), corpus_path)
+        paths = [combined_path, tokenized_path, corpus_path] + \
+            [os.path.join(split_output_dir_path, name)
+             for name in os.listdir(split_output_dir_path)]
+        contents = [self._read(path) for path in paths]
+        names = sorted(os.listdir(self.dir_path))
+
+        def failing_tokenizer(packed_path, tokenized_path):
+            raise _TokenizerFailed()
+
+        delta_path = self._write_questions(self.questions[is_delta], 'delta')
+        delta_names = sorted(names + [os.path.basename(delta_path)])
+        kwargs = dict(tokenized_data_path=tokenized_path,
+                      split_output_dir_path=split_output_dir_path,
+                      split_dir_path=self.dir_path, story_corpus_path=corpus_path)
+        with self.assertRaises(_TokenizerFailed):
+            ingest_delta(delta_path, combined_path, self.cnn_stories_path,
+                         tokenizer=failing_tokenizer, **kwargs)
+        self.assertListEqual(contents, [self._read(path) for path in paths])
+        self.assertListEqual(delta_names, sorted(os.listdir(self.dir_path)))
+
+        # Running it again works.
+        self.assertEqual((is_delta.sum(), 0),
+                         ingest_delta(delta_path, combined_path, self.cnn_stories_path,
+                                      tokenizer=synthetic_data.tokenize_packed_file,
+                                      **kwargs))
+        self.assertListEqual(delta_names, sorted(os.listdir(self.dir_path)))
+        combined = NewsQaDataset.load_combined(combined_path)
+        self.assertEqual(len(self.questions), len(combined))
+        corpus = StoryCorpus(corpus_path)
+        self.assertListEqual(story_ids, corpus.keys())
+        for story_id, story_text in zip(combined['story_id'], combined['story_text']):
+            self.assertEqual(story_text, corpus[story_id])
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+class _TokenizerFailed(Exception):
+    pass
+
+
+if __name__ == '__main__':
+    unittest.main()
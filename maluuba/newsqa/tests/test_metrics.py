@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from maluuba.newsqa.metrics import Metrics, tracemalloc
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_stage(self):
+        metrics = Metrics()
+        events = []
+        metrics.register_hook(lambda event, record: events.append((event, record.name)))
+        metrics.trace_memory = True
+        metrics.profile_stages.add('pack')
+        metrics.profile_dir_path = self.dir_path
+
+        with metrics.stage('pack', rows=10, stories=2) as record:
+            record.add_bytes_read(5)
+            record.add_bytes_read(7)
+            record.add_bytes_written(None)
+            [i for i in range(1000)]
+
+        self.assertListEqual([('start', 'pack'), ('end', 'pack')], events)
+        self.assertEqual(1, len(metrics.records))
+        self.assertEqual(12, record.bytes_read)
+        self.assertIsNone(record.bytes_written)
+        self.assertGreaterEqual(record.wall_seconds, 0)
+        self.assertIsNotNone(record.cpu_seconds)
+        self.assertTrue(os.path.exists(os.path.join(self.dir_path, 'pack.prof')))
+
+        path = os.path.join(self.dir_path, 'metrics.json')
+        metrics.dump(path)
+        with io.open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        stage = data['stages'][0]
+        self.assertEqual('pack', stage['name'])
+        self.assertEqual(10, stage['rows'])
+        self.assertEqual(2, stage['stories'])
+        if record.process_max_rss_bytes is not None:
+            self.assertGreaterEqual(stage['max_rss_increase_bytes'], 0)
+            self.assertLessEqual(stage['max_rss_increase_bytes'], stage['process_max_rss_bytes'])
+
+    @unittest.skipUnless(hasattr(tracemalloc, 'reset_peak'), "tracemalloc.reset_peak is needed.")
+    def test_nested_peaks(self):
+        metrics = Metrics()
+        metrics.trace_memory = True
+        with metrics.stage('outer') as outer:
+            data = bytearray(10 ** 7)
+            del data
+            with metrics.stage('inner') as inner:
+                data = bytearray(10 ** 5)
+                del data
+        self.assertGreaterEqual(outer.peak_traced_bytes, 10 ** 7)
+        self.assertLess(inner.peak_traced_bytes, 10 ** 7)
+        self.assertGreaterEqual(inner.peak_traced_bytes, 10 ** 5)
+
+    def test_error(self):
+        metrics = Metrics()
+        with self.assertRaises(ValueError):
+            with metrics.stage('unpack'):
+                raise ValueError("Bad line.")
+        self.assertIn("Bad line.", metrics.records[0].error)
+        self.assertIsNotNone(metrics.records[0].wall_seconds)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from maluuba.newsqa import synthetic_data
+from maluuba.newsqa.data_processing import NewsQaDataset, load_story_id_splits
+from maluuba.newsqa.near_duplicates import choose_bands, find_near_duplicates, \
+    find_split_leakage, get_shingles
+
+_QUESTIONS = [
+    "What was the amount of children murdered?",
+    "what was the amount of children murdered",
+    "Who won the game?",
+    "",
+    "Who won the game ?",
+    "Who won?",
+    "What was the amount of children killed?",
+]
+
+
+def _get_clusters(result):
+    return sorted(sorted(group['position'].tolist()) for _, group in result.groupby('cluster'))
+
+
+class TestNearDuplicates(unittest.TestCase):
+    def test_shingles(self):
+        self.assertSetEqual({u'who won', u'won the', u'the game'},
+                            get_shingles("Who won the game?"))
+        self.assertSetEqual({u'who won'}, get_shingles("Who won?"))
+        self.assertSetEqual(set(), get_shingles("?"))
+
+    def test_choose_bands(self):
+        bands, rows = choose_bands(0.8, 128)
+        self.assertLessEqual(bands * rows, 128)
+        self.assertLessEqual((1.0 / bands) ** (1.0 / rows), 0.8)
+        self.assertGreater((1.0 / bands) ** (1.0 / rows), 0.7)
+
+    def test_find_near_duplicates(self):
+        result = find_near_duplicates(_QUESTIONS, threshold=0.9)
+        self.assertListEqual([[0, 1], [2, 4]], _get_clusters(result))
+        self.assertTrue((result['similarity'] == 1).all())
+
+        result = find_near_duplicates(_QUESTIONS, threshold=0.5)
+        self.assertListEqual([[0, 1, 6], [2, 4]], _get_clusters(result))
+        similarity = result.set_index('position')['similarity']
+        self.assertLess(similarity[6], 1)
+        self.assertGreaterEqual(similarity[6], 0.5)
+
+        result = find_near_duplicates(_QUESTIONS, threshold=0.5,
+                                      scopes=['a', 'b', 'a', 'a', 'a', 'a', 'a'])
+        self.assertListEqual([[0, 6], [2, 4]], _get_clusters(result))
+
+    def test_split_leakage(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            cnn_stories_path, dataset_path = synthetic_data.generate(dir_path, scale=0.002)
+            train_story_ids, dev_story_ids, _ = load_story_id_splits(dir_path)
+            train_story_id = sorted(train_story_ids)[0]
+            dev_story_id = sorted(dev_story_ids)[0]
+            dataset = pd.DataFrame([
+                dict(story_id=train_story_id, question="Who won the big game?"),
+                dict(story_id=train_story_id, question="Who won the big game"),
+                dict(story_id=dev_story_id, question="who won the big game?"),
+                dict(story_id=dev_story_id, question="Where is the court?"),
+                dict(story_id=train_story_id, question="Where is the court?"),
+                dict(story_id=train_story_id, question="When did it start?"),
+                dict(story_id=train_story_id, question="When did it start?"),
+            ])
+            result = find_split_leakage(dataset, dir_path)
+            self.assertListEqual([[0, 1, 2], [3, 4]], _get_clusters(result))
+            self.assertListEqual(['train', 'train', 'dev'],
+                                 result[result['position'] < 3]['split'].tolist())
+
+            newsqa_dataset = NewsQaDataset(cnn_stories_path, dataset_path, lazy=True)
+            result = newsqa_dataset.find_near_duplicate_questions(per_story=True)
+            self.assertListEqual(['cluster', 'position', 'similarity', 'story_id', 'question'],
+                                 list(result.columns))
+            for _, group in result.groupby('cluster'):
+                self.assertEqual(1, group['story_id'].nunique())
+        finally:
+            shutil.rmtree(dir_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
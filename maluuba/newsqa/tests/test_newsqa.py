@@ -65,6 +65,15 @@ class TestNewsQa(unittest.TestCase):
     def test_check_corruption(self):
         self.check_corruption(self.newsqa_dataset.dataset)
 
+    def test_validate(self):
+        report = self.newsqa_dataset.validate()
+        self.assertEqual(len(self.newsqa_dataset.dataset), report.num_rows)
+        self.assertListEqual([], report.get_rows('answer_char_ranges_format'))
+        self.assertListEqual([], report.get_rows('answer_char_range_bounds'))
+        self.assertListEqual([], report.get_rows('validated_answers_json'))
+        self.assertLess(report.get_fraction('answer_char_range_alignment'), 0.00065,
+                        msg=report.summary())
+
     def test_dump_json(self):
         dir_name = os.path.dirname(os.path.abspath(__file__))
         combined_data_path = os.path.join(dir_name, '../../../combined-newsqa-data-v1.json')
@@ -214,6 +223,22 @@ class TestNewsQa(unittest.TestCase):
                        story_text="You did it.")
         self.assertTupleEqual((None, None), self.newsqa_dataset.get_consensus_answer(row))
 
+    def test_get_all_qas_for_story_ids(self):
+        story_id = './cnn/stories/42d01e187213e86f5fe617fe32e716ff7fa3afc4.story'
+        data = self.newsqa_dataset.get_all_qas_for_story_ids([story_id, 'missing'])
+        self.assertListEqual([story_id], list(data.keys()))
+        entry = data[story_id]
+        self.assertEqual("NEW DELHI, India (CNN) -- A high court in nort", entry['story_text'][:46])
+        self.assertEqual("What was the amount of children murdered?", entry['qa_pairs'][0]['question'])
+        self.assertEqual('294:297', entry['qa_pairs'][0]['answers'])
+
+        story = self.newsqa_dataset.get_story(story_id)
+        self.assertEqual(entry['story_text'], story.text)
+        self.assertListEqual(entry['qa_pairs'], story.qa_pairs)
+        self.assertEqual(0, story.positions[0])
+
+        self.assertEqual(5, len(self.newsqa_dataset.get_all_qas_for_story_ids(n_stories=5)))
+
     def test_load_combined(self):
         dir_name = os.path.dirname(os.path.abspath(__file__))
         combined_data_path = os.path.join(dir_name, '../../../combined-newsqa-data-v1.csv')
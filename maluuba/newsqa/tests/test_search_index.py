@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from maluuba.newsqa import synthetic_data
+from maluuba.newsqa.data_processing import NewsQaDataset
+from maluuba.newsqa.search_index import SearchIndex, build_search_index, get_terms, parse_query
+
+
+def _matches(text, phrases):
+    terms = get_terms(text)
+    for phrase in phrases:
+        if not any(terms[i:i + len(phrase)] == phrase for i in range(len(terms))):
+            return False
+    return True
+
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_search(self):
+        dataset = pd.DataFrame([
+            dict(story_id='b', question="Who was in New Delhi?",
+                 story_text=u"NEW DELHI, India (CNN) -- A high court in northern India"),
+            dict(story_id='a', question="What did the court say?",
+                 story_text=u"The court in Delhi was new. Café"),
+            dict(story_id='b', question="Where is the high court?",
+                 story_text=u"NEW DELHI, India (CNN) -- A high court in northern India"),
+            dict(story_id='c', question="", story_text=u""),
+        ])
+        self.assertListEqual([['new', 'delhi'], ['court']], parse_query('"New Delhi" court'))
+        self.assertEqual(3, build_search_index(dataset, self.dir_path))
+        index = SearchIndex(self.dir_path)
+
+        self.assertListEqual([0, 1, 2], index.search('court delhi', 'story').tolist())
+        self.assertListEqual([0, 2], index.search('"new delhi"', 'story').tolist())
+        self.assertListEqual([1], index.search('"delhi was new"', 'story').tolist())
+        self.assertListEqual([], index.search('"delhi new"', 'story').tolist())
+        self.assertListEqual([1], index.search(u'CAFÉ', 'story').tolist())
+        self.assertListEqual([0, 2], index.search('"(cnn) -- a"', 'story').tolist())
+        self.assertListEqual(['a', 'b'], index.search_stories('court'))
+
+        self.assertListEqual([1, 2], index.search('court').tolist())
+        self.assertListEqual([0], index.search('"new delhi"').tolist())
+        self.assertListEqual([], index.search('missing court').tolist())
+        self.assertListEqual([], index.search('').tolist())
+        with self.assertRaises(ValueError):
+            index.search('court', 'title')
+
+    def test_synthetic(self):
+        cnn_stories_path, dataset_path = synthetic_data.generate(self.dir_path, scale=0.002)
+        newsqa_dataset = NewsQaDataset(cnn_stories_path, dataset_path, lazy=True)
+        with self.assertRaises(Exception):
+            newsqa_dataset.search('court')
+        newsqa_dataset.build_search_index(self.dir_path + '/index')
+        self.assertNotIn('story_text', newsqa_dataset.dataset.columns)
+
+        dataset = newsqa_dataset.dataset
+        first_question = get_terms(dataset['question'].iat[0])
+        story_terms = get_terms(newsqa_dataset.get_story_text(dataset['story_id'].iat[0]))
+        queries = [
+            ('question', ' '.join(first_question[:2])),
+            ('question', '"%s"' % ' '.join(first_question[1:3])),
+            ('story', story_terms[5]),
+            ('story', '"%s" %s' % (' '.join(story_terms[10:13]), story_terms[40])),
+        ]
+        for field, query in queries:
+            texts = dataset['question'] if field == 'question' \
+                else dataset['story_id'].map(newsqa_dataset.get_story_text)
+            expected = [i for i, text in enumerate(texts) if _matches(text, parse_query(query))]
+            self.assertGreater(len(expected), 0)
+            self.assertListEqual(expected, newsqa_dataset.search(query, field).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from maluuba.newsqa.sentence_index import SentenceIndex
+
+
+class TestSentenceIndex(unittest.TestCase):
+    def setUp(self):
+        # Story 0 has sentences [0, 4), [4, 8), [8, 10).
+        # Story 1 has no sentences.
+        # Story 2 has one sentence [0, 3).
+        self.index = SentenceIndex.from_sentence_starts(['4,8,10', '', '3'])
+
+    def test_find_sentences(self):
+        self.assertEqual(3, len(self.index))
+        self.assertListEqual([10, 0, 3], self.index.story_lengths.tolist())
+        self.assertListEqual(
+            [0, 0, 1, 1, 2, -1, -1, -1, 0, 0, -1],
+            self.index.find_sentences([0, 0, 0, 0, 0, 0, 0, 1, 2, 2, 2],
+                                      [0, 3, 4, 7, 9, 10, -1, 0, 0, 2, 3]).tolist())
+
+    def test_get_sentence_ranges(self):
+        starts, ends = self.index.get_sentence_ranges([0, 0, 0, 2], [0, 1, 2, 0])
+        self.assertListEqual([0, 4, 8, 0], starts.tolist())
+        self.assertListEqual([4, 8, 10, 3], ends.tolist())
+
+    def test_answers(self):
+        stories = [0, 0, 0, 2, 0]
+        answer_starts = [1, 3, 9, 0, -1]
+        answer_ends = [3, 5, 11, 3, -1]
+        first, last = self.index.find_answer_sentences(stories, answer_starts, answer_ends)
+        self.assertListEqual([0, 0, 2, 0, -1], first.tolist())
+        self.assertListEqual([0, 1, 2, 0, -1], last.tolist())
+
+        starts, ends = self.index.get_answer_windows(stories, answer_starts, answer_ends)
+        self.assertListEqual([0, 0, 4, 0, -1], starts.tolist())
+        self.assertListEqual([8, 10, 10, 3, -1], ends.tolist())
+        starts, ends = self.index.get_answer_windows(stories, answer_starts, answer_ends,
+                                                     num_sentences=0)
+        self.assertListEqual([0, 0, 8, 0, -1], starts.tolist())
+        self.assertListEqual([4, 8, 10, 3, -1], ends.tolist())
+
+    def test_empty_last_story(self):
+        index = SentenceIndex.from_sentence_starts(['4', ''])
+        starts, ends = index.get_answer_windows([0, 1], [1, 0], [2, 1])
+        self.assertListEqual([0, -1], starts.tolist())
+        self.assertListEqual([4, -1], ends.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from maluuba.newsqa import synthetic_data
+from maluuba.newsqa.data_processing import NewsQaDataset
+from maluuba.newsqa.server import DatasetClient, DatasetServer, LruCache
+
+
+class TestServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir_path = tempfile.mkdtemp()
+        cnn_stories_path, dataset_path = synthetic_data.generate(cls.dir_path, scale=0.002)
+        cls.newsqa_dataset = NewsQaDataset(cnn_stories_path, dataset_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir_path)
+
+    def test_lru_cache(self):
+        cache = LruCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual(2, len(cache))
+        self.assertEqual((3, 1), (cache.hits, cache.misses))
+
+    def _check_server(self, address):
+        newsqa_dataset = self.newsqa_dataset
+        server = DatasetServer(newsqa_dataset, address, max_rows=50)
+        server.start()
+        client = DatasetClient(server.address, batch_size=7)
+        try:
+            info = client.get_info()
+            self.assertEqual(len(newsqa_dataset.dataset), info['num_rows'])
+            story_ids = list(newsqa_dataset.story_index)
+            self.assertListEqual(story_ids, client.get_story_ids())
+
+            self.assertDictEqual(newsqa_dataset.get_all_qas_for_story_ids(),
+                                 client.get_all_qas_for_story_ids())
+            requested = story_ids[3:20] + ['unknown']
+            for include_no_answers in [False, True]:
+                self.assertDictEqual(
+                    newsqa_dataset.get_all_qas_for_story_ids(requested, 5, include_no_answers),
+                    client.get_all_qas_for_story_ids(requested, 5, include_no_answers))
+            hits = server.cache.hits
+            client.get_all_qas_for_story_ids(story_ids[3:8])
+            self.assertEqual(hits + 5, server.cache.hits)
+
+            rows = client.get_rows(10, 15)
+            consensus = newsqa_dataset.compute_consensus()
+            self.assertEqual(5, len(rows))
+            self.assertListEqual(newsqa_dataset.dataset['question'].iloc[10:15].tolist(),
+                                 [row['question'] for row in rows])
+            self.assertListEqual(consensus['start'].iloc[10:15].tolist(),
+                                 [row['consensus_start'] for row in rows])
+            self.assertEqual(0, len(client.get_rows(len(newsqa_dataset.dataset), 10 ** 9)))
+            # Large ranges are requested in batches.
+            num_rows = len(newsqa_dataset.dataset)
+            self.assertGreater(num_rows, 2 * info['max_rows'])
+            rows = client.get_rows(0, 10 ** 9)
+            self.assertListEqual(newsqa_dataset.dataset.index.tolist(),
+                                 [row['index'] for row in rows])
+            self.assertListEqual(newsqa_dataset.dataset.index[-3:].tolist(),
+                                 [row['index'] for row in client.get_rows(-3, num_rows)])
+            with self.assertRaises(ValueError):
+                client._request('GET', '/rows?start=x')
+            with self.assertRaises(ValueError):
+                client._request('GET', '/rows?start=0&stop=51')
+            for invalid in [dict(story_ids=[1, 2]), dict(story_ids='abc'), [story_ids[0]]]:
+                with self.assertRaises(ValueError):
+                    client._request('POST', '/stories', invalid)
+            # The connection can be used again after an error.
+            self.assertEqual(info, client.get_info())
+        finally:
+            client.close()
+            server.close()
+
+    def test_http(self):
+        self._check_server(('127.0.0.1', 0))
+
+    @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), "Unix sockets are needed.")
+    def test_unix_socket(self):
+        self._check_server(os.path.join(self.dir_path, 'server.sock'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from maluuba.newsqa.story_corpus import StoryCorpus, add_to_story_corpus, write_story_corpus
+
+
+class TestStoryCorpus(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_round_trip(self):
+        story_texts = {
+            u'./cnn/stories/b.story': u"NEW DELHI, India (CNN) -- \xe2€\xa2 A high court",
+            u'./cnn/stories/a.story': u"Caf\xc3\xa9\n\nSecond paragraph.",
+            u'./cnn/stories/c.story': u"",
+        }
+        path = os.path.join(self.dir_path, 'stories.bin')
+        self.assertEqual(3, write_story_corpus(story_texts, path))
+
+        corpus = StoryCorpus(path)
+        self.assertEqual(3, len(corpus))
+        self.assertListEqual(sorted(story_texts.keys()), corpus.keys())
+        for story_id, story_text in story_texts.items():
+            self.assertIn(story_id, corpus)
+            self.assertEqual(story_text, corpus[story_id])
+        self.assertNotIn(u'./cnn/stories/d.story', corpus)
+        self.assertIsNone(corpus.get(u'./cnn/stories/d.story'))
+        with self.assertRaises(KeyError):
+            corpus[u'./cnn/stories/0.story']
+
+        unpickled = pickle.loads(pickle.dumps(corpus))
+        self.assertEqual(story_texts[u'./cnn/stories/a.story'], unpickled[u'./cnn/stories/a.story'])
+
+    def test_rewrite_while_open(self):
+        path = os.path.join(self.dir_path, 'stories.bin')
+        write_story_corpus({u'a': u"First text.", u'b': u"Second text."}, path)
+        corpus = StoryCorpus(path)
+        write_story_corpus({u'a': u"Changed.", u'c': u"Third text."}, path)
+        # The open corpus still reads the files that it mapped.
+        self.assertEqual(u"Second text.", corpus[u'b'])
+        self.assertEqual(u"First text.", corpus[u'a'])
+        self.assertEqual(u"Changed.", StoryCorpus(path)[u'a'])
+        self.assertListEqual(sorted(['stories.bin', 'stories.bin.ids.npy',
+                                     'stories.bin.offsets.npy']),
+                             sorted(os.listdir(self.dir_path)))
+
+    def test_add(self):
+        path = os.path.join(self.dir_path, 'stories.bin')
+        write_story_corpus({u'b': u"B text.", u'd': u"D t\xe9xt."}, path)
+        corpus = StoryCorpus(path)
+        self.assertEqual(3, add_to_story_corpus(
+            {u'a': u"A text.", u'b': u"Not added.", u'c': u"", u'e': u"\xc9 text."}, path))
+        expected = {u'a': u"A text.", u'b': u"B text.", u'c': u"", u'd': u"D t\xe9xt.",
+                    u'e': u"\xc9 text."}
+        self.assertDictEqual(expected, dict(StoryCorpus(path).items()))
+        self.assertEqual(u"D t\xe9xt.", corpus[u'd'])
+        self.assertNotIn(u'a', corpus)
+
+        output_path = os.path.join(self.dir_path, 'more-stories.bin')
+        self.assertEqual(1, add_to_story_corpus({u'f': u"F."}, path, output_path))
+        self.assertEqual(5, len(StoryCorpus(path)))
+        self.assertEqual(6, len(StoryCorpus(output_path)))
+
+        empty_path = os.path.join(self.dir_path, 'empty.bin')
+        write_story_corpus({}, empty_path)
+        add_to_story_corpus(expected, empty_path)
+        self.assertDictEqual(expected, dict(StoryCorpus(empty_path).items()))
+
+    def test_empty(self):
+        path = os.path.join(self.dir_path, 'stories.bin')
+        write_story_corpus({}, path)
+        corpus = StoryCorpus(path)
+        self.assertEqual(0, len(corpus))
+        self.assertNotIn(u'a', corpus)
+
+
+if __name__ == '__main__':
+    unittest.main()
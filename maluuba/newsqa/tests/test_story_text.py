@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import io
+import re
+import unittest
+
+import six
+
+from maluuba.newsqa.data_processing import read_story_text, strip_empty_strings
+
+
+def _read_story_text_per_character(data, decode_specially, num_extra_newlines):
+    """
+    The original Python 2 loading logic, decoding one line (or character) at a time.
+    """
+    copyright_line_pattern = re.compile(
+        "^(Copyright|Entire contents of this article copyright, )")
+    story_file = io.BytesIO(data)
+    if decode_specially:
+        lines = [u"".join(six.unichr(c) for c in bytearray(s.strip()))
+                 for s in story_file.readlines()]
+    else:
+        lines = [s.strip().decode('utf-8') for s in story_file.readlines()]
+    highlights_start = lines.index('@highlight')
+    story_lines = lines[:highlights_start]
+    story_lines = strip_empty_strings(story_lines)
+    while len(story_lines) > 1 and copyright_line_pattern.search(story_lines[-1]):
+        story_lines = strip_empty_strings(story_lines[:-2])
+    if num_extra_newlines == 2:
+        story_text = '\n\n\n'.join(story_lines)
+    elif num_extra_newlines == 1:
+        story_text = '\n\n'.join(story_lines)
+    else:
+        story_text = '\n'.join(story_lines)
+
+    story_text = story_text.replace(u'\xe2\x80\xa2', u'\xe2€\xa2')
+    story_text = story_text.replace(u'\xe2\x82\xac', u'\xe2‚\xac')
+    story_text = story_text.replace('\r', '\n')
+    if decode_specially:
+        story_text = story_text.replace(u'\xe9', u'\xc3\xa9')
+    return story_text
+
+
+class TestStoryText(unittest.TestCase):
+    _stories = [
+        u"NEW DELHI, India (CNN) -- A high court • in northern India\n"
+        u"\n"
+        u"  Caf\xe9 costs €5.\r\n"
+        u"Trailing no-break space\xa0 \t\n"
+        u"\n"
+        u"Copyright 2007 CNN. All rights reserved.\n"
+        u"\n"
+        u"@highlight\n"
+        u"\n"
+        u"The highlight\n",
+
+        u"(CNN) -- Line with a carriage\rreturn.\n"
+        u"Entire contents of this article copyright, Cable News Network.\n"
+        u"@highlight\n"
+        u"@highlight",
+
+        u"Only one line.\n@highlight\n",
+    ]
+
+    def test_same_as_per_character_decoding(self):
+        for story in self._stories:
+            data = story.encode('utf-8')
+            for decode_specially in (False, True):
+                for num_extra_newlines in (0, 1, 2):
+                    expected = _read_story_text_per_character(
+                        data, decode_specially, num_extra_newlines)
+                    actual = read_story_text(data, decode_specially, num_extra_newlines)
+                    self.assertEqual(expected, actual)
+
+    def test_decode_specially(self):
+        data = u"Caf\xe9 •\n@highlight\n".encode('utf-8')
+        self.assertEqual(u"Caf\xc3\xa9 \xe2€\xa2", read_story_text(data, True))
+        self.assertEqual(u"Caf\xe9 •", read_story_text(data, False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+import numpy as np
+
+from maluuba.newsqa import synthetic_data
+from maluuba.newsqa.data_processing import NewsQaDataset, load_story_id_splits
+from maluuba.newsqa.tokenize_dataset import pack, unpack
+
+
+class TestSyntheticData(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir_path = tempfile.mkdtemp()
+        cls.cnn_stories_path, cls.dataset_path = synthetic_data.generate(cls.dir_path,
+                                                                         scale=0.005)
+        cls.newsqa_dataset = NewsQaDataset(cls.cnn_stories_path, cls.dataset_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir_path)
+
+    def test_load(self):
+        dataset = self.newsqa_dataset.dataset
+        self.assertEqual('1', self.newsqa_dataset.version)
+        self.assertEqual(64, len(self.newsqa_dataset.story_index))
+        self.assertGreater(len(dataset), 64)
+        for row in dataset.itertuples():
+            self.assertTrue(row.story_text)
+            for user_answer_char_ranges in row.answer_char_ranges.split('|'):
+                for char_range in user_answer_char_ranges.split(','):
+                    if char_range != 'None':
+                        start, end = map(int, char_range.split(':'))
+                        self.assertLess(start, end)
+                        self.assertLessEqual(end, len(row.story_text))
+                        self.assertTrue(start == 0 or row.story_text[start - 1].isspace())
+
+    def test_splits(self):
+        train_story_ids, dev_story_ids, test_story_ids = load_story_id_splits(self.dir_path)
+        self.assertSetEqual(set(self.newsqa_dataset.story_index),
+                            train_story_ids | dev_story_ids | test_story_ids)
+        data = self.newsqa_dataset.to_dict(self.dir_path)
+        self.assertEqual(64, len(data['data']))
+        self.assertSetEqual({'train', 'dev', 'test'}, set(d['type'] for d in data['data']))
+
+    def test_to_dict_parallel(self):
+        self.assertIs(load_story_id_splits(self.dir_path), load_story_id_splits(self.dir_path))
+        expected = self.newsqa_dataset.to_dict(self.dir_path, workers=1)
+        self.assertEqual(json.dumps(expected),
+                         json.dumps(self.newsqa_dataset.to_dict(self.dir_path, workers=2,
+                                                                chunk_size=50)))
+        self.assertListEqual(list(self.newsqa_dataset.dataset['story_id'].unique()),
+                             [d['storyId'] for d in expected['data']])
+
+    def test_lazy(self):
+        newsqa_dataset = NewsQaDataset(self.cnn_stories_path, self.dataset_path, lazy=True)
+        self.assertNotIn('story_text', newsqa_dataset.dataset.columns)
+        self.assertTrue(self.newsqa_dataset.get_questions().equals(
+            newsqa_dataset.get_questions()))
+        self.assertTrue(self.newsqa_dataset.get_question_types().equals(
+            newsqa_dataset.get_question_types()))
+
+        story_id = self.newsqa_dataset.dataset['story_id'].iat[-1]
+        self.assertEqual(self.newsqa_dataset.get_story_text(story_id),
+                         newsqa_dataset.get_story_text(story_id))
+        self.assertListEqual(self.newsqa_dataset.get_story(story_id).qa_pairs,
+                             newsqa_dataset.get_story(story_id).qa_pairs)
+
+        expected_path = os.path.join(self.dir_path, 'expected-v1.csv')
+        path = os.path.join(self.dir_path, 'lazy-v1.csv')
+        self.newsqa_dataset.dump(expected_path)
+        newsqa_dataset.dump(path)
+        with open(expected_path, 'rb') as expected, open(path, 'rb') as actual:
+            self.assertEqual(expected.read(), actual.read())
+
+    def test_compact(self):
+        path = os.path.join(self.dir_path, 'compact-v1.csv')
+        self.newsqa_dataset.dump(path)
+        newsqa_dataset = NewsQaDataset(combined_data_path=path, compact=True)
+        dataset = newsqa_dataset.dataset
+        self.assertEqual('category', dataset['story_id'].dtype.name)
+        self.assertEqual('category', dataset['story_text'].dtype.name)
+        self.assertEqual(np.float32, dataset['is_question_bad'].dtype)
+        self.assertEqual(self.newsqa_dataset.dataset['is_question_bad'].eq('?').sum(),
+                         dataset['is_question_bad'].isnull().sum())
+        self.assertListEqual(list(self.newsqa_dataset.story_index),
+                             list(newsqa_dataset.story_index))
+        self.assertListEqual(self.newsqa_dataset.validate(workers=1).issues,
+                             newsqa_dataset.validate(workers=1).issues)
+
+        report = newsqa_dataset.memory_report()
+        self.assertListEqual(list(dataset.columns) + ['total'], list(report.index))
+        self.assertLess(report.at['total', 'after'], report.at['total', 'before'] / 2)
+        self.assertEqual(report.at['total', 'after'],
+                         self.newsqa_dataset.memory_report().at['total', 'after'])
+
+        expected = self.newsqa_dataset.to_dict()
+        data = newsqa_dataset.to_dict()
+        for expected_story, story in zip(expected['data'], data['data']):
+            for expected_q, q in zip(expected_story['questions'], story['questions']):
+                self.assertAlmostEqual(expected_q.pop('isAnswerAbsent'), q.pop('isAnswerAbsent'),
+                                       places=6)
+        self.assertDictEqual(expected, data)
+
+    def test_dump_gzip(self):
+        path = os.path.join(self.dir_path, 'dump-v1.csv')
+        self.newsqa_dataset.dump(path)
+        self.newsqa_dataset.dump(path + '.gz', workers=2)
+        with open(path, 'rb') as expected, gzip.open(path + '.gz', 'rb') as actual:
+            self.assertEqual(expected.read(), actual.read())
+
+        path = os.path.join(self.dir_path, 'shareable.csv')
+        cwd = os.getcwd()
+        self.newsqa_dataset.export_shareable(path)
+        self.newsqa_dataset.export_shareable(path + '.gz', workers=2)
+        self.assertEqual(cwd, os.getcwd())
+        with open(path, 'rb') as expected, gzip.open(path + '.gz', 'rb') as actual:
+            self.assertEqual(expected.read(), actual.read())
+
+    def test_story_corpus(self):
+        combined_path = os.path.join(self.dir_path, 'corpus-combined-v1.csv')
+        corpus_path = os.path.join(self.dir_path, 'stories.bin')
+        self.newsqa_dataset.dump(combined_path)
+        self.newsqa_dataset.export_story_corpus(corpus_path)
+
+        newsqa_dataset = NewsQaDataset(combined_data_path=combined_path,
+                                       story_corpus_path=corpus_path)
+        self.assertNotIn('story_text', newsqa_dataset.dataset.columns)
+        story_id = self.newsqa_dataset.dataset['story_id'].iat[-1]
+        self.assertEqual(self.newsqa_dataset.get_story_text(story_id),
+                         newsqa_dataset.get_story_text(story_id))
+        path = os.path.join(self.dir_path, 'corpus-dump-v1.csv')
+        newsqa_dataset.dump(path)
+        with open(combined_path, 'rb') as expected, open(path, 'rb') as actual:
+            self.assertEqual(expected.read(), actual.read())
+
+    def test_load_zipped(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            with tarfile.open(os.path.join(dir_path, 'newsqa.tar.gz'), 'w:gz') as t:
+                t.add(self.dataset_path, arcname='newsqa-data-v1/newsqa-data-v1.csv')
+            newsqa_dataset = NewsQaDataset(self.cnn_stories_path,
+                                           os.path.join(dir_path, 'newsqa-data-v1.csv'))
+            self.assertListEqual(['newsqa.tar.gz'], os.listdir(dir_path))
+            self.assertEqual('1', newsqa_dataset.version)
+            self.assertTrue(self.newsqa_dataset.dataset.equals(newsqa_dataset.dataset))
+            with self.assertRaises(Exception):
+                NewsQaDataset.load_zipped(os.path.join(dir_path, 'newsqa.tar.gz'), 'missing.csv')
+        finally:
+            shutil.rmtree(dir_path)
+
+    def test_unpack_parallel(self):
+        packed_path = os.path.join(self.dir_path, 'unpack.pck')
+        tokenized_path = os.path.join(self.dir_path, 'unpack.tpck')
+        with io.open(packed_path, 'w', encoding='utf-8') as writer:
+            pack(self.newsqa_dataset.dataset, writer)
+        synthetic_data.tokenize_packed_file(packed_path, tokenized_path)
+
+        outputs = []
+        for i, (workers, chunk_size) in enumerate([(1, 1000), (3, 7), (2, 1)]):
+            output_path = os.path.join(self.dir_path, 'unpack-%d.csv' % i)
+            with io.open(tokenized_path, 'r', encoding='utf-8') as packed:
+                unpack(self.newsqa_dataset.dataset, packed, output_path,
+                       workers=workers, chunk_size=chunk_size)
+            with open(output_path, 'rb') as f:
+                outputs.append(f.read())
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+        self.assertEqual(len(self.newsqa_dataset.dataset),
+                         len(NewsQaDataset.load_combined(output_path)))
+
+    def test_tokenize_line(self):
+        self.assertListEqual(["Hello , world .", "How are you ?"],
+                             synthetic_data.tokenize_line("Hello, world. How are you?"))
+        self.assertListEqual([""], synthetic_data.tokenize_line(""))
+
+
+if __name__ == '__main__':
+    unittest.main()
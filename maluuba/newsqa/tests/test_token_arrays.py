@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from maluuba.newsqa.token_arrays import PAD_TOKEN, TokenArrays, UNKNOWN_TOKEN, \
+    export_token_arrays
+
+
+class TestTokenArrays(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.dataset = pd.DataFrame(dict(
+            story_id=['a', 'a', 'b', 'a'],
+            question=[u"Who did it ?", u"Où ?", u"What ?", u"Why ?"],
+            answer_char_ranges=['0:3|None', '1:2', 'None', '4:5'],
+            is_answer_absent=[0.0, 0.5, 1.0, 0.0],
+            is_question_bad=['0.0', '?', '0.0', '0.0'],
+            story_text=[u"John did it . Then he left .", u"John did it . Then he left .",
+                        u"Café story", u"John did it. Then he left ."],
+            answer_token_ranges=['0:1', '0:1,3:4', '-1:-1', '2:4'],
+            sentence_starts=['4,8', '4,8', '2', '7'],
+        ), columns=['story_id', 'question', 'answer_char_ranges', 'is_answer_absent',
+                    'is_question_bad', 'story_text', 'answer_token_ranges', 'sentence_starts'])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def test_round_trip(self):
+        self.assertEqual(3, export_token_arrays(self.dataset, self.dir_path))
+        arrays = TokenArrays(self.dir_path)
+        self.assertIsInstance(arrays.story_tokens, np.memmap)
+        self.assertEqual(4, len(arrays))
+        self.assertEqual(3, arrays.num_stories)
+        self.assertListEqual([PAD_TOKEN, UNKNOWN_TOKEN], arrays.vocab[:2])
+        self.assertListEqual([0, 0, 1, 2], arrays.question_stories.tolist())
+        self.assertListEqual(['a', 'b', 'a'], arrays.story_ids.tolist())
+        for i, row in enumerate(self.dataset.itertuples()):
+            story_number = arrays.question_stories[i]
+            self.assertEqual(row.story_text, arrays.decode(arrays.get_story_tokens(story_number)))
+            self.assertEqual(row.question, arrays.decode(arrays.get_question_tokens(i)))
+            self.assertListEqual([int(s) for s in row.sentence_starts.split(',')],
+                                 arrays.get_sentence_starts(story_number).tolist())
+        self.assertListEqual([[0, 1], [3, 4]], arrays.get_answers(1).tolist())
+        self.assertListEqual([[-1, -1]], arrays.get_answers(2).tolist())
+        self.assertListEqual([0.0, 0.5, 1.0, 0.0], arrays.is_answer_absent.tolist())
+
+    def test_vocab(self):
+        export_token_arrays(self.dataset, self.dir_path,
+                            vocab=[PAD_TOKEN, UNKNOWN_TOKEN, u'John', u'?'])
+        arrays = TokenArrays(self.dir_path, mmap=False)
+        self.assertListEqual([2, 1, 1], arrays.get_story_tokens(0)[:3].tolist())
+        self.assertEqual(u"<unk> ?", arrays.decode(arrays.get_question_tokens(1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from maluuba.newsqa import synthetic_data
+from maluuba.newsqa.data_processing import NewsQaDataset
+from maluuba.newsqa.tokenize_cache import TokenizeCache, get_line_key
+from maluuba.newsqa.tokenize_dataset import tokenize_data
+
+
+class TestTokenizeCache(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.tokenized_lines = []
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def _tokenizer(self, packed_path, tokenized_path):
+        with io.open(packed_path, 'r', encoding='utf-8') as f:
+            self.tokenized_lines.append(sum(1 for _ in f))
+        synthetic_data.tokenize_packed_file(packed_path, tokenized_path)
+
+    def _tokenize(self, dataset, name, cache_path=None, tokenizer_version='synthetic'):
+        path = os.path.join(self.dir_path, '%s.csv' % name)
+        tokenize_data(dataset, path, os.path.join(self.dir_path, name), self._tokenizer,
+                      cache_path=cache_path, tokenizer_version=tokenizer_version)
+        with io.open(path, 'rb') as f:
+            return f.read()
+
+    def test_cache(self):
+        cache = TokenizeCache(os.path.join(self.dir_path, 'cache.sqlite'))
+        key = get_line_key(u"Hi there.", 'v1')
+        self.assertNotEqual(key, get_line_key(u"Hi there.", 'v2'))
+        cache.put_many([(key, [u"Hi there ."]), (get_line_key(u"", 'v1'), [u""])])
+        self.assertEqual(2, len(cache))
+        self.assertDictEqual({key: [u"Hi there ."], get_line_key(u"", 'v1'): [u""]},
+                             cache.get_many([key, get_line_key(u"", 'v1'),
+                                             get_line_key(u"", 'v2')]))
+        cache.close()
+
+    def test_tokenize_data(self):
+        cnn_stories_path, dataset_path = synthetic_data.generate(self.dir_path, scale=0.002)
+        dataset = NewsQaDataset(cnn_stories_path, dataset_path).dataset
+        cache_path = os.path.join(self.dir_path, 'cache.sqlite')
+        expected = self._tokenize(dataset, 'expected')
+        num_lines = self.tokenized_lines[-1]
+        self.assertEqual(3 * len(dataset), num_lines)
+
+        self.assertEqual(expected, self._tokenize(dataset, 'first', cache_path))
+        # The same lines are only tokenized once.
+        self.assertLess(self.tokenized_lines[-1], num_lines)
+        num_tokenized = len(self.tokenized_lines)
+        self.assertEqual(expected, self._tokenize(dataset, 'second', cache_path))
+        self.assertEqual(num_tokenized, len(self.tokenized_lines))
+
+        # Only the changed question is tokenized.
+        dataset = dataset.copy()
+        dataset.iat[0, dataset.columns.get_loc('question')] = u"What changed here?"
+        changed = self._tokenize(dataset, 'changed', cache_path)
+        self.assertEqual(1, self.tokenized_lines[-1])
+        self.assertEqual(self._tokenize(dataset, 'changed_expected'), changed)
+
+        # Another version of the tokenizer doesn't use the cache.
+        self._tokenize(dataset, 'other', cache_path, tokenizer_version='other')
+        self.assertGreater(self.tokenized_lines[-1], 1)
+        with self.assertRaises(ValueError):
+            self._tokenize(dataset, 'missing', cache_path, tokenizer_version=None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from maluuba.newsqa.tokenize_dataset import (_TOKENIZER_JARS, _get_jar_cache_dir_path,
+                                             _get_tokenizer_classpath)
+
+
+class TestTokenizerClasspath(unittest.TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path)
+
+    def _read(self, path):
+        with io.open(path, 'rb') as f:
+            return f.read()
+
+    def test_extract(self):
+        zip_path = os.path.join(self.dir_path, 'stanford-postagger-2015-12-09.zip')
+        with zipfile.ZipFile(zip_path, 'w') as z:
+            for jar_name, member_name in _TOKENIZER_JARS:
+                z.writestr(member_name, b'jar ' + jar_name.encode('utf-8'))
+        cache_dir_path = os.path.join(self.dir_path, 'cache')
+        os.mkdir(cache_dir_path)
+
+        # A planted JAR is replaced by the one in the zip file.
+        planted_path = os.path.join(cache_dir_path, _TOKENIZER_JARS[0][0])
+        with io.open(planted_path, 'wb') as f:
+            f.write(b'planted')
+        classpath = _get_tokenizer_classpath(self.dir_path, cache_dir_path)
+        paths = classpath.split(os.pathsep)
+        self.assertListEqual([os.path.join(cache_dir_path, jar_name)
+                              for jar_name, _ in _TOKENIZER_JARS], paths)
+        for (jar_name, _), path in zip(_TOKENIZER_JARS, paths):
+            self.assertEqual(b'jar ' + jar_name.encode('utf-8'), self._read(path))
+
+        # JARs next to the zip file are used as they are.
+        local_path = os.path.join(self.dir_path, _TOKENIZER_JARS[1][0])
+        with io.open(local_path, 'wb') as f:
+            f.write(b'local')
+        self.assertEqual(local_path,
+                         _get_tokenizer_classpath(self.dir_path, cache_dir_path)
+                         .split(os.pathsep)[1])
+
+    @unittest.skipUnless(hasattr(os, 'getuid'), "Folder permissions are needed.")
+    def test_cache_dir_path(self):
+        path = _get_jar_cache_dir_path()
+        self.assertIn(str(os.getuid()), os.path.basename(path))
+        info = os.stat(path)
+        self.assertEqual(os.getuid(), info.st_uid)
+        self.assertEqual(0, info.st_mode & 0o077)
+
+
+if __name__ == '__main__':
+    unittest.main()
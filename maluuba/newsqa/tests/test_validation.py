@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from maluuba.newsqa import synthetic_data
+from maluuba.newsqa.data_processing import NewsQaDataset
+from maluuba.newsqa.validation import validate_dataset
+
+_STORY_TEXT = u"The cat sat on the mat. It was “happy”. Then it left\n"
+
+
+def _is_corrupt(row):
+    # The same as `check_corruption` in `test_newsqa`.
+    story_text = row.story_text
+    for user_answer_char_ranges in row.answer_char_ranges.split('|'):
+        for char_range in user_answer_char_ranges.split(','):
+            if char_range != 'None':
+                start, end = map(int, char_range.split(':'))
+                if start > len(story_text) or end > len(story_text) \
+                        or (start > 0 and not story_text[start - 1].isspace()) \
+                        or not (story_text[end - 1].isspace()
+                                or story_text[end - 1] in u'.!?"”)'):
+                    return True
+    return False
+
+
+class TestValidation(unittest.TestCase):
+    def test_combined(self):
+        rows = [
+            # Valid.
+            ('4:8|None|0:4,15:19', '', 1 / 3.0),
+            ('4:8', '{"4:8":2,"none":1}', 0.0),
+            ('31:39', '', 0.0),
+            # Invalid.
+            ('4:8|oops', '', 0.0),
+            ('4:80', '', 0.0),
+            ('5:8', '', 0.0),
+            ('4:8', '{"4:8":2,', 0.0),
+            ('4:8', '{"4:8":1,"8:12":1,"none":1}', 0.0),
+            ('4:8', '{"4:9":3}', 0.0),
+            ('4:8', '{}', 0.0),
+            ('4:8|None', '', 0.0),
+        ]
+        dataset = pd.DataFrame(
+            [dict(story_id='s', story_text=_STORY_TEXT, answer_char_ranges=answer_char_ranges,
+                  validated_answers=validated_answers, is_answer_absent=is_answer_absent)
+             for answer_char_ranges, validated_answers, is_answer_absent in rows],
+            index=range(10, 10 + len(rows)))
+        report = validate_dataset(dataset, workers=1)
+        self.assertListEqual([13, 14, 15, 16, 17, 18, 19, 20], report.get_rows())
+        self.assertListEqual([13], report.get_rows('answer_char_ranges_format'))
+        self.assertListEqual([14], report.get_rows('answer_char_range_bounds'))
+        self.assertListEqual([15], report.get_rows('answer_char_range_alignment'))
+        self.assertListEqual([16], report.get_rows('validated_answers_json'))
+        self.assertListEqual([17, 19], report.get_rows('consensus'))
+        self.assertListEqual([18], report.get_rows('validated_range_alignment'))
+        self.assertListEqual([20], report.get_rows('is_answer_absent'))
+        self.assertAlmostEqual(8.0 / len(rows), report.get_fraction())
+        self.assertEqual(8, len(report.to_frame()))
+        self.assertIn('answer_char_range_bounds: 1', report.summary())
+
+    def test_tokenized(self):
+        rows = [
+            # Valid.
+            ('0:2', '3,5'),
+            ('-1:-1', '3,5'),
+            ('1:2,3:5|4:5', '3,5'),
+            # Invalid.
+            ('4:6', '3,5'),
+            ('3:3', '3,5'),
+            ('x', '3,5'),
+            ('0:2', '3,4'),
+            ('0:2', '3,3,5'),
+        ]
+        dataset = pd.DataFrame(
+            [dict(story_id='s', story_text=u"a b c d e", answer_char_ranges='0:1',
+                  is_answer_absent=0.0, answer_token_ranges=answer_token_ranges,
+                  sentence_starts=sentence_starts)
+             for answer_token_ranges, sentence_starts in rows])
+        report = validate_dataset(dataset, workers=1)
+        self.assertListEqual([3, 4], report.get_rows('answer_token_range_bounds'))
+        self.assertListEqual([5], report.get_rows('answer_token_ranges_format'))
+        self.assertListEqual([6, 7], report.get_rows('sentence_starts'))
+        self.assertListEqual([3, 4, 5, 6, 7], report.get_rows())
+
+    def test_synthetic(self):
+        dir_path = tempfile.mkdtemp()
+        try:
+            cnn_stories_path, dataset_path = synthetic_data.generate(dir_path, scale=0.005)
+            newsqa_dataset = NewsQaDataset(cnn_stories_path, dataset_path, lazy=True)
+            report = newsqa_dataset.validate(workers=1)
+            dataset = newsqa_dataset.dataset
+            self.assertEqual(len(dataset), report.num_rows)
+            self.assertListEqual(
+                [row.Index for row in dataset.itertuples() if _is_corrupt(row)],
+                sorted(set(report.get_rows('answer_char_range_bounds')
+                           + report.get_rows('answer_char_range_alignment'))))
+            self.assertListEqual([], report.get_rows('answer_char_range_bounds'))
+            self.assertListEqual([], report.get_rows('is_answer_absent'))
+
+            sharded = validate_dataset(dataset, workers=2, shard_size=50)
+            self.assertListEqual(report.issues, sharded.issues)
+        finally:
+            shutil.rmtree(dir_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,295 @@
+"""
+Export the tokenized dataset as arrays of token IDs for training.
+
+The tokenized CSV has to be split into tokens and have its ranges parsed every time it's used.
+This writes a folder with the vocabulary and NumPy arrays instead:
+
+* `vocab.txt`: One token per line, the line number is the ID of the token.
+  ID 0 is for padding and ID 1 is for unknown tokens.
+* `story_tokens.npy` and `story_offsets.npy`: The token IDs of each distinct story, the tokens
+  of story `i` are `story_tokens[story_offsets[i]:story_offsets[i + 1]]`.
+* `story_ids.npy`: The ID of each story.
+* `sentence_starts.npy` and `sentence_offsets.npy`: The `sentence_starts` of each story.
+* `question_tokens.npy` and `question_offsets.npy`: The token IDs of each question.
+* `question_stories.npy`: The story of each question.
+* `answers.npy` and `answer_offsets.npy`: The `(start, end)` token ranges of each question's
+  answers. `(-1, -1)` means that there is no answer.
+* `is_answer_absent.npy`: The `is_answer_absent` of each question.
+
+Stories that have the same tokens and sentences are only written once.
+The arrays can be memory-mapped, see `TokenArrays`.
+"""
+import argparse
+import io
+import itertools
+import json
+import logging
+import os
+from collections import Counter
+
+import numpy as np
+import six
+from tqdm import tqdm
+
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    from maluuba.newsqa.data_processing import NewsQaDataset
+    from maluuba.newsqa.metrics import get_metrics
+    import maluuba.newsqa.span_utils as span_utils
+except:
+    # In case you're running this file from this folder.
+    from data_processing import NewsQaDataset
+    from metrics import get_metrics
+    import span_utils
+
+PAD_TOKEN = '<pad>'
+UNKNOWN_TOKEN = '<unk>'
+PAD_ID = 0
+UNKNOWN_ID = 1
+
+VOCAB_FILENAME = 'vocab.txt'
+METADATA_FILENAME = 'metadata.json'
+
+_ARRAY_NAMES = ['story_tokens', 'story_offsets', 'story_ids',
+                'sentence_starts', 'sentence_offsets',
+                'question_tokens', 'question_offsets', 'question_stories',
+                'answers', 'answer_offsets', 'is_answer_absent']
+
+logger = logging.getLogger('newsqa')
+
+
+def parse_answer_token_ranges(answer_token_ranges):
+    """
+    :param answer_token_ranges: The `answer_token_ranges` of a row.
+    :return: The `(start, end)` pairs.
+    :rtype: list
+    """
+    result = []
+    for user in answer_token_ranges.split(span_utils.USER_DELIMITER):
+        if user and user != 'None':
+            result.extend(span_utils.span_array_from_string(user))
+    return result
+
+
+def parse_sentence_starts(sentence_starts):
+    """
+    :param sentence_starts: The `sentence_starts` of a row.
+    :return: The positions.
+    :rtype: list
+    """
+    if not sentence_starts:
+        return []
+    return [int(position) for position in sentence_starts.split(',')]
+
+
+def build_vocab(texts, min_count=1):
+    """
+    :param texts: The tokenized texts.
+    :param min_count: The number of times that a token must occur to be in the vocabulary.
+    :return: The tokens, most frequent first, after the padding and unknown tokens.
+    :rtype: list
+    """
+    counts = Counter()
+    for text in texts:
+        counts.update(text.split())
+    tokens = sorted((token for token, count in six.iteritems(counts) if count >= min_count),
+                    key=lambda token: (-counts[token], token))
+    return [PAD_TOKEN, UNKNOWN_TOKEN] + tokens
+
+
+def _to_ids(text, token_to_id):
+    return [token_to_id.get(token, UNKNOWN_ID) for token in text.split()]
+
+
+def _concatenate(sequences, dtype):
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    np.cumsum([len(sequence) for sequence in sequences], out=offsets[1:])
+    if offsets[-1] == 0:
+        return np.zeros((0,), dtype=dtype), offsets
+    return np.concatenate([np.asarray(sequence, dtype=dtype) for sequence in sequences]), offsets
+
+
+def export_token_arrays(dataset, output_dir_path, vocab=None, min_count=1):
+    """
+    Write the arrays of token IDs for a tokenized dataset.
+
+    :param dataset: The tokenized dataset or the path to it.
+    :param output_dir_path: The folder to write the files to.
+    :param vocab: (Optional) The tokens to use, e.g. to match the vocabulary of another split.
+        The first two must be `PAD_TOKEN` and `UNKNOWN_TOKEN`.
+        Defaults to building it from `dataset`.
+    :param min_count: The number of times that a token must occur to be in the vocabulary
+        when building it.
+    :return: The number of distinct stories.
+    """
+    if isinstance(dataset, six.string_types):
+        dataset = NewsQaDataset.load_combined(dataset)
+    if not os.path.exists(output_dir_path):
+        os.makedirs(output_dir_path)
+
+    with get_metrics().stage('export_token_arrays', rows=len(dataset)) as record:
+        # Stories can have different tokens for different questions
+        # (see `unpack`) so they're distinguished by their tokens and sentences.
+        story_keys = list(zip(dataset['story_text'].values, dataset['sentence_starts'].values))
+        story_numbers = {}
+        question_stories = np.empty(len(dataset), dtype=np.int32)
+        story_ids = []
+        for i, (story_key, story_id) in enumerate(zip(story_keys, dataset['story_id'].values)):
+            story_number = story_numbers.get(story_key)
+            if story_number is None:
+                story_number = story_numbers[story_key] = len(story_ids)
+                story_ids.append(story_id)
+            question_stories[i] = story_number
+        stories = [None] * len(story_numbers)
+        for story_key, story_number in six.iteritems(story_numbers):
+            stories[story_number] = story_key
+        record.stories = len(stories)
+        questions = dataset['question'].values
+
+        if vocab is None:
+            vocab = build_vocab(itertools.chain(questions, (text for text, _ in stories)),
+                                min_count)
+        token_to_id = dict((token, i) for i, token in enumerate(vocab))
+
+        story_tokens, story_offsets = _concatenate(
+            [_to_ids(text, token_to_id)
+             for text, _ in tqdm(stories, mininterval=2, unit_scale=True, unit=" stories",
+                                 desc="Converting stories")],
+            np.int32)
+        sentence_starts, sentence_offsets = _concatenate(
+            [parse_sentence_starts(s) for _, s in stories], np.int32)
+        question_tokens, question_offsets = _concatenate(
+            [_to_ids(question, token_to_id) for question in questions], np.int32)
+        answers, answer_offsets = _concatenate(
+            [[position for span in parse_answer_token_ranges(a) for position in span]
+             for a in dataset['answer_token_ranges'].values],
+            np.int32)
+        answers = answers.reshape((-1, 2))
+        # Count pairs instead of positions.
+        answer_offsets //= 2
+
+        arrays = dict(
+            story_tokens=story_tokens,
+            story_offsets=story_offsets,
+            story_ids=np.array(story_ids, dtype=six.text_type),
+            sentence_starts=sentence_starts,
+            sentence_offsets=sentence_offsets,
+            question_tokens=question_tokens,
+            question_offsets=question_offsets,
+            question_stories=question_stories,
+            answers=answers,
+            answer_offsets=answer_offsets,
+            is_answer_absent=dataset['is_answer_absent'].values.astype(np.float32),
+        )
+        for name in _ARRAY_NAMES:
+            path = os.path.join(output_dir_path, '%s.npy' % name)
+            np.save(path, arrays[name])
+            record.add_bytes_written(os.path.getsize(path))
+
+        with io.open(os.path.join(output_dir_path, VOCAB_FILENAME), 'w', encoding='utf-8',
+                     newline='\n') as f:
+            for token in vocab:
+                f.write(token)
+                f.write('\n')
+        with io.open(os.path.join(output_dir_path, METADATA_FILENAME), 'w',
+                     encoding='utf-8') as f:
+            f.write(six.text_type(json.dumps(dict(num_questions=len(dataset),
+                                                  num_stories=len(stories),
+                                                  vocab_size=len(vocab)))))
+
+    logger.info("Wrote %d questions about %d stories with %d tokens in the vocabulary to `%s`.",
+                len(dataset), len(stories), len(vocab), output_dir_path)
+    return len(stories)
+
+
+def load_vocab(path):
+    """
+    :param path: The path of a `vocab.txt` file or the folder with it.
+    :return: The tokens.
+    :rtype: list
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, VOCAB_FILENAME)
+    with io.open(path, 'r', encoding='utf-8', newline='\n') as f:
+        return f.read().split('\n')[:-1]
+
+
+class TokenArrays(object):
+    """
+    The arrays written by `export_token_arrays`.
+
+    By default the arrays are memory-mapped so loading is instant and the memory is shared
+    with other processes using the same files.
+    """
+
+    def __init__(self, dir_path, mmap=True):
+        """
+        :param dir_path: The folder with the arrays.
+        :param mmap: `False` to read the arrays into memory.
+        """
+        self.dir_path = dir_path
+        mmap_mode = 'r' if mmap else None
+        for name in _ARRAY_NAMES:
+            setattr(self, name, np.load(os.path.join(dir_path, '%s.npy' % name),
+                                        mmap_mode=mmap_mode))
+        self._vocab = None
+
+    @property
+    def vocab(self):
+        if self._vocab is None:
+            self._vocab = load_vocab(self.dir_path)
+        return self._vocab
+
+    def __len__(self):
+        return len(self.question_stories)
+
+    @property
+    def num_stories(self):
+        return len(self.story_offsets) - 1
+
+    def get_story_tokens(self, story_number):
+        return self.story_tokens[self.story_offsets[story_number]:
+                                 self.story_offsets[story_number + 1]]
+
+    def get_sentence_starts(self, story_number):
+        return self.sentence_starts[self.sentence_offsets[story_number]:
+                                    self.sentence_offsets[story_number + 1]]
+
+    def get_question_tokens(self, i):
+        return self.question_tokens[self.question_offsets[i]:self.question_offsets[i + 1]]
+
+    def get_answers(self, i):
+        """
+        :param i: The number of a question.
+        :return: The `(start, end)` token ranges of the answers.
+        :rtype: numpy.ndarray
+        """
+        return self.answers[self.answer_offsets[i]:self.answer_offsets[i + 1]]
+
+    def decode(self, token_ids):
+        """
+        :return: The text for token IDs.
+        """
+        vocab = self.vocab
+        return ' '.join(vocab[token_id] for token_id in token_ids)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Export the tokenized dataset as arrays of token IDs for training.")
+    parser.add_argument('--dataset_path', default='newsqa-data-tokenized-v1.csv',
+                        help="The path to the tokenized dataset or a split of it.")
+    parser.add_argument('--output_dir_path', default='token_arrays',
+                        help="The folder to write the arrays to.")
+    parser.add_argument('--vocab_path',
+                        help="(Optional) The path to an existing `vocab.txt` to use.")
+    parser.add_argument('--min_count', type=int, default=1,
+                        help="The number of times that a token must occur to be in the "
+                             "vocabulary.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    export_token_arrays(args.dataset_path, args.output_dir_path,
+                        vocab=load_vocab(args.vocab_path) if args.vocab_path else None,
+                        min_count=args.min_count)
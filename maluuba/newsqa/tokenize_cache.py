@@ -0,0 +1,179 @@
+"""
+An on-disk cache of tokenized lines so that reruns only tokenize what changed.
+
+The tokenizer gets a packed file (see `tokenize_dataset.pack`) and splits each line into
+sentences of tokens on its own, so the output for a line only depends on the line and the
+tokenizer.
+The cache is a SQLite database from a hash of the tokenizer version and the line to the
+sentences of the line.
+Each row of the dataset is packed as its question and its story text with the answers tagged,
+so when only questions change, the story lines are found in the cache.
+
+    tokenize_data(dataset, output_path, work_path_prefix, cache_path='tokenize-cache.sqlite')
+"""
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+
+import six
+
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    from maluuba.newsqa.metrics import get_file_size, get_metrics
+except:
+    # In case you're running this file from this folder.
+    from metrics import get_file_size, get_metrics
+
+# The number of lines to look up at once.
+BATCH_SIZE = 500
+
+logger = logging.getLogger('newsqa')
+
+
+def get_line_key(line, tokenizer_version):
+    """
+    :param line: A line of a packed file, without the line ending.
+    :param tokenizer_version: The version of the tokenizer.
+    :return: The key of the line in the cache.
+    :rtype: bytes
+    """
+    data = u'%s\n%s' % (tokenizer_version, line)
+    return hashlib.sha1(data.encode('utf-8')).digest()
+
+
+def _read_lines(path):
+    # Like Java's `readLine`, split on any kind of line ending.
+    with io.open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield line.rstrip('\n')
+
+
+def _read_batches(lines, batch_size=BATCH_SIZE):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class TokenizeCache(object):
+    """
+    The sentences of tokenized lines by the key of the line (see `get_line_key`).
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The path of the SQLite database. It's created if it doesn't exist.
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS lines '
+                                 '(key BLOB PRIMARY KEY, sentences TEXT NOT NULL)')
+
+    def __len__(self):
+        return self._connection.execute('SELECT COUNT(*) FROM lines').fetchone()[0]
+
+    def get_many(self, keys):
+        """
+        :param keys: The keys of lines, at most `BATCH_SIZE`.
+        :return: The sentences of the lines that are in the cache by key.
+        :rtype: dict
+        """
+        keys = list(set(keys))
+        if not keys:
+            return dict()
+        rows = self._connection.execute(
+            'SELECT key, sentences FROM lines WHERE key IN (%s)' % ','.join('?' * len(keys)),
+            [sqlite3.Binary(key) for key in keys])
+        return dict((bytes(key), sentences.split('\n')) for key, sentences in rows)
+
+    def put_many(self, items):
+        """
+        :param items: Pairs of the key of a line and the sentences of the line.
+        """
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO lines (key, sentences) VALUES (?, ?)',
+                ((sqlite3.Binary(key), u'\n'.join(sentences)) for key, sentences in items))
+
+    def close(self):
+        self._connection.close()
+
+
+def _read_tokenized(path):
+    """
+    :return: The sentences of each line of a tokenized packed file.
+    """
+    lines = _read_lines(path)
+    for num_sentences in lines:
+        yield [next(lines) for _ in six.moves.range(int(num_sentences))]
+
+
+def tokenize_with_cache(packed_path, tokenized_path, tokenizer, cache_path, tokenizer_version):
+    """
+    Tokenize a packed file, only the lines that aren't in the cache are tokenized.
+
+    :param packed_path: The path of the file written by `pack`.
+    :param tokenized_path: The path to write the tokenized file to.
+    :param tokenizer: A function taking the path of a packed file and the path to
+        write the tokenized file to.
+    :param cache_path: The path of the cache. It's created if it doesn't exist.
+    :param tokenizer_version: The version of the tokenizer.
+        Lines tokenized by other versions are not used.
+    :return: The number of lines that were tokenized.
+    :rtype: int
+    """
+    cache = TokenizeCache(cache_path)
+    misses_path = packed_path + '.misses'
+    misses_tokenized_path = misses_path + '.tokenized'
+    metrics = get_metrics()
+    try:
+        with metrics.stage('tokenize.cache_lookup') as record:
+            record.add_bytes_read(get_file_size(packed_path))
+            num_lines = 0
+            miss_keys = []
+            found = set()
+            with io.open(misses_path, 'w', encoding='utf-8', newline='\n') as misses:
+                for lines in _read_batches(_read_lines(packed_path)):
+                    num_lines += len(lines)
+                    keys = [get_line_key(line, tokenizer_version) for line in lines]
+                    found.update(cache.get_many(keys))
+                    for key, line in zip(keys, lines):
+                        if key not in found:
+                            # Only tokenize the same line once.
+                            found.add(key)
+                            miss_keys.append(key)
+                            misses.write(line)
+                            misses.write(u'\n')
+            del found
+        logger.info("Found %d/%d lines in the tokenize cache `%s`.",
+                    num_lines - len(miss_keys), num_lines, cache_path)
+
+        if miss_keys:
+            tokenizer(misses_path, misses_tokenized_path)
+            with metrics.stage('tokenize.cache_update', rows=len(miss_keys)):
+                cache.put_many(zip(miss_keys, _read_tokenized(misses_tokenized_path)))
+
+        with metrics.stage('tokenize.cache_write') as record:
+            with io.open(tokenized_path, 'w', encoding='utf-8', newline='\n') as output:
+                for lines in _read_batches(_read_lines(packed_path)):
+                    keys = [get_line_key(line, tokenizer_version) for line in lines]
+                    sentences = cache.get_many(keys)
+                    for key in keys:
+                        output.write(u'%d\n' % len(sentences[key]))
+                        for sentence in sentences[key]:
+                            output.write(sentence)
+                            output.write(u'\n')
+            record.add_bytes_written(get_file_size(tokenized_path))
+    finally:
+        cache.close()
+        for path in (misses_path, misses_tokenized_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return len(miss_keys)
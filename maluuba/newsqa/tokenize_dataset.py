@@ -1,10 +1,17 @@
 from __future__ import unicode_literals
 
+import collections
+import hashlib
 import io
 import logging
+import multiprocessing
 import os
+import shutil
+import stat
 import sys
+import tempfile
 import zipfile
+import zlib
 from argparse import ArgumentParser
 
 import pandas as pd
@@ -14,15 +21,27 @@ from tqdm import tqdm
 try:
     # Prefer a more specific path for when you run from the root of this repo
     # or if the root of the repo is in your path.
+    from maluuba.newsqa.checkpoints import (ShardCheckpoints, atomic_output, get_frame_key,
+                                            replace_file)
     from maluuba.newsqa.data_processing import NewsQaDataset
+    from maluuba.newsqa.metrics import get_file_size, get_metrics
+    from maluuba.newsqa.tokenize_cache import tokenize_with_cache
     import maluuba.newsqa.span_utils as span_utils
 except:
     # In case you're running this file from this folder.
+    from checkpoints import ShardCheckpoints, atomic_output, get_frame_key, replace_file
     from data_processing import NewsQaDataset
+    from metrics import get_file_size, get_metrics
+    from tokenize_cache import tokenize_with_cache
     import span_utils
 
 NEARBY_RANGE_THRESHOLD = 3
 
+DEFAULT_UNPACK_CHUNK_SIZE = 1000
+
+# The number of rows to tokenize at a time, a rerun resumes after the last shard that was done.
+DEFAULT_TOKENIZE_SHARD_SIZE = 10000
+
 logger = logging.getLogger('newsqa')
 
 
@@ -55,152 +74,478 @@ def pack(dataset, writer):
         writer.write(u'%s\n' % format(all_tagged_texts[0]))
 
 
-def unpack(dataset, packed, output_path):
-    def _read_unpacked():
-        n_sents = int(next(packed).strip())
-        return [next(packed).strip() for _ in six.moves.xrange(n_sents)]
-
-    data = []
-    for row in tqdm(dataset.itertuples(), total=len(dataset),
-                    mininterval=2, unit_scale=True, unit=" questions",
-                    desc="Unpacking"):
-        question = u' '.join(_read_unpacked())
-
-        # Valid starts
-        valid_tagged_text_sents = _read_unpacked()
-        valid_tagged_text = ' '.join(valid_tagged_text_sents)
-
-        valid_text_sents = [span_utils.remove_tags(s) for s in valid_tagged_text_sents]
-        story_text = span_utils.remove_tags(valid_tagged_text)
-
-        valid_span_rack = span_utils.span_rack_from_tag_text(
-            [valid_tagged_text], story_text)
-        valid_span_rack = span_utils.nearby_range_merge(
-            valid_span_rack, threshold=NEARBY_RANGE_THRESHOLD)
-
-        answer_token_ranges = span_utils.span_rack_to_string(valid_span_rack)
-        # Valid ends.
+def _unpack_row(datum, question_sents, valid_tagged_text_sents, refined_tagged_text_sents):
+    """
+    :param datum: The fields of the row in the combined dataset.
+    :param question_sents: The tokenized sentences of the question.
+    :param valid_tagged_text_sents: The tokenized sentences of the story tagged with the
+        validated answers.
+    :param refined_tagged_text_sents: The tokenized sentences of the story tagged with all of
+        the answers.
+    :return: The fields of the row in the tokenized dataset.
+    :rtype: dict
+    """
+    question = u' '.join(question_sents)
+
+    # Valid starts
+    valid_tagged_text = ' '.join(valid_tagged_text_sents)
+
+    valid_text_sents = [span_utils.remove_tags(s) for s in valid_tagged_text_sents]
+    story_text = span_utils.remove_tags(valid_tagged_text)
+
+    valid_span_rack = span_utils.span_rack_from_tag_text(
+        [valid_tagged_text], story_text)
+    valid_span_rack = span_utils.nearby_range_merge(
+        valid_span_rack, threshold=NEARBY_RANGE_THRESHOLD)
+
+    answer_token_ranges = span_utils.span_rack_to_string(valid_span_rack)
+    # Valid ends.
+
+    sentences_ids = [0]
+    for s in valid_text_sents:
+        sentences_ids.append(len(s.split()) + sentences_ids[-1])
+    # No need for the 0 as the first element because each article starts with a sentence.
+    sentences_ids = sentences_ids[1:]
+    sentence_starts = u','.join(map(str, sentences_ids))
+
+    if len(answer_token_ranges) == 0:
+        # Use refined data.
+        refined_tagged_text = u" ".join(refined_tagged_text_sents)
+
+        refined_text_sents = [
+            span_utils.remove_tags(s) for s in refined_tagged_text_sents]
+        story_text_2 = span_utils.remove_tags(refined_tagged_text)
+
+        refined_span_rack = span_utils.span_rack_from_tag_text(
+            [refined_tagged_text], story_text_2)
+        refined_span_rack = span_utils.nearby_range_merge(
+            refined_span_rack, threshold=NEARBY_RANGE_THRESHOLD)
+        answer_ranges_2 = span_utils.span_rack_to_string(refined_span_rack)
 
         sentences_ids = [0]
-        for s in valid_text_sents:
+        for s in refined_text_sents:
             sentences_ids.append(len(s.split()) + sentences_ids[-1])
-        # No need for the 0 as the first element because each article starts with a sentence.
         sentences_ids = sentences_ids[1:]
-        sentence_starts = u','.join(map(str, sentences_ids))
-
-        refined_tagged_text_sents = _read_unpacked()
-
-        if len(answer_token_ranges) == 0:
-            # Use refined data.
-            refined_tagged_text = u" ".join(refined_tagged_text_sents)
-
-            refined_text_sents = [
-                span_utils.remove_tags(s) for s in refined_tagged_text_sents]
-            story_text_2 = span_utils.remove_tags(refined_tagged_text)
-
-            refined_span_rack = span_utils.span_rack_from_tag_text(
-                [refined_tagged_text], story_text_2)
-            refined_span_rack = span_utils.nearby_range_merge(
-                refined_span_rack, threshold=NEARBY_RANGE_THRESHOLD)
-            answer_ranges_2 = span_utils.span_rack_to_string(refined_span_rack)
-
-            sentences_ids = [0]
-            for s in refined_text_sents:
-                sentences_ids.append(len(s.split()) + sentences_ids[-1])
-            sentences_ids = sentences_ids[1:]
-            sentence_starts_2 = ','.join(map(str, sentences_ids))
-
-            if len(answer_ranges_2) == 0:
-                answer_token_ranges = '-1:-1'
-            else:
-                answer_token_ranges = answer_ranges_2
-                sentence_starts = sentence_starts_2
-                story_text = story_text_2
-
-        # Custom columns because we only want to expose certain fields that have indices mapped.
-        datum = row._asdict()
-        datum['question'] = question
-        datum['answer_token_ranges'] = answer_token_ranges
-        datum['sentence_starts'] = sentence_starts
-        datum['story_text'] = story_text
-        # Remove validated answers since they're for character indices which are wrong now.
-        del datum['validated_answers']
-        del datum['Index']
-
-        # FIXME Keep `answer_char_ranges` for now since splitting needs it.
-        # TODO Add another flag that splitting can use to know to remove these so that it doesn't need answer_char_ranges.
-
-        data.append(datum)
+        sentence_starts_2 = ','.join(map(str, sentences_ids))
+
+        if len(answer_ranges_2) == 0:
+            answer_token_ranges = '-1:-1'
+        else:
+            answer_token_ranges = answer_ranges_2
+            sentence_starts = sentence_starts_2
+            story_text = story_text_2
+
+    # Custom columns because we only want to expose certain fields that have indices mapped.
+    datum['question'] = question
+    datum['answer_token_ranges'] = answer_token_ranges
+    datum['sentence_starts'] = sentence_starts
+    datum['story_text'] = story_text
+    # Remove validated answers since they're for character indices which are wrong now.
+    del datum['validated_answers']
+    del datum['Index']
+
+    # FIXME Keep `answer_char_ranges` for now since splitting needs it.
+    # TODO Add another flag that splitting can use to know to remove these so that it doesn't need answer_char_ranges.
+
+    return datum
+
+
+def _unpack_chunk(chunk, header=False):
+    """
+    :param chunk: The arguments to `_unpack_row` for consecutive rows.
+    :param header: `True` to include the header.
+    :return: The CSV for the rows.
+    """
+    data = [_unpack_row(*args) for args in chunk]
+    return pd.DataFrame(data=data).to_csv(index=False, header=header)
+
+
+def _read_unpack_chunks(dataset, packed, chunk_size):
+    """
+    :return: Lists of the arguments to `_unpack_row` for consecutive rows.
+        Chunks only end between stories, except for stories with more than `chunk_size` rows.
+    """
+    def _read_unpacked():
+        n_sents = int(next(packed).strip())
+        return [next(packed).strip() for _ in six.moves.xrange(n_sents)]
 
+    chunk = []
+    previous_story_id = None
+    for row in dataset.itertuples():
+        if len(chunk) >= chunk_size and row.story_id != previous_story_id:
+            yield chunk
+            chunk = []
+        previous_story_id = row.story_id
+        datum = row._asdict()
+        # The text is replaced by the tokenized text so don't send it to other processes.
+        datum['story_text'] = None
+        chunk.append((datum, _read_unpacked(), _read_unpacked(), _read_unpacked()))
+    if chunk:
+        yield chunk
+
+
+def unpack(dataset, packed, output_path, workers=None, chunk_size=DEFAULT_UNPACK_CHUNK_SIZE):
+    """
+    Write the tokenized dataset from the output of the tokenizer.
+
+    Chunks of rows are unpacked by a pool of processes and written in order as they are done
+    so the memory used doesn't grow with the size of the dataset.
+
+    :param dataset: The combined dataset that was packed.
+    :param packed: The lines of the tokenized packed file.
+    :param output_path: The path to write the tokenized dataset to.
+    :param workers: (Optional) The number of processes. Defaults to the number of CPUs.
+    :param chunk_size: The number of rows for a process to unpack at a time.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    chunks = _read_unpack_chunks(dataset, packed, chunk_size)
     logger.info("Writing to `%s`.", output_path)
-    pd.DataFrame(data=data).to_csv(output_path,
-                                   index=False, encoding='utf-8')
-
-
-def tokenize(cnn_stories='cnn_stories.tgz', csv_dataset='newsqa-data-v1.csv',
-             combined_data_path='combined-newsqa-data-v1.csv',
-             output_path='newsqa-data-tokenized-v1.csv'):
-    newsqa_data = NewsQaDataset(cnn_stories, csv_dataset,
-                                combined_data_path=combined_data_path)
-    dataset = newsqa_data.dataset
-
-    dir_name = os.path.dirname(os.path.abspath(__file__))
-    requirements = [dir_name,
-                    os.path.join(dir_name, 'stanford-postagger.jar'),
-                    os.path.join(dir_name, 'slf4j-api.jar')]
-    for req in requirements:
+    with io.open(output_path, 'w', encoding='utf-8', newline='') as f, \
+            tqdm(total=len(dataset), mininterval=2, unit_scale=True, unit=" questions",
+                 desc="Unpacking") as progress:
+        if len(dataset) == 0:
+            f.write(pd.DataFrame(data=[]).to_csv(index=False))
+            return
+
+        if workers <= 1 or len(dataset) <= chunk_size:
+            for i, chunk in enumerate(chunks):
+                f.write(_unpack_chunk(chunk, header=i == 0))
+                progress.update(len(chunk))
+            return
+
+        pool = multiprocessing.Pool(workers)
+        pending = collections.deque()
+        try:
+            for i, chunk in enumerate(chunks):
+                pending.append((len(chunk), pool.apply_async(_unpack_chunk, (chunk, i == 0))))
+                # Only keep a few chunks in memory.
+                while len(pending) > 2 * workers:
+                    num_rows, result = pending.popleft()
+                    f.write(result.get())
+                    progress.update(num_rows)
+            while pending:
+                num_rows, result = pending.popleft()
+                f.write(result.get())
+                progress.update(num_rows)
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+_TOKENIZER_JARS = [
+    ('stanford-postagger.jar', 'stanford-postagger-2015-12-09/stanford-postagger.jar'),
+    ('slf4j-api.jar', 'stanford-postagger-2015-12-09/lib/slf4j-api.jar'),
+]
+
+
+def _get_jar_cache_dir_path():
+    """
+    :return: A folder in the temporary directory that only the current user can write to.
+    """
+    uid = os.getuid() if hasattr(os, 'getuid') else None
+    name = 'newsqa-tokenizer' if uid is None else 'newsqa-tokenizer-%d' % uid
+    result = os.path.join(tempfile.gettempdir(), name)
+    try:
+        os.makedirs(result, 0o700)
+    except OSError:
+        if not os.path.isdir(result):
+            raise
+    if uid is not None:
+        # Another user could have made the folder to put their own JARs on the classpath.
+        info = os.lstat(result)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != uid or info.st_mode & 0o077:
+            raise Exception("`%s` must be a folder that only you can access." % result)
+    return result
+
+
+def _is_extracted(path, member_info):
+    """
+    :return: `True` if the file at `path` has the size and CRC of the zip member.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) != member_info.file_size:
+        return False
+    crc = 0
+    with io.open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            crc = zlib.crc32(block, crc)
+    return crc & 0xffffffff == member_info.CRC
+
+
+def _get_tokenizer_classpath(dir_name=None, cache_dir_path=None):
+    """
+    :param dir_name: (Optional) The folder with the JARs or the Stanford zip file.
+        Defaults to this folder.
+    :param cache_dir_path: (Optional) The folder to extract JARs to.
+        Defaults to a folder in the temporary directory for the current user.
+    :return: The Java classpath with the JARs required by the tokenizer.
+        JARs that aren't in `dir_name` are extracted from the Stanford zip file to
+        `cache_dir_path`, nothing is written to `dir_name`.
+        Extracted JARs are only used if they match the zip file.
+    """
+    if dir_name is None:
+        dir_name = os.path.dirname(os.path.abspath(__file__))
+    zip_path = os.path.join(dir_name, 'stanford-postagger-2015-12-09.zip')
+    requirements = []
+    for jar_name, member_name in _TOKENIZER_JARS:
+        req = os.path.join(dir_name, jar_name)
         if not os.path.exists(req):
-            zip_path = os.path.join(dir_name, 'stanford-postagger-2015-12-09.zip')
-            if os.path.exists(zip_path):
-                logger.info("Extracting dependencies from `%s`.", zip_path)
-                with zipfile.ZipFile(zip_path) as z:
-                    z.extract('stanford-postagger-2015-12-09/stanford-postagger.jar', path=dir_name)
-                    z.extract('stanford-postagger-2015-12-09/lib/slf4j-api.jar', path=dir_name)
-                os.rename(os.path.join(dir_name, 'stanford-postagger-2015-12-09/stanford-postagger.jar'),
-                          os.path.join(dir_name, 'stanford-postagger.jar'))
-                os.rename(os.path.join(dir_name, 'stanford-postagger-2015-12-09/lib/slf4j-api.jar'),
-                          os.path.join(dir_name, 'slf4j-api.jar'))
-            else:
+            if not os.path.exists(zip_path):
                 raise Exception("Missing `%s`."
                                 "\nPlease refer to the README in the root of the project regarding the JAR's required." % req)
-
-    packed_filename = os.path.join(dir_name, csv_dataset + '.pck')
-    unpacked_filename = os.path.join(dir_name, csv_dataset + '.tpck')
-
-    logger.info("(1/3) - Packing data to `%s`.", packed_filename)
-    with io.open(packed_filename, mode='w', encoding='utf-8') as writer:
-        pack(dataset, writer)
-    logger.info("(2/3) - Tokenizing packed file to `%s`.", unpacked_filename)
-    classpath = os.pathsep.join(requirements)
-
-    cmd = 'javac -classpath %s %s' % (classpath, os.path.join(dir_name, 'TokenizerSplitter.java'))
+            if cache_dir_path is None:
+                cache_dir_path = _get_jar_cache_dir_path()
+            req = os.path.join(cache_dir_path, jar_name)
+            with zipfile.ZipFile(zip_path) as z:
+                member_info = z.getinfo(member_name)
+                if not _is_extracted(req, member_info):
+                    logger.info("Extracting `%s` from `%s` to `%s`.", member_name, zip_path, req)
+                    source = z.open(member_info)
+                    try:
+                        with tempfile.NamedTemporaryFile(dir=cache_dir_path, delete=False) as f:
+                            shutil.copyfileobj(source, f)
+                    finally:
+                        source.close()
+                    # Rename so that other processes never see a partial file.
+                    replace_file(f.name, req)
+        requirements.append(req)
+    return os.pathsep.join(requirements)
+
+
+def compile_java_tokenizer(classpath, classes_path):
+    """
+    Compile `TokenizerSplitter.java`.
+
+    :param classpath: The Java classpath with the required JARs.
+    :param classes_path: The folder to write the compiled classes to.
+    """
+    dir_name = os.path.dirname(os.path.abspath(__file__))
+    cmd = 'javac -d %s -classpath %s %s' % (classes_path, classpath,
+                                            os.path.join(dir_name, 'TokenizerSplitter.java'))
     logger.info("Running `%s`", cmd)
-    exit_status = os.system(cmd)
+    with get_metrics().stage('tokenize.compile'):
+        exit_status = os.system(cmd)
     if exit_status:
         sys.exit(exit_status)
 
-    cmd = 'java -classpath %s TokenizerSplitter %s > %s' % (
-        classpath, packed_filename, unpacked_filename)
-    logger.info("Running `%s`\nThe warnings below are normal.", cmd)
-    exit_status = os.system(cmd)
-    if exit_status:
-        sys.exit(exit_status)
+
+def run_java_tokenizer(packed_path, tokenized_path, classpath=None, classes_path=None):
+    """
+    Tokenize a packed file with `TokenizerSplitter.java`.
+
+    :param packed_path: The path of the file written by `pack`.
+    :param tokenized_path: The path to write the tokenized file to.
+    :param classpath: (Optional) The Java classpath with the required JARs.
+    :param classes_path: (Optional) The folder with the classes from `compile_java_tokenizer`.
+        By default, `TokenizerSplitter.java` is compiled to a temporary folder.
+    """
+    if classpath is None:
+        classpath = _get_tokenizer_classpath()
+    temp_classes_path = None
+    if classes_path is None:
+        classes_path = temp_classes_path = tempfile.mkdtemp(prefix='newsqa-tokenizer-classes-')
+    try:
+        if temp_classes_path is not None:
+            compile_java_tokenizer(classpath, classes_path)
+
+        cmd = 'java -classpath %s TokenizerSplitter %s > %s' % (
+            os.pathsep.join([classes_path, classpath]), packed_path, tokenized_path)
+        logger.info("Running `%s`\nThe warnings below are normal.", cmd)
+        with get_metrics().stage('tokenize.java') as record:
+            record.add_bytes_read(get_file_size(packed_path))
+            exit_status = os.system(cmd)
+            record.add_bytes_written(get_file_size(tokenized_path))
+        if exit_status:
+            sys.exit(exit_status)
+    finally:
+        if temp_classes_path is not None:
+            shutil.rmtree(temp_classes_path, ignore_errors=True)
+
+
+def get_java_tokenizer_version():
+    """
+    :return: The version of `TokenizerSplitter.java` and the JARs that it uses.
+        The JARs don't need to be extracted.
+    :rtype: str
+    """
+    dir_name = os.path.dirname(os.path.abspath(__file__))
+    with io.open(os.path.join(dir_name, 'TokenizerSplitter.java'), 'rb') as f:
+        source_hash = hashlib.sha1(f.read()).hexdigest()
+    jar_names = [jar_name for jar_name, _ in _TOKENIZER_JARS]
+    return 'TokenizerSplitter-%s:stanford-postagger-2015-12-09:%s' % (source_hash,
+                                                                       ','.join(jar_names))
+
+
+def _tokenize_shard(dataset, output_path, work_path_prefix, tokenizer, cache_path,
+                    tokenizer_version, workers, chunk_size):
+    """
+    Pack, tokenize and unpack some rows, see `tokenize_data`.
+    """
+    packed_filename = work_path_prefix + '.pck'
+    unpacked_filename = work_path_prefix + '.tpck'
+
+    metrics = get_metrics()
+    logger.info("(1/3) - Packing data to `%s`.", packed_filename)
+    with metrics.stage('pack', rows=len(dataset)) as record:
+        with io.open(packed_filename, mode='w', encoding='utf-8') as writer:
+            pack(dataset, writer)
+        record.add_bytes_written(get_file_size(packed_filename))
+
+    logger.info("(2/3) - Tokenizing packed file to `%s`.", unpacked_filename)
+    if cache_path:
+        tokenize_with_cache(packed_filename, unpacked_filename, tokenizer, cache_path,
+                            tokenizer_version)
+    else:
+        tokenizer(packed_filename, unpacked_filename)
 
     os.remove(packed_filename)
 
     logger.info("(3/3) - Unpacking tokenized file to `%s`", output_path)
-    with io.open(unpacked_filename, mode='r', encoding='utf-8') as packed:
-        unpack(dataset, packed, output_path)
+    with metrics.stage('unpack', rows=len(dataset)) as record:
+        record.add_bytes_read(get_file_size(unpacked_filename))
+        with io.open(unpacked_filename, mode='r', encoding='utf-8') as packed, \
+                atomic_output(output_path) as path:
+            unpack(dataset, packed, path, workers=workers, chunk_size=chunk_size)
+        record.add_bytes_written(get_file_size(output_path))
 
     os.remove(unpacked_filename)
 
 
+def _join_shards(shard_paths, output_path):
+    """
+    Concatenate the CSV of each shard, only keeping the header of the first one.
+    """
+    with io.open(output_path, 'wb') as output:
+        for i, path in enumerate(shard_paths):
+            with io.open(path, 'rb') as f:
+                if i > 0:
+                    f.readline()
+                shutil.copyfileobj(f, output)
+
+
+def tokenize_data(dataset, output_path, work_path_prefix, tokenizer=None, cache_path=None,
+                  tokenizer_version=None, workers=None, chunk_size=DEFAULT_UNPACK_CHUNK_SIZE,
+                  shard_size=DEFAULT_TOKENIZE_SHARD_SIZE):
+    """
+    Tokenize the questions and stories of a dataset.
+
+    The rows are tokenized in shards and the output of each shard is kept until the whole
+    dataset is done, so running again after an interruption resumes after the last shard
+    that was done. Shards whose rows or tokenizer version changed are tokenized again.
+
+    :param dataset: The combined dataset.
+    :param output_path: The path to write the tokenized dataset to.
+        It's only written once every shard is done.
+    :param work_path_prefix: The prefix of the paths for intermediate files.
+        The output of each shard is kept in the folder `work_path_prefix + '.shards'`.
+    :param tokenizer: (Optional) A function taking the path of a packed file and the path to
+        write the tokenized file to. Defaults to `run_java_tokenizer`.
+    :param cache_path: (Optional) The path of a cache of tokenized lines so that only lines
+        that weren't tokenized before are tokenized, see `tokenize_cache`.
+    :param tokenizer_version: (Optional) The version of `tokenizer` for the cache and the
+        shards. Required with `cache_path` when `tokenizer` is given.
+    :param workers: (Optional) The number of processes to unpack with.
+        Defaults to the number of CPUs.
+    :param chunk_size: The number of rows for a process to unpack at a time.
+    :param shard_size: The number of rows to tokenize at a time.
+    """
+    classes_path = None
+    if tokenizer is None:
+        if tokenizer_version is None:
+            tokenizer_version = get_java_tokenizer_version()
+        # The JARs are found and the tokenizer is compiled once, when the first shard that isn't
+        # done or cached is tokenized.
+        classes_path = tempfile.mkdtemp(prefix='newsqa-tokenizer-classes-')
+        compiled_classpath = []
+
+        def tokenizer(packed_path, tokenized_path):
+            if not compiled_classpath:
+                classpath = _get_tokenizer_classpath()
+                compile_java_tokenizer(classpath, classes_path)
+                compiled_classpath.append(classpath)
+            run_java_tokenizer(packed_path, tokenized_path, compiled_classpath[0], classes_path)
+    elif cache_path and tokenizer_version is None:
+        raise ValueError("`tokenizer_version` is required to cache a custom tokenizer.")
+
+    try:
+        _tokenize_shards(dataset, output_path, work_path_prefix, tokenizer, cache_path,
+                         tokenizer_version, workers, chunk_size, shard_size)
+    finally:
+        if classes_path is not None:
+            shutil.rmtree(classes_path, ignore_errors=True)
+
+
+def _tokenize_shards(dataset, output_path, work_path_prefix, tokenizer, cache_path,
+                     tokenizer_version, workers, chunk_size, shard_size):
+    """
+    Tokenize the shards that aren't done and join them, see `tokenize_data`.
+    """
+    checkpoints = ShardCheckpoints(work_path_prefix + '.shards')
+    shards = [dataset.iloc[start:start + shard_size]
+              for start in six.moves.range(0, len(dataset), shard_size)] or [dataset]
+    with get_metrics().stage('tokenize.shard_keys', rows=len(dataset)):
+        shard_keys = [get_frame_key(shard, tokenizer_version or '') for shard in shards]
+    shard_paths = [checkpoints.get_path(i, key) for i, key in enumerate(shard_keys)]
+    checkpoints.remove_stale(shard_paths)
+
+    for i, (shard, key, shard_path) in enumerate(zip(shards, shard_keys, shard_paths)):
+        if checkpoints.is_done(i, key):
+            logger.info("Shard %d/%d was already tokenized.", i + 1, len(shards))
+            continue
+        logger.info("Tokenizing shard %d/%d.", i + 1, len(shards))
+        _tokenize_shard(shard, shard_path, work_path_prefix, tokenizer, cache_path,
+                        tokenizer_version, workers, chunk_size)
+
+    logger.info("Joining %d shards to `%s`.", len(shards), output_path)
+    with atomic_output(output_path) as path:
+        _join_shards(shard_paths, path)
+    checkpoints.remove()
+
+
+def tokenize(cnn_stories='cnn_stories.tgz', csv_dataset='newsqa-data-v1.csv',
+             combined_data_path='combined-newsqa-data-v1.csv',
+             output_path='newsqa-data-tokenized-v1.csv', cache_path=None, workers=None,
+             chunk_size=DEFAULT_UNPACK_CHUNK_SIZE, shard_size=DEFAULT_TOKENIZE_SHARD_SIZE,
+             work_dir_path=None):
+    """
+    Build or load the combined dataset and tokenize it with `tokenize_data`.
+
+    :param work_dir_path: (Optional) The folder to write the packed files and the finished
+        shards to. Defaults to the folder of `output_path`.
+    """
+    newsqa_data = NewsQaDataset(cnn_stories, csv_dataset,
+                                combined_data_path=combined_data_path)
+    if work_dir_path is None:
+        work_dir_path = os.path.dirname(os.path.abspath(output_path))
+    tokenize_data(newsqa_data.dataset, output_path,
+                  os.path.join(work_dir_path, os.path.basename(csv_dataset)),
+                  cache_path=cache_path, workers=workers, chunk_size=chunk_size,
+                  shard_size=shard_size)
+
+
 if __name__ == '__main__':
     parser = ArgumentParser("NewsQA dataset parser")
     parser.add_argument("--cnn_stories", default='cnn_stories.tgz')
     parser.add_argument("--csv_dataset", default='newsqa-data-v1.csv')
     parser.add_argument("--combined_dataset", default='combined-newsqa-data-v1.csv')
     parser.add_argument("--output", default='newsqa-data-tokenized-v1.csv')
+    parser.add_argument("--cache_path",
+                        help="(Optional) The path of a cache of tokenized lines to reuse "
+                             "across runs. E.g. tokenize-cache.sqlite")
+    parser.add_argument("--shard_size", type=int, default=DEFAULT_TOKENIZE_SHARD_SIZE,
+                        help="The number of rows to tokenize at a time. A rerun resumes after "
+                             "the last shard that was done.")
+    parser.add_argument("--work_dir",
+                        help="(Optional) The folder to write the packed files and the finished "
+                             "shards to. Defaults to the folder of the output.")
+    parser.add_argument("--metrics_path",
+                        help="(Optional) The path to write the metrics for each stage to as JSON.")
+    parser.add_argument("--profile_stages", nargs='*', default=[],
+                        help="(Optional) The names of the stages to profile with cProfile. "
+                             "E.g. pack unpack")
     args = parser.parse_args()
 
-    tokenize(args.cnn_stories, args.csv_dataset, args.combined_dataset, args.output)
+    get_metrics().profile_stages.update(args.profile_stages)
+    tokenize(args.cnn_stories, args.csv_dataset, args.combined_dataset, args.output,
+             args.cache_path, shard_size=args.shard_size, work_dir_path=args.work_dir)
+    if args.metrics_path:
+        get_metrics().dump(args.metrics_path)
@@ -0,0 +1,439 @@
+"""
+Check the integrity of the dataset.
+
+The checks work on whole columns at once and the rows are split into shards that are checked
+by a pool of processes:
+
+    from maluuba.newsqa.data_processing import NewsQaDataset
+
+    newsqa_dataset = NewsQaDataset()
+    report = newsqa_dataset.validate()
+    print(report.summary())
+    bad_rows = newsqa_dataset.dataset.loc[report.get_rows('answer_char_range_bounds')]
+
+The checks are:
+
+* `answer_char_ranges_format`: `answer_char_ranges` can't be parsed.
+* `answer_char_range_bounds`: A range in `answer_char_ranges` is not within the story
+  or ends before it starts.
+* `answer_char_range_alignment`: A range in `answer_char_ranges` doesn't start after whitespace
+  or doesn't end with whitespace or punctuation.
+* `validated_answers_json`: `validated_answers` isn't a JSON object of answers to positive counts.
+* `validated_range_bounds` and `validated_range_alignment`: Like for `answer_char_ranges` but
+  for the ranges in `validated_answers`.
+* `consensus`: The validators didn't agree on an answer.
+* `is_answer_absent`: `is_answer_absent` doesn't agree with whether any crowdsourcers said
+  there was no answer.
+
+And for the tokenized data (character ranges are not checked since they are for the original
+text):
+
+* `answer_token_ranges_format`: `answer_token_ranges` can't be parsed.
+* `answer_token_range_bounds`: A range in `answer_token_ranges` is not within the tokens of
+  the story or ends before it starts.
+* `sentence_starts`: `sentence_starts` isn't increasing or doesn't end at the number of tokens
+  in the story.
+
+Some issues are expected in the real data due to certain characteristics of the original text,
+e.g. answers that end in the middle of a word.
+"""
+import argparse
+import io
+import json
+import logging
+import multiprocessing
+import re
+import sys
+from collections import Counter, OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+import six
+
+try:
+    # Prefer a more specific path for when you run from the root of this repo
+    # or if the root of the repo is in your path.
+    from maluuba.newsqa.metrics import get_metrics
+except:
+    # In case you're running this file from this folder.
+    from metrics import get_metrics
+
+DEFAULT_SHARD_SIZE = 20000
+
+CHECKS = ['answer_char_ranges_format', 'answer_char_range_bounds', 'answer_char_range_alignment',
+          'validated_answers_json', 'validated_range_bounds', 'validated_range_alignment',
+          'consensus', 'is_answer_absent',
+          'answer_token_ranges_format', 'answer_token_range_bounds', 'sentence_starts']
+
+_RANGE = r'\d+:\d+'
+_USER_RANGES = r'(?:None|{0}(?:,{0})*)'.format(_RANGE)
+_ANSWER_CHAR_RANGES_PATTERN = r'^{0}(?:\|{0})*$'.format(_USER_RANGES)
+_ANSWER_TOKEN_RANGES_PATTERN = r'^(?:-1:-1|{0}(?:[,|]{0})*)$'.format(_RANGE)
+_SENTENCE_STARTS_PATTERN = r'^(?:\d+(?:,\d+)*)?$'
+_VALIDATED_ANSWER_PATTERN = re.compile(r'^(\d+):(\d+)$')
+
+# The characters that `str.isspace` is true for all have code points below 0x3001.
+_WHITESPACE = np.array([c for c in six.moves.range(0x3001) if six.unichr(c).isspace()],
+                       dtype=np.uint32)
+_TOKEN_ENDINGS = np.concatenate([_WHITESPACE,
+                                 np.array([ord(c) for c in u'.!?"”)'], dtype=np.uint32)])
+
+logger = logging.getLogger('newsqa')
+
+Issue = namedtuple('Issue', ['row', 'check', 'message'])
+Issue.__doc__ = """
+A problem with a row of the dataset.
+
+`row` is the label of the row in the dataset, `check` is one of `CHECKS`.
+"""
+
+
+class ValidationReport(object):
+    """
+    The issues found in a dataset, at most one for each check of a row.
+    """
+
+    def __init__(self, num_rows, issues):
+        """
+        :param num_rows: The number of rows that were checked.
+        :param issues: The `Issue`s, in the order of the rows.
+        """
+        self.num_rows = num_rows
+        self.issues = list(issues)
+
+    def __len__(self):
+        return len(self.issues)
+
+    @property
+    def is_valid(self):
+        return not self.issues
+
+    @property
+    def counts(self):
+        """
+        :return: The number of rows with issues for each check that found some.
+        :rtype: OrderedDict
+        """
+        counts = Counter(issue.check for issue in self.issues)
+        return OrderedDict((check, counts[check]) for check in CHECKS if counts[check])
+
+    def get_issues(self, check=None):
+        """
+        :param check: (Optional) The check to get issues for. Defaults to every check.
+        :rtype: list
+        """
+        return [issue for issue in self.issues if check is None or issue.check == check]
+
+    def get_rows(self, check=None):
+        """
+        :param check: (Optional) The check to get rows for. Defaults to every check.
+        :return: The labels of the rows with issues, e.g. to use with `dataset.loc`.
+        :rtype: list
+        """
+        return list(OrderedDict.fromkeys(issue.row for issue in self.get_issues(check)))
+
+    def get_fraction(self, check=None):
+        """
+        :param check: (Optional) The check to count. Defaults to every check.
+        :return: The fraction of rows with issues.
+        """
+        if not self.num_rows:
+            return 0.0
+        return len(self.get_rows(check)) * 1.0 / self.num_rows
+
+    def to_frame(self):
+        """
+        :return: The issues with one row for each one.
+        :rtype: pandas.DataFrame
+        """
+        return pd.DataFrame(self.issues, columns=list(Issue._fields))
+
+    def to_dict(self):
+        return OrderedDict([
+            ('num_rows', self.num_rows),
+            ('counts', self.counts),
+            ('issues', [issue._asdict() for issue in self.issues]),
+        ])
+
+    def summary(self):
+        """
+        :return: A description of the number of issues for each check.
+        """
+        if self.is_valid:
+            return "No issues in %d rows." % self.num_rows
+        lines = ["Issues in %d/%d rows:" % (len(self.get_rows()), self.num_rows)]
+        for check, count in six.iteritems(self.counts):
+            lines.append("  %s: %d (%.3f%%)" % (check, count, count * 100.0 / self.num_rows))
+        return '\n'.join(lines)
+
+
+def _get_strings(frame, column):
+    return frame[column].fillna('').astype(six.text_type)
+
+
+def _get_code_points(texts):
+    """
+    :return: The code points of all of the texts one after the other
+        and where each text starts in them.
+    """
+    bases = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in texts], out=bases[1:])
+    code_points = np.frombuffer(u''.join(texts).encode('utf-32-le'), dtype='<u4')
+    return code_points, bases
+
+
+def _extract_ranges(values, pattern=r'(-?\d+):(-?\d+)'):
+    """
+    :return: The row position, start and end of every range in `values`.
+    """
+    matches = values.reset_index(drop=True).str.extractall(pattern)
+    rows = np.asarray(matches.index.get_level_values(0), dtype=np.int64)
+    starts = matches[0].astype(np.int64).values
+    ends = matches[1].astype(np.int64).values
+    return rows, starts, ends
+
+
+class _Checker(object):
+    """
+    Checks a shard of rows.
+    """
+
+    def __init__(self, frame):
+        self.labels = frame.index.tolist()
+        self.frame = frame.reset_index(drop=True)
+        self.issues = []
+        self.is_tokenized = 'answer_token_ranges' in frame.columns
+        story_texts = _get_strings(self.frame, 'story_text')
+        text_numbers, texts = pd.factorize(story_texts)
+        self.text_numbers = np.asarray(text_numbers, dtype=np.int64)
+        self.texts = list(texts)
+        self.text_lengths = np.array([len(text) for text in self.texts], dtype=np.int64)
+
+    def add(self, check, positions, messages):
+        """
+        Add an issue for the first message for each row.
+        """
+        positions, first = np.unique(np.asarray(positions, dtype=np.int64), return_index=True)
+        for position, i in zip(positions, first):
+            self.issues.append((position, Issue(self.labels[position], check, messages[i])))
+
+    def get_issues(self):
+        self.issues.sort(key=lambda item: (item[0], CHECKS.index(item[1].check)))
+        return [issue for _, issue in self.issues]
+
+    def check_format(self, check, column, pattern):
+        values = _get_strings(self.frame, column)
+        invalid = np.flatnonzero(~values.str.match(pattern).values.astype(bool))
+        self.add(check, invalid, ["`%s` can't be parsed: %r." % (column, values.iat[i])
+                                  for i in invalid])
+        return invalid
+
+    def check_char_ranges(self, column, rows, starts, ends, bounds_check, alignment_check):
+        text_numbers = self.text_numbers[rows]
+        lengths = self.text_lengths[text_numbers]
+        out_of_bounds = (starts < 0) | (starts >= ends) | (ends > lengths)
+        invalid = np.flatnonzero(out_of_bounds)
+        self.add(bounds_check, rows[invalid],
+                 ["`%s` has %d:%d but the story has %d characters."
+                  % (column, starts[i], ends[i], lengths[i]) for i in invalid])
+
+        within = np.flatnonzero(~out_of_bounds)
+        if len(within) == 0:
+            return
+        rows, starts, ends = rows[within], starts[within], ends[within]
+        text_numbers = text_numbers[within]
+        code_points, bases = _get_code_points(self.texts)
+        bases = bases[text_numbers]
+        before_start = code_points[bases + np.maximum(starts - 1, 0)]
+        last = code_points[bases + ends - 1]
+        misaligned = ((starts > 0) & ~np.isin(before_start, _WHITESPACE)) \
+            | ~np.isin(last, _TOKEN_ENDINGS)
+        invalid = np.flatnonzero(misaligned)
+        self.add(alignment_check, rows[invalid],
+                 ["`%s` has %d:%d which isn't aligned with tokens: %r."
+                  % (column, starts[i], ends[i],
+                     self.texts[text_numbers[i]][max(starts[i] - 1, 0):ends[i] + 1])
+                  for i in invalid])
+
+    def check_answer_char_ranges(self):
+        invalid = self.check_format('answer_char_ranges_format', 'answer_char_ranges',
+                                    _ANSWER_CHAR_RANGES_PATTERN)
+        values = _get_strings(self.frame, 'answer_char_ranges')
+        rows, starts, ends = _extract_ranges(values)
+        keep = ~np.isin(rows, invalid)
+        self.check_char_ranges('answer_char_ranges', rows[keep], starts[keep], ends[keep],
+                               'answer_char_range_bounds', 'answer_char_range_alignment')
+
+    def check_validated_answers(self):
+        values = _get_strings(self.frame, 'validated_answers')
+        rows, starts, ends = [], [], []
+        invalid_rows, invalid_messages = [], []
+        no_consensus_rows, no_consensus_messages = [], []
+        # Parsing JSON can't be vectorized but only some questions were validated.
+        for position in np.flatnonzero(values.str.len().values > 0):
+            value = values.iat[position]
+            try:
+                validated_answers = json.loads(value)
+            except ValueError:
+                validated_answers = None
+            if not isinstance(validated_answers, dict) \
+                    or not all(isinstance(count, six.integer_types) and count > 0
+                               for count in six.itervalues(validated_answers)):
+                invalid_rows.append(position)
+                invalid_messages.append("`validated_answers` is not an object of answers to "
+                                        "counts: %r." % value)
+                continue
+            ranges = []
+            for answer in validated_answers:
+                m = _VALIDATED_ANSWER_PATTERN.match(answer)
+                if m:
+                    ranges.append((int(m.group(1)), int(m.group(2))))
+                elif answer not in ('none', 'bad_question'):
+                    break
+            else:
+                for start, end in ranges:
+                    rows.append(position)
+                    starts.append(start)
+                    ends.append(end)
+                total_count = sum(six.itervalues(validated_answers))
+                if not validated_answers:
+                    no_consensus_rows.append(position)
+                    no_consensus_messages.append("There are no validated answers.")
+                elif max(six.itervalues(validated_answers)) < total_count / 2.0:
+                    no_consensus_rows.append(position)
+                    no_consensus_messages.append("No validated answer has a majority: %s."
+                                                 % value)
+                continue
+            invalid_rows.append(position)
+            invalid_messages.append("`validated_answers` has an invalid answer: %r." % value)
+
+        self.add('validated_answers_json', invalid_rows, invalid_messages)
+        self.add('consensus', no_consensus_rows, no_consensus_messages)
+        self.check_char_ranges('validated_answers',
+                               np.array(rows, dtype=np.int64),
+                               np.array(starts, dtype=np.int64),
+                               np.array(ends, dtype=np.int64),
+                               'validated_range_bounds', 'validated_range_alignment')
+
+    def check_is_answer_absent(self):
+        values = _get_strings(self.frame, 'answer_char_ranges')
+        num_none = values.str.count(r'(?:^|\|)None(?=\||$)').values
+        actual = pd.to_numeric(self.frame['is_answer_absent'], errors='coerce').values
+        # Crowdsourcers whose ranges were all dropped when clamping are gone
+        # so the proportion can't be checked exactly.
+        invalid = np.flatnonzero(~((actual >= 0) & (actual <= 1))
+                                 | ((num_none > 0) != (actual > 0)))
+        self.add('is_answer_absent', invalid,
+                 ["`is_answer_absent` is %r but %d crowdsourcers said there was no answer."
+                  % (actual[i], num_none[i]) for i in invalid])
+
+    def check_tokens(self):
+        num_tokens = pd.Series(self.texts, dtype=object).str.count(r'\S+').values \
+            .astype(np.int64)
+        row_num_tokens = num_tokens[self.text_numbers]
+
+        invalid = self.check_format('answer_token_ranges_format', 'answer_token_ranges',
+                                    _ANSWER_TOKEN_RANGES_PATTERN)
+        rows, starts, ends = _extract_ranges(_get_strings(self.frame, 'answer_token_ranges'))
+        no_answer = (starts == -1) & (ends == -1)
+        out_of_bounds = ~no_answer & ((starts < 0) | (starts >= ends)
+                                      | (ends > row_num_tokens[rows]))
+        out_of_bounds &= ~np.isin(rows, invalid)
+        out_of_bounds = np.flatnonzero(out_of_bounds)
+        self.add('answer_token_range_bounds', rows[out_of_bounds],
+                 ["`answer_token_ranges` has %d:%d but the story has %d tokens."
+                  % (starts[i], ends[i], row_num_tokens[rows[i]]) for i in out_of_bounds])
+
+        values = _get_strings(self.frame, 'sentence_starts')
+        invalid = np.flatnonzero(~values.str.match(_SENTENCE_STARTS_PATTERN).values.astype(bool))
+        matches = values.str.extractall(r'(\d+)')
+        rows = np.asarray(matches.index.get_level_values(0), dtype=np.int64)
+        positions = matches[0].astype(np.int64).values
+        same_row = rows[1:] == rows[:-1]
+        not_increasing = rows[1:][same_row & (positions[1:] <= positions[:-1])]
+        last = np.flatnonzero(np.concatenate([rows[1:] != rows[:-1], [True]])) \
+            if len(rows) else np.zeros(0, dtype=np.int64)
+        last_positions = np.full(len(values), 0, dtype=np.int64)
+        last_positions[rows[last]] = positions[last]
+        wrong_end = np.flatnonzero(last_positions != row_num_tokens)
+        bad = np.concatenate([invalid, not_increasing, wrong_end])
+        self.add('sentence_starts', bad,
+                 ["`sentence_starts` must be increasing and end at the number of tokens (%d): "
+                  "%r." % (row_num_tokens[i], values.iat[i]) for i in bad])
+
+    def run(self):
+        columns = self.frame.columns
+        if self.is_tokenized:
+            self.check_tokens()
+        else:
+            if 'answer_char_ranges' in columns:
+                self.check_answer_char_ranges()
+            if 'validated_answers' in columns:
+                self.check_validated_answers()
+        if 'answer_char_ranges' in columns and 'is_answer_absent' in columns:
+            self.check_is_answer_absent()
+        return self.get_issues()
+
+
+def _validate_shard(frame):
+    return _Checker(frame).run()
+
+
+def validate_dataset(dataset, workers=None, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Check the integrity of a dataset.
+
+    :param dataset: The dataset with the `story_text` column, e.g. `NewsQaDataset.dataset`.
+        It can be the combined data or the tokenized data.
+    :param workers: (Optional) The number of processes to check with.
+        Defaults to the number of CPUs.
+    :param shard_size: The number of rows that each process checks at once.
+    :return: The issues found.
+    :rtype: ValidationReport
+    """
+    if 'story_text' not in dataset.columns:
+        raise ValueError("The dataset does not have story texts.")
+    columns = [column for column in ['story_text', 'answer_char_ranges', 'validated_answers',
+                                     'is_answer_absent', 'answer_token_ranges',
+                                     'sentence_starts']
+               if column in dataset.columns]
+    workers = workers or multiprocessing.cpu_count()
+    with get_metrics().stage('validate', rows=len(dataset)):
+        shards = [dataset[columns].iloc[start:start + shard_size]
+                  for start in six.moves.range(0, len(dataset), shard_size)]
+        if workers <= 1 or len(shards) <= 1:
+            results = [_validate_shard(shard) for shard in shards]
+        else:
+            pool = multiprocessing.Pool(min(workers, len(shards)))
+            try:
+                results = pool.map(_validate_shard, shards, chunksize=1)
+            finally:
+                pool.terminate()
+                pool.join()
+    report = ValidationReport(len(dataset), (issue for issues in results for issue in issues))
+    logger.info("Validated %d rows: %d issues.", len(dataset), len(report))
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the integrity of a dataset.")
+    parser.add_argument('--dataset_path', default='combined-newsqa-data-v1.csv',
+                        help="The path to the combined or tokenized dataset.")
+    parser.add_argument('--report_path',
+                        help="(Optional) The path to write every issue to as JSON.")
+    parser.add_argument('--workers', type=int,
+                        help="(Optional) The number of processes to check with.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        from maluuba.newsqa.data_processing import NewsQaDataset
+    except:
+        from data_processing import NewsQaDataset
+    report = validate_dataset(NewsQaDataset.load_combined(args.dataset_path),
+                              workers=args.workers)
+    print(report.summary())
+    if args.report_path:
+        with io.open(args.report_path, 'w', encoding='utf-8') as f:
+            f.write(six.text_type(json.dumps(report.to_dict(), indent=2, ensure_ascii=False)))
+    sys.exit(0 if report.is_valid else 1)